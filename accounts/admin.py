@@ -1,17 +1,79 @@
 from django.contrib import admin
-from .models import Child, Comment, InstagramChild
+from . import search
+from .models import Child, Comment, CommenterStat, InstagramChild, CommentDailyStat, RetentionPolicy, WebhookEvent
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables that grow into the millions: no
+    full-table COUNT(*) per page view, estimated page counts, and related
+    objects joined in the page query instead of fetched per row.
+    """
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    list_per_page = 50
 
 
 @admin.register(Child)
-class ChildAdmin(admin.ModelAdmin):
+class ChildAdmin(LargeTableAdmin):
     list_display = ['id', 'username', 'instagram_user_id', 'parent', 'consent_given']
     search_fields = ('username', 'instagram_user_id', 'parent__username')
+    list_select_related = ('parent',)
+    # A search box instead of a dropdown of every user
+    autocomplete_fields = ('parent',)
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
-    list_display = ['id', 'post_id', 'username', 'sentiment', 'created_at']
+class CommentAdmin(LargeTableAdmin):
+    list_display = ['id', 'child', 'post_id', 'username', 'sentiment', 'created_at']
     search_fields = ('username', 'text')
+    search_help_text = "Full-text search over comment text and commenter; the last word may be a prefix"
+    # Both backed by indexes (comment_sentiment_idx, comment_created_idx)
     list_filter = ('sentiment', 'created_at')
+    list_select_related = ('child__parent',)
+    raw_id_fields = ('child',)
+    ordering = ('-id',)
+    # Sorting by anything else would sort the whole table
+    sortable_by = ('id', 'created_at')
+
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index instead of search_fields' LIKE '%term%' scans
+        if not search_term:
+            return queryset, False
+        return search.filter_queryset(queryset, search_term), False
+
+
+@admin.register(CommenterStat)
+class CommenterStatAdmin(LargeTableAdmin):
+    list_display = ['username', 'child', 'comment_count', 'toxic_count', 'last_seen']
+    search_fields = ('username', 'child__username')
+    list_select_related = ('child__parent',)
+    raw_id_fields = ('child',)
+    ordering = ('-toxic_count',)
+
+
+@admin.register(CommentDailyStat)
+class CommentDailyStatAdmin(LargeTableAdmin):
+    list_display = ['child', 'date', 'sentiment', 'count']
+    list_filter = ('sentiment',)
+    list_select_related = ('child__parent',)
+    raw_id_fields = ('child',)
+
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ['parent', 'raw_retention_days']
+    list_select_related = ('parent',)
+    autocomplete_fields = ('parent',)
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(LargeTableAdmin):
+    list_display = ['id', 'instagram_user_id', 'comment_id', 'received_at', 'processed_at', 'attempts']
+    search_fields = ('instagram_user_id', 'comment_id')
+    ordering = ('-id',)
+    sortable_by = ('id',)
+
 
 admin.site.register(InstagramChild)
\ No newline at end of file
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
 
 
+def start_workers():
+    """
+    Wake the 'thread' background workers so they pick up work left from
+    before a restart. The WSGI and ASGI entry points call this (runserver
+    loads the WSGI one); commands, tests and scripts that only set Django
+    up start no threads. The threads do the querying, so this doesn't
+    touch the database.
+    """
+    from . import purge, sentiment_lane, webhooks
+
+    purge.notify()
+    webhooks.notify()
+    sentiment_lane.notify()
+
+
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from . import checks  # noqa: F401 - registers the system checks
@@ -0,0 +1,158 @@
+"""
+Async versions of the comment fetch and read endpoints, for ASGI
+deployments. DRF views are sync-only, so these are plain Django async views
+that authenticate the JWT themselves and answer with the same payloads.
+While one request waits on the Graph API or the classifier, the worker
+keeps serving dashboard polls.
+"""
+import asyncio
+import functools
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import CachedJWTAuthentication
+from .cache import acached_response
+from .metrics import observe_timings
+from .models import Child, Comment
+from .renderers import dumps
+from .serialization import acomment_rows, streaming_comments_response
+from .services import afetch_comments_for_child
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+
+def jwt_required(view):
+    """
+    Authenticate the Bearer token like DRF's IsAuthenticated would. GET
+    polls use the cached-user authentication, like the sync read views.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        authentication = CachedJWTAuthentication if request.method in ('GET', 'HEAD') else JWTAuthentication
+        try:
+            result = await sync_to_async(authentication().authenticate)(request)
+        except (AuthenticationFailed, InvalidToken, TokenError) as e:
+            return json_response({'detail': str(e)}, status=401)
+        if result is None:
+            return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+        request.user = result[0]
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@require_GET
+@jwt_required
+async def get_child_comments(request, child_id):
+    """Async get_child_comments: same payload, cache and ETag."""
+    try:
+        child = await Child.objects.aget(id=child_id, parent=request.user)
+        comments = Comment.objects.filter(child=child).order_by('-created_at')
+
+        async def build(headers):
+            if await comments.acount() > getattr(settings, 'COMMENT_STREAM_THRESHOLD', 5000):
+                return streaming_comments_response(comments, headers=headers, use_async=True)
+            serialize_start = time.perf_counter()
+            comments_data = [row async for row in acomment_rows(comments)]
+            observe_timings('comments_api', {'query_serialize': time.perf_counter() - serialize_start})
+            return comments_data
+
+        return await acached_response(request, 'child-comments', [(child.id, child.data_version)], build)
+
+    except Child.DoesNotExist:
+        return json_response({'error': 'Child not found'}, status=404)
+    except Exception as e:
+        return json_response({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+async def fetch_child_comments(request, child_id):
+    """Async fetch_child_comments: the Graph call is awaited, not blocking a thread."""
+    try:
+        child = await Child.objects.select_related('parent').aget(id=child_id, parent=request.user)
+
+        result = await afetch_comments_for_child(child)
+
+        if "error" in result:
+            return json_response({'error': result['error']}, status=400)
+
+        comments = Comment.objects.filter(child=child).order_by('-created_at')
+        comments_data = [row async for row in acomment_rows(comments, id_field='id')]
+
+        return json_response({
+            'message': f'Comments fetched successfully. {result.get("new_comments", 0)} new comments added.',
+            'comments': comments_data
+        })
+
+    except Child.DoesNotExist:
+        return json_response({'error': 'Child not found'}, status=404)
+    except Exception as e:
+        return json_response({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+async def fetch_all_children_comments(request):
+    """
+    Async fetch_all_children_comments: children are fetched concurrently,
+    at most ASYNC_FETCH_CONCURRENCY at a time.
+    """
+    try:
+        children = [child async for child in Child.objects.filter(parent=request.user).select_related('parent')]
+
+        if not children:
+            return json_response({
+                'message': 'No children found for this parent',
+                'total_new_comments': 0,
+                'children_updated': 0
+            })
+
+        semaphore = asyncio.Semaphore(getattr(settings, 'ASYNC_FETCH_CONCURRENCY', 8))
+
+        async def fetch(child):
+            async with semaphore:
+                try:
+                    result = await afetch_comments_for_child(child, poll=True)
+                except Exception as e:
+                    result = {'error': str(e)}
+            if "error" in result:
+                return {
+                    'child_id': child.id,
+                    'username': child.username,
+                    'new_comments': 0,
+                    'status': 'error',
+                    'error': result['error']
+                }
+            return {
+                'child_id': child.id,
+                'username': child.username,
+                'new_comments': result.get("new_comments", 0),
+                'status': 'success'
+            }
+
+        results = await asyncio.gather(*(fetch(child) for child in children))
+
+        updated = [r for r in results if r['status'] == 'success']
+        total_new_comments = sum(r['new_comments'] for r in updated)
+
+        return json_response({
+            'message': f'Updated {len(updated)} children, {total_new_comments} new comments total',
+            'total_new_comments': total_new_comments,
+            'children_updated': len(updated),
+            'results': results
+        })
+
+    except Exception as e:
+        return json_response({'error': str(e)}, status=500)
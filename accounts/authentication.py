@@ -0,0 +1,117 @@
+"""
+JWT authentication for the read-only dashboard polling endpoints.
+
+JWTAuthentication loads the User row on every request, so a dashboard
+polling every few seconds costs an auth query per poll. CachedJWTAuthentication
+still verifies the token signature and expiry on every request. It then
+trusts the signed claims: the user id, and the is_active flag that
+refresh_token_for() adds to every token issued. Users come from a small
+in-process cache kept for AUTH_USER_CACHE_TTL seconds.
+
+The cached copy gets the same checks as a fresh one: it must be active,
+and its password must still match the token's revoke claim when
+CHECK_REVOKE_TOKEN is on. A deactivation or password change therefore
+takes effect within AUTH_USER_CACHE_TTL seconds everywhere. It takes
+effect at once in the process that saved it, because saving a user evicts
+its cache entry there.
+
+Endpoints opt in with authentication_classes; writes keep JWTAuthentication.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+ACTIVE_CLAIM = 'is_active'
+
+
+def refresh_token_for(user):
+    """RefreshToken.for_user() plus the is_active claim; access tokens made from it inherit the claim."""
+    token = RefreshToken.for_user(user)
+    token[ACTIVE_CLAIM] = user.is_active
+    return token
+
+
+class UserCache:
+    """Users by id for AUTH_USER_CACHE_TTL seconds, at most AUTH_USER_CACHE_SIZE of them."""
+
+    def __init__(self):
+        self._users = OrderedDict()  # user id -> (expires_at, user)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if time.monotonic() >= expires_at:
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            # A copy, so one request can't change another's request.user
+            return copy.copy(user)
+
+    def set(self, user_id, user):
+        ttl = getattr(settings, 'AUTH_USER_CACHE_TTL', 30)
+        with self._lock:
+            self._users[user_id] = (time.monotonic() + ttl, user)
+            self._users.move_to_end(user_id)
+            while len(self._users) > getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000):
+                self._users.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._users.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def _evict_saved_user(sender, instance, **kwargs):
+    user_cache.evict(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that serves users from user_cache; see the module docstring."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+        if validated_token.get(ACTIVE_CLAIM) is False:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        user = user_cache.get(user_id)
+        if user is None:
+            # Loads and checks the user the usual way
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
@@ -0,0 +1,286 @@
+"""
+Bulk backfill of historical comments, from the Graph API or a local NDJSON
+dump. Comments are classified in large batches and written with
+bulk_create, and progress is checkpointed to a JSON file so an interrupted
+run picks up where it stopped.
+"""
+import gzip
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import purge, reputation, retention
+from .coalescing import account_lock
+from .models import Child, Comment
+from .utils import classify_comments
+
+# Graph error codes that mean "slow down" rather than "broken request"
+RATE_LIMIT_CODES = {4, 17, 32, 613}
+
+
+class BackfillError(Exception):
+    pass
+
+
+class Checkpoint:
+    """
+    JSON checkpoint of finished media ids (Graph source) or lines already
+    consumed (NDJSON source).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path) if path else None
+        self.done_media = set()
+        self.lines = 0
+        if self.path and self.path.exists():
+            state = json.loads(self.path.read_text())
+            self.done_media = set(state.get('done_media', []))
+            self.lines = state.get('lines', 0)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'done_media': sorted(self.done_media), 'lines': self.lines}))
+        tmp.replace(self.path)
+
+
+class GraphClient:
+    """Paged Graph API reads with retry and backoff on rate limits and 5xx."""
+
+    def __init__(self, access_token, retries=5, backoff=1.0, timeout=30):
+        self.access_token = access_token
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def get(self, url, params=None):
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                if attempt < self.retries:
+                    time.sleep(self.backoff * (2 ** attempt))
+                    continue
+                raise BackfillError(f"Request failed: {e}")
+            if resp.status_code == 200:
+                return resp.json()
+            try:
+                code = resp.json().get('error', {}).get('code')
+            except ValueError:
+                code = None
+            if attempt < self.retries and (resp.status_code >= 500 or code in RATE_LIMIT_CODES):
+                time.sleep(self.backoff * (2 ** attempt))
+                continue
+            raise BackfillError(f"API Error {resp.status_code}: {resp.text[:200]}")
+
+    def iter_pages(self, url, params):
+        """Yield every item of a paged edge, following paging.next."""
+        params = dict(params, access_token=self.access_token)
+        while url:
+            page = self.get(url, params)
+            yield from page.get('data', [])
+            url = page.get('paging', {}).get('next')
+            params = None  # the next link already carries the query string
+
+
+def graph_media_ids(client, instagram_user_id):
+    url = f"{settings.GRAPH_API_URL}/v23.0/{instagram_user_id}/media"
+    return [media['id'] for media in client.iter_pages(url, {'fields': 'id,timestamp', 'limit': 100})]
+
+
+def graph_media_comments(client, media_id):
+    url = f"{settings.GRAPH_API_URL}/v23.0/{media_id}/comments"
+    return list(client.iter_pages(url, {'fields': 'id,text,username,timestamp', 'limit': 100}))
+
+
+class Backfill:
+    """
+    Buffers comments and writes them in batches: one dedup query, one
+    classify_comments call and one bulk_create per batch.
+    """
+
+    def __init__(self, child, batch_size=500, send_alerts=False, progress=None):
+        self.child = child
+        # History past the retention period is skipped, as in ingestion
+        self.cutoff = retention.child_cutoff(child)
+        self.batch_size = batch_size
+        self.send_alerts = send_alerts
+        self.progress = progress
+        self.buffer = []
+        self.stats = {'seen': 0, 'created': 0, 'skipped': 0, 'classify_s': 0.0, 'write_s': 0.0, 'fetch_s': 0.0}
+        self.started = time.perf_counter()
+
+    def add(self, post_id, comment):
+        self.stats['seen'] += 1
+        self.buffer.append((post_id, comment))
+
+    def full(self):
+        return len(self.buffer) >= self.batch_size
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+
+        new = self._new_comments(batch)
+        start = time.perf_counter()
+        scores = []
+        sentiments = classify_comments([comment.get('text', '') for _, comment in new], scores=scores)
+        self.stats['classify_s'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        created = self._write(list(zip(new, sentiments, scores)))
+        if created:
+            reputation.record(self.child, created)
+            Child.bump_versions([self.child.id])
+        self.stats['write_s'] += time.perf_counter() - start
+        self.stats['created'] += len(created)
+
+        if self.send_alerts:
+            from .email_service import send_toxic_comment_alert
+            for comment in created:
+                if comment.sentiment == 'toxic':
+                    send_toxic_comment_alert(comment, self.child, self.child.parent)
+
+        if self.progress:
+            self.progress(self.summary())
+
+    def _new_comments(self, batch):
+        """The batch's comments that aren't stored yet or past retention, deduplicated."""
+        ids = [comment['id'] for _, comment in batch]
+        existing = set(
+            Comment.objects.filter(child=self.child, comment_id__in=ids).values_list('comment_id', flat=True)
+        )
+        new = []
+        for post_id, comment in batch:
+            if comment['id'] not in existing and not retention.expired_on_arrival(comment, self.cutoff):
+                existing.add(comment['id'])
+                new.append((post_id, comment))
+        return new
+
+    def _write(self, rows):
+        """
+        Store ((post_id, comment), label, scores) rows under the account's
+        fetch lock, so a fetch or webhook can't store the same comments in
+        between, and with the child's row locked against a purge.
+        """
+        if not rows:
+            return []
+        with account_lock(f"ig:{self.child.instagram_user_id}") as acquired:
+            if not acquired:
+                raise BackfillError("Another fetch for this account is still running")
+            # Comments a fetch stored while this batch was classified
+            stored = set(
+                Comment.objects.filter(
+                    child=self.child, comment_id__in=[comment['id'] for (_, comment), _, _ in rows],
+                ).values_list('comment_id', flat=True)
+            )
+            now = timezone.now()
+            with transaction.atomic():
+                if not purge.lock_active(self.child):
+                    raise BackfillError("The child was deleted")
+                return Comment.objects.bulk_create([
+                    Comment(
+                        child=self.child,
+                        comment_id=comment['id'],
+                        post_id=post_id,
+                        text=comment.get('text', ''),
+                        username=comment.get('username', ''),
+                        sentiment=sentiment,
+                        toxicity_scores=comment_scores,
+                        # History keeps its own dates, for retention and the daily stats
+                        created_at=retention.posted_at(comment) or now,
+                    )
+                    for (post_id, comment), sentiment, comment_scores in rows
+                    if comment['id'] not in stored
+                ], batch_size=self.batch_size)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return dict(
+            self.stats,
+            elapsed_s=elapsed,
+            comments_per_sec=self.stats['seen'] / elapsed if elapsed else 0.0,
+        )
+
+
+def backfill_from_graph(backfill, checkpoint, concurrency=4):
+    """
+    Walk every media item of the child's account, fetching comment pages for
+    up to `concurrency` media at once. Media are checkpointed once their
+    comments are written.
+    """
+    child = backfill.child
+    if not child.instagram_user_id or not child.access_token:
+        raise BackfillError("Missing Instagram ID or access token")
+
+    client = GraphClient(child.access_token)
+    start = time.perf_counter()
+    media_ids = [m for m in graph_media_ids(client, child.instagram_user_id) if m not in checkpoint.done_media]
+    backfill.stats['fetch_s'] += time.perf_counter() - start
+
+    unflushed_media = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(graph_media_comments, client, media_id): media_id for media_id in media_ids}
+        for future in as_completed(futures):
+            media_id = futures[future]
+            for comment in future.result():
+                backfill.add(media_id, comment)
+            unflushed_media.append(media_id)
+            if backfill.full():
+                backfill.flush()
+                checkpoint.done_media.update(unflushed_media)
+                checkpoint.save()
+                unflushed_media = []
+    backfill.flush()
+    checkpoint.done_media.update(unflushed_media)
+    checkpoint.save()
+
+
+def backfill_from_ndjson(backfill, checkpoint, path):
+    """
+    Ingest a local dump with one comment per line: id (or comment_id),
+    post_id (or media_id), text, username and optionally timestamp (or
+    created_at). Gzip files are detected by suffix.
+    """
+    opener = gzip.open if str(path).endswith('.gz') else open
+    line_number = checkpoint.lines
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if line_number <= checkpoint.lines or not line.strip():
+                continue
+            record = json.loads(line)
+            comment_id = record.get('id') or record.get('comment_id')
+            if not comment_id:
+                # Rows without an id can't be deduplicated
+                backfill.stats['skipped'] += 1
+                continue
+            comment = {
+                'id': str(comment_id),
+                'text': record.get('text', ''),
+                'username': record.get('username', ''),
+                'timestamp': record.get('timestamp') or record.get('created_at'),
+            }
+            backfill.add(str(record.get('post_id') or record.get('media_id', '')), comment)
+            if backfill.full():
+                backfill.flush()
+                checkpoint.lines = line_number
+                checkpoint.save()
+        backfill.flush()
+        checkpoint.lines = max(checkpoint.lines, line_number)
+        checkpoint.save()
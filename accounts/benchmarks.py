@@ -0,0 +1,128 @@
+"""
+Helpers shared by the bench_* management commands: a synthetic corpus of
+Instagram-style comments, latency percentiles, peak RSS and JSON reports.
+"""
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+# Building blocks for the synthetic corpus. Kept in-tree so benchmarks
+# run the same way on every machine, with no network access.
+_SHORT = [
+    "love this 😍", "so cute!!", "omg 🔥🔥🔥", "slay queen 💅", "lowkey obsessed",
+    "ngl this is mid", "bruh 💀", "no cap best pic", "who asked", "ratio",
+    "fr fr", "ur so pretty", "this ain't it chief", "iconic", "lmaooo 😂😂",
+]
+_NEGATION = [
+    "not bad at all", "this is not good", "i don't hate it", "never seen anything so great",
+    "can't say i love it", "isn't awful tbh", "won't lie this is amazing", "no this is terrible",
+]
+_TOXIC = [
+    "you are so stupid lol", "nobody likes you, just leave", "ugly af 🤮", "kys loser",
+    "what an idiot", "delete your account trash", "you're pathetic", "shut up nobody cares",
+]
+_RANT_SENTENCES = [
+    "I honestly don't understand why people keep posting stuff like this",
+    "every single time I open the app it's the same thing over and over",
+    "like who even thinks this is okay to put online for everyone to see",
+    "and then the comments are full of people pretending it's amazing",
+    "I'm not even mad I'm just disappointed in the whole vibe here",
+    "anyway that's my two cents, do better next time 🙄",
+]
+_EMOJI = ["😂", "😍", "🔥", "💀", "🙄", "😭", "👏", "❤️", "🤡", "✨"]
+
+
+def synthetic_corpus(size=500, seed=1033):
+    """
+    Return `size` deterministic synthetic comments mixing emoji, slang,
+    negation, toxic phrases and long rants.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        kind = i % 10
+        if kind < 4:
+            text = rng.choice(_SHORT)
+        elif kind < 6:
+            text = rng.choice(_NEGATION)
+        elif kind < 8:
+            text = rng.choice(_TOXIC)
+        elif kind == 8:
+            text = ". ".join(rng.sample(_RANT_SENTENCES, rng.randint(3, len(_RANT_SENTENCES))))
+        else:
+            text = " ".join(rng.choice(_EMOJI) for _ in range(rng.randint(1, 6)))
+        if rng.random() < 0.3:
+            text += " " + rng.choice(_EMOJI)
+        corpus.append(text)
+    return corpus
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/mean of a list of durations, in milliseconds."""
+    return {
+        "p50_ms": percentile(seconds, 50) * 1000,
+        "p95_ms": percentile(seconds, 95) * 1000,
+        "p99_ms": percentile(seconds, 99) * 1000,
+        "mean_ms": (sum(seconds) / len(seconds) * 1000) if seconds else 0.0,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(name, results, params=None):
+    return {
+        "benchmark": name,
+        "git_revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params or {},
+        "results": results,
+    }
+
+
+def write_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def compare_reports(baseline, current):
+    """
+    Yield (metric, old, new, change_pct) for every numeric result present in
+    both reports, so regressions between commits are easy to spot.
+    """
+    old_results = baseline.get("results", {})
+    for metric, new in current.get("results", {}).items():
+        old = old_results.get(metric)
+        if isinstance(new, (int, float)) and isinstance(old, (int, float)):
+            change = ((new - old) / old * 100) if old else 0.0
+            yield metric, old, new, change
@@ -0,0 +1,94 @@
+"""
+Read-through cache for dashboard GET endpoints.
+
+Responses are cached under a key built from the parent, the query params and
+the data version of every child involved, so ingestion only has to bump
+Child.data_version to invalidate them. The same key doubles as the ETag, so
+an unchanged poll sending If-None-Match gets an empty 304.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.http.response import HttpResponseBase
+from rest_framework import status
+from rest_framework.response import Response
+
+from .renderers import dumps
+
+
+def response_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def cache_key(name, request, versions):
+    """
+    Key for one endpoint's response to this parent, with these query params,
+    at these (child_id, data_version) pairs.
+    """
+    query = getattr(request, 'query_params', request.GET)
+    params = sorted(query.lists())
+    raw = repr((name, request.user.pk, params, sorted(versions)))
+    return f"resp:{name}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def etag_headers(key):
+    return {'ETag': f'"{key.rsplit(":", 1)[-1]}"', 'Cache-Control': 'private, no-cache'}
+
+
+def etag_matches(request, headers):
+    if_none_match = request.headers.get('If-None-Match', '')
+    return headers['ETag'] in [tag.strip() for tag in if_none_match.split(',')]
+
+
+def not_modified(request, headers):
+    """304 response if the client's If-None-Match matches, else None."""
+    if etag_matches(request, headers):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+
+def cached_response(request, name, versions, build):
+    """
+    Return a 304 if the client already has this version, the cached data if
+    another poll built it, or call `build(headers)` for the data and cache it.
+    build() may instead return a finished HttpResponse (e.g. a streaming
+    one), which is passed through uncached.
+    """
+    key = cache_key(name, request, versions)
+    headers = etag_headers(key)
+
+    unchanged = not_modified(request, headers)
+    if unchanged:
+        return unchanged
+
+    cache = response_cache()
+    data = cache.get(key)
+    if data is None:
+        data = build(headers)
+        if isinstance(data, HttpResponseBase):
+            return data
+        cache.set(key, data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return Response(data, headers=headers)
+
+
+async def acached_response(request, name, versions, build):
+    """
+    cached_response() for the plain Django async views: `build` is a
+    coroutine function and the result is a JSON HttpResponse.
+    """
+    key = cache_key(name, request, versions)
+    headers = etag_headers(key)
+
+    if etag_matches(request, headers):
+        return HttpResponseNotModified(headers=headers)
+
+    cache = response_cache()
+    data = await cache.aget(key)
+    if data is None:
+        data = await build(headers)
+        if isinstance(data, HttpResponseBase):
+            return data
+        await cache.aset(key, data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return HttpResponse(dumps(data), content_type='application/json', headers=headers)
@@ -0,0 +1,42 @@
+"""
+System checks for database objects that Django's migration state doesn't
+track.
+
+On SQLite, any migration that rebuilds accounts_comment (an AlterField, for
+one) drops the FTS5 sync triggers that migration 0010 created. Search then
+quietly stops seeing new comments. The check runs with the database checks
+(`check --database default`, and before `migrate`), so a missing trigger is
+reported as a warning. It is not an error, so the migration that restores
+the triggers can still run.
+"""
+from django.core.checks import Tags, Warning, register
+from django.db import connections
+
+from .search import FTS_TABLE
+
+FTS_TRIGGERS = tuple(f"{FTS_TABLE}_{suffix}" for suffix in ('ai', 'ad', 'au'))
+
+
+@register(Tags.database)
+def check_search_triggers(app_configs=None, databases=None, **kwargs):
+    warnings = []
+    for alias in databases or ():
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT type, name FROM sqlite_master WHERE name LIKE %s", [f"{FTS_TABLE}%"])
+            objects = set(cursor.fetchall())
+        if ('table', FTS_TABLE) not in objects:
+            continue  # migration 0010 hasn't run yet
+        missing = [name for name in FTS_TRIGGERS if ('trigger', name) not in objects]
+        if missing:
+            warnings.append(Warning(
+                f"Full-text search triggers missing on database '{alias}': {', '.join(missing)}",
+                hint=(
+                    "A migration rebuilt accounts_comment. Recreate the triggers with a RunPython "
+                    "migration that runs 0010's SQLITE_SETUP, or search stops seeing new comments."
+                ),
+                id='accounts.W001',
+            ))
+    return warnings
@@ -0,0 +1,233 @@
+"""
+Single-flight Graph fetches per Instagram account.
+
+Two dashboard tabs, or several parents watching the same account, would
+otherwise run overlapping fetches that race on the dedup check. Callers
+take a per-account lock: the first one fetches, the others wait for it and
+share its result. The lock is a Postgres advisory lock on PostgreSQL and
+an AccountLock row elsewhere, so it holds across worker processes. A lock
+row expires after FETCH_LOCK_TIMEOUT unless its holder renews it between
+stages (renew_lock()), so one left by a dead worker is taken over. Within
+FETCH_MIN_INTERVAL seconds of a successful fetch the last result is
+reused without calling Graph. For the dashboard's background poll of
+accounts whose webhooks are being delivered (see accounts/webhooks.py)
+that window widens to WEBHOOK_RECONCILE_INTERVAL, so polling only
+reconciles what the webhooks might have missed; an explicit refresh of
+one child keeps the short window.
+
+Only callers that waited on a fetch share its counts of new comments and
+alerts. A reused result stored nothing for this caller, so it reports
+none.
+"""
+import asyncio
+import hashlib
+import time
+import logging
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .cache import response_cache
+from .models import AccountLock
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting caller retries the lock
+POLL_INTERVAL = 0.1
+
+# Key -> token of the lock rows this context holds, for renew_lock()
+_held = ContextVar('held_locks', default={})
+
+# Where coalesced() got a result: this caller's own fetch, the in-flight
+# fetch it waited on, or a recent one reused within the fetch interval
+FETCHED, SHARED, REUSED = 'fetched', 'shared', 'reused'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _lock_id(key):
+    """Signed 64-bit advisory lock id for a key."""
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big', signed=True)
+
+
+def try_lock(key, token):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [_lock_id(key)])
+            return cursor.fetchone()[0]
+    now = timezone.now()
+    # Expires after FETCH_LOCK_TIMEOUT in case the holder dies mid-fetch
+    AccountLock.objects.filter(key=key, expires_at__lt=now).delete()
+    try:
+        with transaction.atomic():
+            AccountLock.objects.create(key=key, token=token, expires_at=_expiry(now))
+    except IntegrityError:
+        return False
+    return True
+
+
+def _expiry(now):
+    return now + timedelta(seconds=_setting('FETCH_LOCK_TIMEOUT', 120))
+
+
+@contextmanager
+def _holding(key, token):
+    """Remember that this context holds `key`, so renew_lock() can find the token."""
+    reset = _held.set({**_held.get(), key: token})
+    try:
+        yield
+    finally:
+        _held.reset(reset)
+
+
+def renew_lock(key):
+    """
+    Push back the expiry of the lock row this context holds for `key`, so a
+    fetch that runs past FETCH_LOCK_TIMEOUT isn't taken over while it is
+    still writing. Holders call it between stages. Returns False if the lock
+    was already taken over; advisory locks don't expire and always renew.
+    """
+    token = _held.get().get(key)
+    if token is None or connection.vendor == 'postgresql':
+        return True
+    renewed = AccountLock.objects.filter(key=key, token=token).update(expires_at=_expiry(timezone.now()))
+    if not renewed:
+        logger.warning("Fetch lock %s expired while it was held", key)
+    return bool(renewed)
+
+
+def release_lock(key, token):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [_lock_id(key)])
+        return
+    # The token keeps a holder whose lock expired from releasing its successor's
+    AccountLock.objects.filter(key=key, token=token).delete()
+
+
+@contextmanager
+def account_lock(key, wait=None):
+    """Hold the lock for `key`, waiting up to `wait` seconds. Yields False on timeout."""
+    wait = _setting('FETCH_LOCK_WAIT', 60) if wait is None else wait
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    acquired = try_lock(key, token)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        acquired = try_lock(key, token)
+    if not acquired:
+        yield False
+        return
+    try:
+        with _holding(key, token):
+            yield True
+    finally:
+        release_lock(key, token)
+
+
+def last_fetch(key):
+    """(finished_at, result) of the last fetch of this account, or None."""
+    return response_cache().get(f"fetch:last:{key}")
+
+
+def remember_fetch(key, result):
+    timeout = max(_setting('FETCH_MIN_INTERVAL', 30), _setting('WEBHOOK_RECONCILE_INTERVAL', 900), 300)
+    response_cache().set(f"fetch:last:{key}", (time.time(), result), timeout)
+
+
+def remember_webhook(key):
+    """Note that a webhook delivered comments for this account just now."""
+    timeout = _setting('WEBHOOK_RECONCILE_INTERVAL', 900)
+    response_cache().set(f"webhook:last:{key}", time.time(), timeout)
+
+
+def fetch_interval(key, poll=False):
+    """
+    Seconds a successful fetch is reused: WEBHOOK_RECONCILE_INTERVAL for a
+    background `poll` while webhooks are arriving for the account,
+    otherwise FETCH_MIN_INTERVAL.
+    """
+    if poll and response_cache().get(f"webhook:last:{key}") is not None:
+        return max(_setting('FETCH_MIN_INTERVAL', 30), _setting('WEBHOOK_RECONCILE_INTERVAL', 900))
+    return _setting('FETCH_MIN_INTERVAL', 30)
+
+
+def recent_result(key, arrived, poll=False):
+    """
+    (result, SHARED or REUSED) to use instead of fetching: one that finished
+    after this caller arrived (it waited on that fetch), or a successful one
+    younger than fetch_interval(key, poll). None when the caller must fetch.
+    """
+    last = last_fetch(key)
+    if last is None:
+        return None
+    finished_at, result = last
+    if finished_at >= arrived:
+        return result, SHARED
+    if "error" not in result and time.time() - finished_at < fetch_interval(key, poll):
+        return result, REUSED
+    return None
+
+
+LOCK_TIMEOUT_RESULT = {"error": "Another fetch for this account is still running, try again shortly"}
+
+
+def coalesced(instagram_user_id, fetch, poll=False):
+    """
+    Run `fetch()` for this account unless a fetch is in flight or recent
+    (see fetch_interval() for `poll`). Returns (result, source) where source is FETCHED, SHARED or REUSED.
+    """
+    key = f"ig:{instagram_user_id}"
+    arrived = time.time()
+    recent = recent_result(key, arrived, poll)
+    if recent is not None:
+        return recent
+    with account_lock(key) as acquired:
+        if not acquired:
+            return LOCK_TIMEOUT_RESULT, FETCHED
+        # The fetch we waited on may have just finished
+        recent = recent_result(key, arrived, poll)
+        if recent is not None:
+            return recent
+        result = fetch()
+        remember_fetch(key, result)
+        return result, FETCHED
+
+
+async def acoalesced(instagram_user_id, fetch, poll=False):
+    """coalesced() for async callers: `fetch` is a coroutine function."""
+    key = f"ig:{instagram_user_id}"
+    arrived = time.time()
+    recent = await sync_to_async(recent_result)(key, arrived, poll)
+    if recent is not None:
+        return recent
+
+    # Lock calls stay on this request's sync thread, which owns the
+    # connection an advisory lock belongs to
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + _setting('FETCH_LOCK_WAIT', 60)
+    acquired = await sync_to_async(try_lock)(key, token)
+    while not acquired and time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        acquired = await sync_to_async(try_lock)(key, token)
+    if not acquired:
+        return LOCK_TIMEOUT_RESULT, FETCHED
+    try:
+        with _holding(key, token):
+            recent = await sync_to_async(recent_result)(key, arrived, poll)
+            if recent is not None:
+                return recent
+            result = await fetch()
+        await sync_to_async(remember_fetch)(key, result)
+        return result, FETCHED
+    finally:
+        await sync_to_async(release_lock)(key, token)
@@ -1,18 +1,50 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.contrib.auth.models import User
 from .models import Comment, Child
+from .metrics import observe_timings, count_alert
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-def send_toxic_comment_alert(comment: Comment, child: Child, parent: User):
+def flagged_categories(scores, threshold=0.5):
+    """toxic-bert categories scoring at least `threshold`, highest first."""
+    if not scores:
+        return []
+    flagged = [(name, score) for name, score in scores.items() if score >= threshold]
+    return sorted(flagged, key=lambda item: item[1], reverse=True)
+
+def send_toxic_comment_alert(comment: Comment, child: Child, parent: User, copies: int = 1):
     """
     Send email alert to parent when a toxic comment is detected for their child.
+    Threats get their own subject and also go to THREAT_ALERT_RECIPIENTS.
+    `copies` > 1 means the comment is one of a raid of near-identical copies,
+    which this single alert covers.
     """
+    from .utils import is_threat
+
     try:
-        subject = f"🚨 Toxic Comment Alert - {child.username}"
+        threat = is_threat(comment.toxicity_scores)
+        kind = "Threat" if threat else "Toxic Comment"
+        subject = f"🚨 {kind} Alert - {child.username}"
+        raid_note = raid_html = ""
+        if copies > 1:
+            subject += f" ({copies} similar comments)"
+            raid_note = (
+                f"This comment was posted {copies} times with small variations, "
+                "which usually means a coordinated raid. This is the only alert for them."
+            )
+            raid_html = f"<p><strong>{raid_note}</strong></p>"
+        categories = ", ".join(
+            f"{name.replace('_', ' ')} ({score:.0%})" for name, score in flagged_categories(comment.toxicity_scores)
+        )
+        recipients = [parent.email]
+        if threat:
+            recipients += [
+                email for email in getattr(settings, 'THREAT_ALERT_RECIPIENTS', []) if email not in recipients
+            ]
         
         # Create email context
         context = {
@@ -30,7 +62,7 @@ def send_toxic_comment_alert(comment: Comment, child: Child, parent: User):
         <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
             <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
                 <h2 style="color: #dc2626; border-bottom: 2px solid #dc2626; padding-bottom: 10px;">
-                    🚨 Toxic Comment Alert
+                    🚨 {kind} Alert
                 </h2>
                 
                 <p>Dear {context['parent_name']},</p>
@@ -41,10 +73,12 @@ def send_toxic_comment_alert(comment: Comment, child: Child, parent: User):
                     <h3 style="color: #dc2626; margin-top: 0;">Toxic Comment Details:</h3>
                     <p><strong>Comment by:</strong> @{context['comment_username']}</p>
                     <p><strong>Date:</strong> {context['comment_date']}</p>
+                    <p><strong>Detected:</strong> {categories or 'toxic'}</p>
                     <p><strong>Comment:</strong></p>
                     <div style="background-color: #ffffff; border: 1px solid #d1d5db; border-radius: 4px; padding: 10px; font-style: italic;">
                         "{context['comment_text']}"
                     </div>
+                    {raid_html}
                 </div>
                 
                 <div style="background-color: #f0f9ff; border: 1px solid #bae6fd; border-radius: 8px; padding: 15px; margin: 20px 0;">
@@ -77,7 +111,7 @@ def send_toxic_comment_alert(comment: Comment, child: Child, parent: User):
         
         # Create plain text version
         plain_message = f"""
-        TOXIC COMMENT ALERT
+        {kind.upper()} ALERT
         
         Dear {context['parent_name']},
         
@@ -86,7 +120,9 @@ def send_toxic_comment_alert(comment: Comment, child: Child, parent: User):
         Comment Details:
         - Comment by: @{context['comment_username']}
         - Date: {context['comment_date']}
+        - Detected: {categories or 'toxic'}
         - Comment: "{context['comment_text']}"
+        {raid_note}
         
         Recommended Actions:
         - Review the comment with your child
@@ -99,20 +135,25 @@ def send_toxic_comment_alert(comment: Comment, child: Child, parent: User):
         This is an automated alert from SentimentGuard.
         """
         
-        # Send email
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[parent.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        
-        logger.info(f"Toxic comment alert sent to {parent.email} for child {child.username}")
+        # One message per recipient, over one connection, so parents and the
+        # threat recipients never see each other's addresses
+        smtp_start = time.perf_counter()
+        messages = []
+        for recipient in recipients:
+            message = EmailMultiAlternatives(
+                subject=subject, body=plain_message, from_email=settings.DEFAULT_FROM_EMAIL, to=[recipient],
+            )
+            message.attach_alternative(html_message, "text/html")
+            messages.append(message)
+        get_connection(fail_silently=False).send_messages(messages)
+        observe_timings('alert', {'smtp': time.perf_counter() - smtp_start})
+        count_alert('sent')
+        
+        logger.info(f"{kind} alert sent to {', '.join(recipients)} for child {child.username}")
         return True
         
     except Exception as e:
+        count_alert('failed')
         logger.error(f"Failed to send toxic comment alert: {str(e)}")
         return False
 
@@ -126,10 +167,11 @@ def send_toxic_comment_summary(parent: User, toxic_comments: list):
             
         subject = f"🚨 Multiple Toxic Comments Detected - {len(toxic_comments)} alerts"
         
-        # Group comments by child
+        # Group comments by child, loading all children in one query
+        children = Child.objects.in_bulk({comment.child_id for comment in toxic_comments})
         comments_by_child = {}
         for comment in toxic_comments:
-            child_username = comment.child.username
+            child_username = children[comment.child_id].username
             if child_username not in comments_by_child:
                 comments_by_child[child_username] = []
             comments_by_child[child_username].append(comment)
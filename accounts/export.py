@@ -0,0 +1,146 @@
+"""
+Comment history export as gzip NDJSON, Arrow IPC stream or Parquet.
+
+Rows are read with .iterator(chunk_size=...) and written one chunk at a
+time, so memory use stays flat however large the table is. pyarrow is only
+needed for the Arrow and Parquet formats.
+"""
+import io
+import zlib
+
+from .models import Comment
+from .renderers import dumps
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+EXPORT_FORMATS = ('ndjson', 'arrow', 'parquet')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+FILE_EXTENSIONS = {'ndjson': 'ndjson.gz', 'arrow': 'arrow', 'parquet': 'parquet'}
+
+# Exported column -> Comment lookup
+EXPORT_COLUMNS = {
+    'child_id': 'child_id',
+    'child_username': 'child__username',
+    'parent_id': 'child__parent_id',
+    'comment_id': 'comment_id',
+    'post_id': 'post_id',
+    'username': 'username',
+    'text': 'text',
+    'sentiment': 'sentiment',
+    'sentiment_pending': 'sentiment_pending',
+    'toxicity_scores': 'toxicity_scores',
+    'created_at': 'created_at',
+}
+
+
+class ExportUnavailable(Exception):
+    """The requested format needs an optional dependency that isn't installed."""
+
+
+def export_queryset(parent=None):
+    """Comments of one parent's children, or every comment if parent is None."""
+    comments = Comment.objects.filter(child__deleted_at__isnull=True)
+    if parent is not None:
+        comments = comments.filter(child__parent=parent)
+    return comments.order_by('id')
+
+
+def iter_rows(queryset, chunk_size=5000):
+    names = list(EXPORT_COLUMNS)
+    for values in queryset.values_list(*EXPORT_COLUMNS.values()).iterator(chunk_size=chunk_size):
+        yield dict(zip(names, values))
+
+
+def iter_chunks(queryset, chunk_size=5000):
+    """Yield lists of up to `chunk_size` export rows."""
+    chunk = []
+    for row in iter_rows(queryset, chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_ndjson_gz(queryset, chunk_size=5000):
+    """Yield gzip-compressed NDJSON bytes, one chunk of rows at a time."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in iter_chunks(queryset, chunk_size):
+        data = compressor.compress(b''.join(dumps(row) + b'\n' for row in chunk))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ExportUnavailable("pyarrow is required for Arrow and Parquet exports")
+
+
+def _schema():
+    return pyarrow.schema([
+        ('child_id', pyarrow.int64()),
+        ('child_username', pyarrow.string()),
+        ('parent_id', pyarrow.int64()),
+        ('comment_id', pyarrow.string()),
+        ('post_id', pyarrow.string()),
+        ('username', pyarrow.string()),
+        ('text', pyarrow.string()),
+        ('sentiment', pyarrow.string()),
+        ('sentiment_pending', pyarrow.bool_()),
+        # Label -> score, null when the comment wasn't flagged
+        ('toxicity_scores', pyarrow.map_(pyarrow.string(), pyarrow.float64())),
+        ('created_at', pyarrow.timestamp('us', tz='UTC')),
+    ])
+
+
+def _record_batch(chunk, schema):
+    return pyarrow.RecordBatch.from_pylist(chunk, schema=schema)
+
+
+def iter_arrow_stream(queryset, chunk_size=5000):
+    """Yield an Arrow IPC stream, one record batch per chunk of rows."""
+    _require_pyarrow()  # raise now, not on first iteration
+    return _arrow_stream(queryset, chunk_size)
+
+
+def _arrow_stream(queryset, chunk_size):
+    schema = _schema()
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for chunk in iter_chunks(queryset, chunk_size):
+            writer.write_batch(_record_batch(chunk, schema))
+            yield _drain(sink)
+    yield _drain(sink)
+
+
+def write_parquet(queryset, destination, chunk_size=5000):
+    """
+    Write a Parquet file to a path or binary file object, one row group per
+    chunk. Returns the number of rows written.
+    """
+    _require_pyarrow()
+    schema = _schema()
+    rows = 0
+    with pyarrow.parquet.ParquetWriter(destination, schema, compression='zstd') as writer:
+        for chunk in iter_chunks(queryset, chunk_size):
+            writer.write_batch(_record_batch(chunk, schema))
+            rows += len(chunk)
+    return rows
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
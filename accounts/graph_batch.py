@@ -0,0 +1,73 @@
+"""
+Graph API batch requests.
+
+Graph takes up to 50 sub-requests in one POST to its root endpoint and
+answers with each one's status and body. Fetching the comments of N media
+items then takes ceil(N / 50) round trips instead of N. Sub-requests that
+Graph didn't get to in time come back as null and are retried once in a
+follow-up batch.
+"""
+import json
+
+import requests
+from django.conf import settings
+
+# Graph's limit on sub-requests per batch
+MAX_BATCH_SIZE = 50
+
+_TIMED_OUT = json.dumps({"error": {"message": "Batch sub-request timed out", "code": -1}})
+
+
+class BatchResponse:
+    """One sub-request's result, with the parts of requests.Response callers use."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def batch_size():
+    return max(1, min(getattr(settings, 'GRAPH_BATCH_SIZE', MAX_BATCH_SIZE), MAX_BATCH_SIZE))
+
+
+def batch_get(relative_urls, access_token, session=None, stats=None, timeout=30):
+    """
+    GET every relative URL ("v17.0/{media_id}/comments?fields=...") through
+    batch requests and return their responses in order. If `stats` is a
+    dict, 'round_trips' counts the POSTs made.
+    """
+    responses = _post_batches(relative_urls, access_token, session, stats, timeout)
+    retry = [i for i, response in enumerate(responses) if response is None]
+    if retry:
+        for i, response in zip(retry, _post_batches([relative_urls[i] for i in retry], access_token, session, stats, timeout)):
+            responses[i] = response
+    return [response or BatchResponse(504, _TIMED_OUT) for response in responses]
+
+
+def _post_batches(relative_urls, access_token, session, stats, timeout):
+    http = session or requests
+    size = batch_size()
+    responses = []
+    for start in range(0, len(relative_urls), size):
+        chunk = relative_urls[start:start + size]
+        resp = http.post(
+            f"{settings.GRAPH_API_URL}/",
+            data={
+                "access_token": access_token,
+                "include_headers": "false",
+                "batch": json.dumps([{"method": "GET", "relative_url": url} for url in chunk]),
+            },
+            timeout=timeout,
+        )
+        if stats is not None:
+            stats['round_trips'] = stats.get('round_trips', 0) + 1
+        if resp.status_code != 200:
+            # The whole batch was refused (bad token, rate limit): every sub-request shares the error
+            responses.extend(BatchResponse(resp.status_code, resp.text) for _ in chunk)
+            continue
+        for item in resp.json():
+            responses.append(None if item is None else BatchResponse(item.get("code", 500), item.get("body") or ""))
+    return responses
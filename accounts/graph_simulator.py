@@ -0,0 +1,247 @@
+"""
+Local Instagram Graph API simulator for load testing the ingestion paths.
+
+Serves the subset of the Graph API the app uses (`/{ig_user_id}/media` with a
+nested `comments` edge, `/{media_id}/comments` and `/me`, directly or as
+batch requests) from generated data, with cursor paging and configurable
+latency, error and rate-limit profiles.
+Point `settings.GRAPH_API_URL` at `GraphSimulator.url` to use it.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlparse, parse_qs
+
+from .benchmarks import synthetic_corpus
+from .graph_batch import MAX_BATCH_SIZE
+
+DEFAULT_PAGE_SIZE = 25
+
+
+class GraphSimulator:
+    """
+    Generates `accounts` accounts with `media_per_account` media items and
+    `comments_per_media` comments each, and serves them over HTTP.
+
+    latency: seconds added to every response (plus up to `jitter` seconds).
+    error_rate: fraction of requests answered with a Graph 500 error.
+    rate_limit: max requests per `rate_window` seconds before Graph error #4.
+    """
+
+    def __init__(self, accounts=5, media_per_account=10, comments_per_media=20,
+                 latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None,
+                 rate_window=1.0, seed=1033, host='127.0.0.1', port=0):
+        self.accounts = accounts
+        self.media_per_account = media_per_account
+        self.comments_per_media = comments_per_media
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.host = host
+        self.port = port
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._server = None
+        self._thread = None
+
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "batched_requests": 0}
+
+        texts = synthetic_corpus(accounts * media_per_account * comments_per_media, seed=seed)
+        self.account_ids = [f"1784100000{i:07d}" for i in range(accounts)]
+        self.media = {}      # account id -> [media id]
+        self.comments = {}   # media id -> [comment dict]
+        n = 0
+        for account_id in self.account_ids:
+            self.media[account_id] = []
+            for m in range(media_per_account):
+                media_id = f"{account_id}{m:04d}"
+                self.media[account_id].append(media_id)
+                self.comments[media_id] = []
+                for c in range(comments_per_media):
+                    self.comments[media_id].append({
+                        "id": f"{media_id}{c:05d}",
+                        "text": texts[n],
+                        "username": f"commenter_{self._rng.randint(0, 999)}",
+                        "timestamp": "2025-10-01T12:00:00+0000",
+                    })
+                    n += 1
+
+    @property
+    def total_comments(self):
+        return self.accounts * self.media_per_account * self.comments_per_media
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        simulator = self
+
+        class Handler(_GraphHandler):
+            pass
+        Handler.simulator = simulator
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _admit(self):
+        """
+        Apply the error and rate-limit profiles to one request.
+        Returns (status, error_body) or None if the request should succeed.
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                if now - self._window_start >= self.rate_window:
+                    self._window_start = now
+                    self._window_count = 0
+                self._window_count += 1
+                if self._window_count > self.rate_limit:
+                    self.stats["rate_limited"] += 1
+                    return 400, _graph_error(4, "(#4) Application request limit reached")
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500, _graph_error(2, "An unexpected error has occurred. Please retry your request later.")
+        return None
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                extra = self._rng.random() * self.jitter
+            time.sleep(self.latency + extra)
+
+
+def _graph_error(code, message):
+    return {"error": {"message": message, "type": "OAuthException", "code": code}}
+
+
+def _page(items, params, base_url):
+    """
+    Slice `items` with Graph-style `limit`/`after` cursors and add paging links.
+    """
+    limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+    offset = int(params.get("after", 0) or 0)
+    chunk = items[offset:offset + limit]
+    page = {"data": chunk}
+    if chunk:
+        page["paging"] = {"cursors": {"before": str(offset), "after": str(offset + len(chunk))}}
+        if offset + limit < len(items):
+            next_params = dict(params, after=str(offset + limit), limit=str(limit))
+            page["paging"]["next"] = f"{base_url}?{urlencode(next_params)}"
+    return page
+
+
+class _GraphHandler(BaseHTTPRequestHandler):
+    simulator = None
+
+    def log_message(self, format, *args):
+        # Keep load test output readable
+        pass
+
+    def do_GET(self):
+        sim = self.simulator
+        sim._delay()
+        rejected = sim._admit()
+        if rejected:
+            return self._send(*rejected)
+        return self._send(*self._get(self.path))
+
+    def do_POST(self):
+        """Batch requests: a form-encoded `batch` of GET sub-requests, one latency for all."""
+        sim = self.simulator
+        length = int(self.headers.get("Content-Length", 0))
+        form = {k: v[-1] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        if [p for p in urlparse(self.path).path.split("/") if p and not p.startswith("v")] or "batch" not in form:
+            return self._send(400, _graph_error(100, "Unsupported post request."))
+        try:
+            batch = json.loads(form["batch"])
+        except ValueError:
+            return self._send(400, _graph_error(100, "Invalid batch parameter."))
+        if len(batch) > MAX_BATCH_SIZE:
+            return self._send(400, _graph_error(1, f"Too many requests in batch message. Maximum batch size is {MAX_BATCH_SIZE}"))
+
+        sim._delay()
+        rejected = sim._admit()
+        if rejected:
+            return self._send(*rejected)
+        with sim._lock:
+            sim.stats["batched_requests"] += len(batch)
+
+        results = []
+        for sub in batch:
+            url = "/" + sub.get("relative_url", "").lstrip("/")
+            if "access_token=" not in url and form.get("access_token"):
+                url += ("&" if "?" in url else "?") + urlencode({"access_token": form["access_token"]})
+            status, body = self._get(url)
+            results.append({"code": status, "body": json.dumps(body)})
+        return self._send(200, results)
+
+    def _get(self, path):
+        """(status, body) of one GET request."""
+        sim = self.simulator
+        parsed = urlparse(path)
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        # Path looks like /v23.0/<id>/<edge>; the version is ignored
+        parts = [p for p in parsed.path.split("/") if p]
+        if parts and parts[0].startswith("v"):
+            parts = parts[1:]
+
+        if params.get("access_token") in (None, "", "invalid"):
+            return 400, _graph_error(190, "Invalid OAuth access token.")
+
+        base_url = f"{sim.url}{parsed.path}"
+        if parts == ["me"]:
+            return 200, {"id": sim.account_ids[0] if sim.account_ids else "0"}
+
+        if len(parts) == 2 and parts[1] == "media" and parts[0] in sim.media:
+            media_ids = sim.media[parts[0]]
+            page = _page(media_ids, params, base_url)
+            nested = "comments" in params.get("fields", "")
+            page["data"] = [self._media(media_id, nested, params["access_token"]) for media_id in page["data"]]
+            return 200, page
+
+        if len(parts) == 2 and parts[1] == "comments" and parts[0] in sim.comments:
+            return 200, _page(sim.comments[parts[0]], params, base_url)
+
+        return 404, _graph_error(100, "Unsupported get request.")
+
+    def _media(self, media_id, nested, access_token):
+        media = {"id": media_id, "caption": f"post {media_id}", "timestamp": "2025-10-01T12:00:00+0000"}
+        if nested:
+            comments_url = f"{self.simulator.url}/v23.0/{media_id}/comments"
+            edge = _page(self.simulator.comments[media_id], {"access_token": access_token}, comments_url)
+            if edge["data"]:
+                media["comments"] = edge
+        return media
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
@@ -0,0 +1,58 @@
+from django.core.management.base import CommandError
+from accounts.backfill import Backfill, BackfillError, Checkpoint, backfill_from_graph, backfill_from_ndjson
+from accounts.models import Child
+from accounts.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = "Backfill a child's full comment history from the Graph API or a local NDJSON dump"
+
+    def add_arguments(self, parser):
+        parser.add_argument('child_id', type=int, help='Child to backfill')
+        parser.add_argument('--ndjson', type=str, default=None, help='Ingest this NDJSON (or .gz) dump instead of the Graph API')
+        parser.add_argument('--batch-size', type=int, default=500, help='Comments classified and written per batch')
+        parser.add_argument('--concurrency', type=int, default=4, help='Media fetched from the Graph API at once')
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            default=None,
+            help='Checkpoint file (default: backfill-<child_id>.json); rerun with it to resume'
+        )
+        parser.add_argument('--send-alerts', action='store_true', help='Email alerts for historical toxic comments')
+
+    def handle(self, *args, **options):
+        try:
+            child = Child.objects.select_related('parent').get(id=options['child_id'])
+        except Child.DoesNotExist:
+            raise CommandError(f"Child with ID {options['child_id']} not found")
+
+        checkpoint = Checkpoint(options['checkpoint'] or f"backfill-{child.id}.json")
+        if checkpoint.done_media or checkpoint.lines:
+            self.stdout.write(
+                f"Resuming from {checkpoint.path}: {len(checkpoint.done_media)} media, {checkpoint.lines} lines done"
+            )
+
+        backfill = Backfill(
+            child,
+            batch_size=options['batch_size'],
+            send_alerts=options['send_alerts'],
+            progress=lambda s: self.stdout.write(
+                f"{s['seen']} seen, {s['created']} new, {s['comments_per_sec']:.0f} comments/s"
+            ),
+        )
+        try:
+            if options['ndjson']:
+                backfill_from_ndjson(backfill, checkpoint, options['ndjson'])
+            else:
+                backfill_from_graph(backfill, checkpoint, concurrency=options['concurrency'])
+        except BackfillError as e:
+            raise CommandError(f"Backfill stopped (resume with the same checkpoint): {e}")
+
+        summary = backfill.summary()
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {summary['created']} new comments ({summary['seen']} seen, "
+            f"{summary['skipped']} without an id) for {child.username} "
+            f"in {summary['elapsed_s']:.1f}s: {summary['comments_per_sec']:.0f} comments/s, "
+            f"classify {summary['classify_s']:.1f}s, write {summary['write_s']:.1f}s, "
+            f"media listing {summary['fetch_s']:.1f}s"
+        ))
@@ -0,0 +1,89 @@
+import time
+from urllib.parse import quote
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from accounts.benchmarks import synthetic_corpus, build_report, write_report
+from accounts.models import Child, Comment
+from accounts.profiling import ProfiledCommand
+
+PAGES = [
+    ('comments', 'admin:accounts_comment_changelist', ''),
+    ('comments_page_5', 'admin:accounts_comment_changelist', '?p=5'),
+    ('comments_toxic', 'admin:accounts_comment_changelist', '?sentiment__exact=toxic'),
+    ('comments_past_7_days', 'admin:accounts_comment_changelist', '?created_at__gte={week_ago}'),
+    ('comments_search', 'admin:accounts_comment_changelist', '?q=ugly'),
+    ('children', 'admin:accounts_child_changelist', ''),
+    ('commenters', 'admin:accounts_commenterstat_changelist', ''),
+    ('comment_change', 'admin:accounts_comment_change', None),
+    ('child_change', 'admin:accounts_child_change', None),
+]
+
+
+class Command(ProfiledCommand):
+    help = (
+        "Render the admin changelists and check each page runs a bounded number of queries "
+        "(optionally after seeding a large comment table)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=0, help='Synthetic comments to seed first (removed afterwards)')
+        parser.add_argument('--max-queries', type=int, default=12, help='Fail if a page runs more queries than this')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        suffix = int(time.time())
+        admin_user = User.objects.create_superuser(username=f"adminbench_{suffix}", password=None)
+        parent = User.objects.create_user(username=f"adminbench_parent_{suffix}")
+        try:
+            child = Child.objects.create(parent=parent, username="adminbench_child")
+            texts = synthetic_corpus(500)
+            for offset in range(0, options['comments'], 5000):
+                Comment.objects.bulk_create([
+                    Comment(child=child, comment_id=f"adminbench_{i}", post_id="adminbench_post",
+                            username=f"user_{i % 3000}", text=texts[i % len(texts)],
+                            sentiment=('toxic', 'neutral', 'positive', 'negative')[i % 4])
+                    for i in range(offset, min(offset + 5000, options['comments']))
+                ])
+            comment = Comment.objects.order_by('-id').first()
+
+            client = Client()
+            client.force_login(admin_user)
+            week_ago = quote(time.strftime('%Y-%m-%d 00:00:00+00:00', time.gmtime(time.time() - 7 * 86400)))
+            results = {}
+            failures = []
+            with override_settings(DEBUG=False):
+                for name, url_name, query in PAGES:
+                    if query is None:
+                        target = comment if url_name.endswith('comment_change') else child
+                        if target is None:
+                            continue
+                        url = reverse(url_name, args=[target.pk])
+                    else:
+                        url = reverse(url_name) + query.format(week_ago=week_ago)
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        response = client.get(url)
+                        elapsed = time.perf_counter() - start
+                    if response.status_code != 200:
+                        raise CommandError(f"{url} returned {response.status_code}")
+                    results[f"{name}_queries"] = len(queries)
+                    results[f"{name}_ms"] = elapsed * 1000
+                    self.stdout.write(f"{name}: {len(queries)} queries, {elapsed * 1000:.1f} ms")
+                    if len(queries) > options['max_queries']:
+                        failures.append(f"{name} ran {len(queries)} queries")
+
+            if options['output']:
+                report = build_report("admin", results, params={
+                    'comments': Comment.objects.count(), 'max_queries': options['max_queries'],
+                })
+                write_report(report, options['output'])
+            if failures:
+                raise CommandError("Unbounded admin pages: " + "; ".join(failures))
+            self.stdout.write(self.style.SUCCESS(f"Every page ran at most {options['max_queries']} queries"))
+        finally:
+            parent.delete()
+            admin_user.delete()
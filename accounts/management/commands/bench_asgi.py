@@ -0,0 +1,158 @@
+import asyncio
+import time
+from asgiref.sync import ThreadSensitiveContext
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.benchmarks import build_report, write_report, latency_summary
+from accounts.cache import response_cache
+from accounts.graph_simulator import GraphSimulator
+from accounts.models import Child, Comment
+from accounts.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = (
+        "Compare the WSGI deployment (sync views on a fixed thread pool) with the ASGI one "
+        "(async views on one event loop) while Graph API fetches are in flight"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=8, help='Children, each fetched once')
+        parser.add_argument('--media', type=int, default=5, help='Media items per account')
+        parser.add_argument('--comments', type=int, default=10, help='Comments per media item')
+        parser.add_argument('--latency', type=float, default=1.0, help='Seconds of latency per Graph request')
+        parser.add_argument('--polls', type=int, default=100, help='Dashboard comment reads issued during the fetches')
+        parser.add_argument('--threads', type=int, default=4, help='Request threads of the WSGI worker')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        simulator = GraphSimulator(
+            accounts=options['accounts'],
+            media_per_account=options['media'],
+            comments_per_media=options['comments'],
+            latency=options['latency'],
+        )
+        results = {}
+        with simulator, override_settings(
+            GRAPH_API_URL=simulator.url,
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            FETCH_MIN_INTERVAL=0,  # every run must really fetch
+        ):
+            parent = User.objects.create_user(
+                username=f"asgibench_parent_{int(time.time())}",
+                email="asgibench@example.com",
+            )
+            try:
+                children = [
+                    Child.objects.create(
+                        parent=parent,
+                        username=f"asgibench_child_{i}",
+                        instagram_user_id=account_id,
+                        access_token="asgibench",
+                    )
+                    for i, account_id in enumerate(simulator.account_ids)
+                ]
+                token = str(RefreshToken.for_user(parent).access_token)
+                for mode in ('wsgi', 'asgi'):
+                    run = getattr(self, f"run_{mode}")
+                    # Warm up (imports, first connections), then start both
+                    # modes from an empty comment table and a cold cache
+                    run(children, token, dict(options, polls=len(children)))
+                    Comment.objects.filter(child__in=children).delete()
+                    response_cache().clear()
+                    start = time.perf_counter()
+                    samples = run(children, token, options)
+                    elapsed = time.perf_counter() - start
+                    metrics = self.summarize(samples, elapsed)
+                    metrics['comments_ingested'] = Comment.objects.filter(child__in=children).count()
+                    for metric, value in metrics.items():
+                        results[f"{mode}_{metric}"] = value
+                    self.report(mode, metrics)
+            finally:
+                parent.delete()
+
+        if results['asgi_poll_p95_ms']:
+            results['poll_p95_speedup'] = results['wsgi_poll_p95_ms'] / results['asgi_poll_p95_ms']
+            self.stdout.write(self.style.SUCCESS(
+                f"\nASGI poll p95 is {results['poll_p95_speedup']:.1f}x lower than WSGI"
+            ))
+
+        if options['output']:
+            report = build_report("asgi", results, params={
+                key: options[key] for key in ('accounts', 'media', 'comments', 'latency', 'polls', 'threads')
+            })
+            write_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def workload(self, children, polls, prefix=''):
+        """One fetch per child, then `polls` dashboard reads spread over the children."""
+        jobs = [('fetch', reverse(f'{prefix}fetch-child-comments', args=[child.id])) for child in children]
+        jobs += [
+            ('poll', reverse(f'{prefix}get-child-comments', args=[children[n % len(children)].id]))
+            for n in range(polls)
+        ]
+        return jobs
+
+    # Latencies are measured from when the whole workload is submitted, so
+    # time spent queued behind busy worker threads counts.
+
+    def run_wsgi(self, children, token, options):
+        start = time.perf_counter()
+
+        def request(job):
+            kind, url = job
+            client = Client(headers={'Authorization': f'Bearer {token}'})
+            try:
+                response = client.post(url) if kind == 'fetch' else client.get(url)
+            finally:
+                connections.close_all()
+            return kind, time.perf_counter() - start, response.status_code
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            return list(pool.map(request, self.workload(children, options['polls'])))
+
+    def run_asgi(self, children, token, options):
+        start = time.perf_counter()
+
+        async def request(client, job):
+            kind, url = job
+            headers = {'Authorization': f'Bearer {token}'}
+            # ASGIHandler gives every request its own sync thread; the test
+            # client doesn't, so do it here as a real server would
+            async with ThreadSensitiveContext():
+                if kind == 'fetch':
+                    response = await client.post(url, headers=headers)
+                else:
+                    response = await client.get(url, headers=headers)
+            return kind, time.perf_counter() - start, response.status_code
+
+        async def run():
+            client = AsyncClient()
+            jobs = self.workload(children, options['polls'], prefix='async-')
+            return await asyncio.gather(*(request(client, job) for job in jobs))
+
+        return asyncio.run(run())
+
+    def summarize(self, samples, elapsed):
+        metrics = {
+            'elapsed_s': elapsed,
+            'requests': len(samples),
+            'errors': sum(1 for _, _, status in samples if status >= 400),
+        }
+        for kind in ('fetch', 'poll'):
+            latencies = [seconds for k, seconds, _ in samples if k == kind]
+            metrics.update({f"{kind}_{k}": v for k, v in latency_summary(latencies).items()})
+        return metrics
+
+    def report(self, mode, metrics):
+        self.stdout.write(f"\n[{mode}]")
+        for metric, value in metrics.items():
+            if isinstance(value, float):
+                self.stdout.write(f"  {metric}: {value:.4f}")
+            else:
+                self.stdout.write(f"  {metric}: {value}")
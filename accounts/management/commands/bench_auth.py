@@ -0,0 +1,88 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from accounts.authentication import CachedJWTAuthentication, refresh_token_for, user_cache
+from accounts.benchmarks import build_report, write_report, latency_summary
+from accounts.models import Child
+from accounts.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = "Measure auth queries and latency per dashboard poll, with and without the cached-user JWT authentication"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Polls per authentication class')
+        parser.add_argument('--ttl', type=float, default=2.0, help='AUTH_USER_CACHE_TTL for the revocation check')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f"authbench_{int(time.time())}")
+        try:
+            Child.objects.create(parent=user, username="authbench_child")
+            access = str(refresh_token_for(user).access_token)
+            request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {access}")
+
+            results = {}
+            for name, authentication in (('jwt', JWTAuthentication()), ('cached', CachedJWTAuthentication())):
+                user_cache.clear()
+                latencies = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(options['requests']):
+                        start = time.perf_counter()
+                        authentication.authenticate(request)
+                        latencies.append(time.perf_counter() - start)
+                summary = latency_summary(latencies)
+                results[f"{name}_queries_per_request"] = len(queries) / options['requests']
+                results.update({f"{name}_{k}": v for k, v in summary.items()})
+                self.stdout.write(
+                    f"{name}: {results[f'{name}_queries_per_request']:.3f} auth queries/request, "
+                    f"p50 {summary['p50_ms']:.3f} ms, p95 {summary['p95_ms']:.3f} ms"
+                )
+            results['queries_saved_per_request'] = (
+                results['jwt_queries_per_request'] - results['cached_queries_per_request']
+            )
+
+            # A whole dashboard poll of the children list, once the user is cached
+            client = APIClient(HTTP_HOST='localhost')
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+            client.get('/api/accounts/children/')
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get('/api/accounts/children/')
+            if response.status_code != 200:
+                raise CommandError(f"Children list returned {response.status_code}")
+            results['children_poll_queries'] = len(queries)
+            self.stdout.write(f"children list poll: {len(queries)} queries in total")
+
+            # Deactivate the user behind the cache's back (as another process
+            # would) and time how long the cached copy is still accepted
+            with override_settings(AUTH_USER_CACHE_TTL=options['ttl']):
+                user_cache.clear()
+                authentication = CachedJWTAuthentication()
+                authentication.authenticate(request)
+                User.objects.filter(pk=user.pk).update(is_active=False)
+                start = time.monotonic()
+                while True:
+                    try:
+                        authentication.authenticate(request)
+                    except AuthenticationFailed:
+                        break
+                    if time.monotonic() - start > options['ttl'] * 2 + 1:
+                        raise CommandError("Deactivated user was still accepted after twice the cache TTL")
+                    time.sleep(0.05)
+                results['revocation_s'] = time.monotonic() - start
+            self.stdout.write(self.style.SUCCESS(
+                f"Saved {results['queries_saved_per_request']:.2f} queries per request; deactivation honored "
+                f"after {results['revocation_s']:.2f}s (TTL {options['ttl']}s)"
+            ))
+
+            if options['output']:
+                report = build_report("auth", results, params={'requests': options['requests'], 'ttl': options['ttl']})
+                write_report(report, options['output'])
+        finally:
+            user_cache.clear()
+            user.delete()
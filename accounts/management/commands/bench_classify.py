@@ -0,0 +1,91 @@
+import json
+import os
+import time
+from accounts import utils
+from accounts.profiling import ProfiledCommand
+from accounts.benchmarks import (
+    synthetic_corpus, latency_summary, peak_rss_mb, build_report, write_report, compare_reports
+)
+
+
+class Command(ProfiledCommand):
+    help = "Benchmark comment classification over a synthetic corpus and write a JSON report"
+    # handle() loads the models itself, to time the load with the hub off
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=500, help='Number of synthetic comments')
+        parser.add_argument('--seed', type=int, default=1033, help='Corpus seed')
+        parser.add_argument('--max-length', type=int, default=None, help='Token truncation length')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+        parser.add_argument('--compare', type=str, default=None, help='Baseline JSON report to compare against')
+        parser.add_argument(
+            '--allow-download',
+            action='store_true',
+            help='Allow fetching models from the Hugging Face hub (offline by default)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['allow_download']:
+            os.environ.setdefault('HF_HUB_OFFLINE', '1')
+            os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+
+        load_start = time.perf_counter()
+        for name in ('toxicity', 'sentiment'):
+            utils.load_model(name)
+        model_load_s = time.perf_counter() - load_start
+
+        corpus = synthetic_corpus(options['size'], seed=options['seed'])
+        max_length = options['max_length']
+        self.stdout.write(f"Corpus: {len(corpus)} comments, model load {model_load_s:.2f}s")
+
+        # Warm up so one-off allocation cost isn't counted as latency
+        utils.classify_comments(corpus[:8], max_length=max_length)
+
+        rule_hits = sum(1 for text in corpus if utils.rule_based_label(text) is not None)
+
+        # Per-comment latency through the single-comment entry point
+        latencies = []
+        single_start = time.perf_counter()
+        for text in corpus:
+            start = time.perf_counter()
+            utils.classify_comment(text, max_length=max_length)
+            latencies.append(time.perf_counter() - start)
+        single_elapsed = time.perf_counter() - single_start
+
+        # Throughput through the batch entry point
+        timings = {}
+        batch_start = time.perf_counter()
+        utils.classify_comments(corpus, max_length=max_length, timings=timings)
+        batch_elapsed = time.perf_counter() - batch_start
+
+        results = {
+            **latency_summary(latencies),
+            "single_comments_per_sec": len(corpus) / single_elapsed if single_elapsed else 0.0,
+            "batch_comments_per_sec": len(corpus) / batch_elapsed if batch_elapsed else 0.0,
+            "model_load_s": model_load_s,
+            "peak_rss_mb": peak_rss_mb(),
+            "rule_path_hit_rate": rule_hits / len(corpus) if corpus else 0.0,
+        }
+        for stage, seconds in timings.items():
+            results[f"batch_{stage}_s"] = seconds
+
+        report = build_report("classify", results, params={
+            "size": len(corpus),
+            "seed": options['seed'],
+            "max_length": max_length,
+        })
+
+        for metric, value in results.items():
+            self.stdout.write(f"{metric}: {value:.4f}")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stdout.write(f"\nCompared with {baseline.get('git_revision') or options['compare']}:")
+            for metric, old, new, change in compare_reports(baseline, report):
+                self.stdout.write(f"  {metric}: {old:.4f} -> {new:.4f} ({change:+.1f}%)")
+
+        if options['output']:
+            write_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
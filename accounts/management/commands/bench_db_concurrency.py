@@ -0,0 +1,126 @@
+import threading
+import time
+from django.contrib.auth.models import User
+from django.db import connection, connections, OperationalError
+from accounts.benchmarks import build_report, write_report, latency_summary
+from accounts.models import Child, Comment
+from accounts.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = "Measure comment write throughput with N parallel ingest workers on the configured database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Parallel ingest workers')
+        parser.add_argument('--comments', type=int, default=500, help='Comments written per worker')
+        parser.add_argument('--readers', type=int, default=1, help='Parallel dashboard readers')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        per_worker = options['comments']
+        vendor = connection.vendor
+
+        parent = User.objects.create_user(username=f"dbbench_parent_{int(time.time())}")
+        children = [
+            Child.objects.create(parent=parent, username=f"dbbench_child_{i}") for i in range(workers)
+        ]
+        self.stdout.write(f"Backend: {vendor} ({connection.settings_dict['NAME']})")
+        if vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f"SQLite journal_mode: {cursor.fetchone()[0]}")
+
+        write_latencies = []
+        read_latencies = []
+        lock_errors = []
+        stop_reading = threading.Event()
+        lock = threading.Lock()
+
+        def ingest(child):
+            # Same per-comment pattern as fetch_comments_for_child: dedup check, then insert
+            latencies = []
+            errors = 0
+            try:
+                for n in range(per_worker):
+                    comment_id = f"dbbench_{child.id}_{n}"
+                    start = time.perf_counter()
+                    try:
+                        if not Comment.objects.filter(comment_id=comment_id, child=child).exists():
+                            Comment.objects.create(
+                                child=child,
+                                comment_id=comment_id,
+                                post_id=f"dbbench_post_{child.id}",
+                                username="dbbench",
+                                text="benchmark comment",
+                                sentiment="neutral",
+                            )
+                    except OperationalError:
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            with lock:
+                write_latencies.extend(latencies)
+                lock_errors.append(errors)
+
+        def read():
+            # Dashboard poll: latest comments for one child
+            latencies = []
+            try:
+                while not stop_reading.is_set():
+                    for child in children:
+                        start = time.perf_counter()
+                        try:
+                            list(Comment.objects.filter(child=child).order_by('-created_at').values('id', 'text')[:100])
+                        except OperationalError:
+                            with lock:
+                                lock_errors.append(1)
+                            continue
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            with lock:
+                read_latencies.extend(latencies)
+
+        try:
+            readers = [threading.Thread(target=read) for _ in range(options['readers'])]
+            writers = [threading.Thread(target=ingest, args=(child,)) for child in children]
+            for thread in readers:
+                thread.start()
+            start = time.perf_counter()
+            for thread in writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            stop_reading.set()
+            for thread in readers:
+                thread.join()
+        finally:
+            parent.delete()
+
+        written = len(write_latencies)
+        results = {
+            'elapsed_s': elapsed,
+            'comments_written': written,
+            'writes_per_sec': written / elapsed if elapsed else 0.0,
+            'lock_errors': sum(lock_errors),
+            'reads': len(read_latencies),
+        }
+        results.update({f"write_{k}": v for k, v in latency_summary(write_latencies).items()})
+        results.update({f"read_{k}": v for k, v in latency_summary(read_latencies).items()})
+
+        for metric, value in results.items():
+            self.stdout.write(f"{metric}: {value:.4f}" if isinstance(value, float) else f"{metric}: {value}")
+
+        if options['output']:
+            report = build_report("db_concurrency", results, params={
+                'backend': vendor,
+                'workers': workers,
+                'comments_per_worker': per_worker,
+                'readers': options['readers'],
+            })
+            write_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
@@ -0,0 +1,96 @@
+import random
+import time
+from django.contrib.auth.models import User
+from accounts import search
+from accounts.benchmarks import synthetic_corpus, build_report, write_report, latency_summary
+from accounts.models import Child, Comment
+from accounts.profiling import ProfiledCommand
+
+
+def vocabulary(size, rng):
+    """Made-up words, so the index has a realistic number of distinct terms."""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+
+class Command(ProfiledCommand):
+    help = "Measure full-text comment search latency against the LIKE '%q%' scan it replaces"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=200000, help='Comments to index')
+        parser.add_argument('--children', type=int, default=50, help='Children the comments are spread over')
+        parser.add_argument('--queries', type=int, default=200, help='Full-text queries to time')
+        parser.add_argument('--like-queries', type=int, default=20, help='LIKE queries to time (they are slow)')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        rng = random.Random(1033)
+        words = vocabulary(5000, rng)
+        corpus = synthetic_corpus(500)
+
+        parent = User.objects.create_user(username=f"searchbench_parent_{int(time.time())}")
+        try:
+            children = [
+                Child.objects.create(parent=parent, username=f"searchbench_child_{i}")
+                for i in range(options['children'])
+            ]
+            start = time.perf_counter()
+            for offset in range(0, options['comments'], 5000):
+                Comment.objects.bulk_create([
+                    Comment(
+                        child=children[i % len(children)], comment_id=f"searchbench_{i}", post_id="searchbench_post",
+                        username=f"user_{i % 3000}",
+                        text=f"{corpus[i % len(corpus)]} {' '.join(rng.sample(words, 3))}",
+                    )
+                    for i in range(offset, min(offset + 5000, options['comments']))
+                ])
+            insert_s = time.perf_counter() - start
+            self.stdout.write(
+                f"Inserted {options['comments']} comments in {insert_s:.1f}s (backend: {search.backend() or 'icontains'})"
+            )
+
+            def sample():
+                return rng.choice(children).id, rng.choice(words + ['ugly', 'love', 'stupid'])
+
+            fts_latencies = []
+            for _ in range(options['queries']):
+                child_id, word = sample()
+                start = time.perf_counter()
+                search.search_ids(word, child_id=child_id, limit=21)
+                fts_latencies.append(time.perf_counter() - start)
+
+            admin_latencies = []
+            for _ in range(options['queries']):
+                _, word = sample()
+                start = time.perf_counter()
+                list(search.filter_queryset(Comment.objects.all(), word).values_list('id', flat=True)[:100])
+                admin_latencies.append(time.perf_counter() - start)
+
+            like_latencies = []
+            for _ in range(options['like_queries']):
+                child_id, word = sample()
+                start = time.perf_counter()
+                list(
+                    Comment.objects.filter(child_id=child_id, text__icontains=word)
+                    .order_by('-created_at').values_list('id', flat=True)[:21]
+                )
+                like_latencies.append(time.perf_counter() - start)
+
+            results = {'insert_s': insert_s}
+            for name, latencies in (('search', fts_latencies), ('admin', admin_latencies), ('like', like_latencies)):
+                summary = latency_summary(latencies)
+                results.update({f"{name}_{k}": v for k, v in summary.items()})
+                self.stdout.write(f"{name}: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms")
+            if results['search_p50_ms']:
+                results['speedup_p50'] = results['like_p50_ms'] / results['search_p50_ms']
+                self.stdout.write(self.style.SUCCESS(
+                    f"Full-text search is {results['speedup_p50']:.0f}x faster than LIKE at p50"
+                ))
+
+            if options['output']:
+                report = build_report("search", results, params={
+                    'comments': options['comments'], 'children': options['children'], 'backend': search.backend(),
+                })
+                write_report(report, options['output'])
+        finally:
+            parent.delete()
@@ -0,0 +1,88 @@
+import time
+import tracemalloc
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+from accounts.benchmarks import synthetic_corpus, build_report, write_report
+from accounts.models import Child, Comment
+from accounts.profiling import ProfiledCommand
+from accounts.renderers import ORJSONRenderer, orjson
+from accounts.serialization import comment_rows, stream_json_array
+
+
+def legacy_payload(comments):
+    """The per-row dict loop get_child_comments used before comment_rows()."""
+    comments_data = []
+    for comment in comments.values('comment_id', 'text', 'sentiment', 'created_at', 'username', 'post_id'):
+        comments_data.append({
+            'id': comment['comment_id'],
+            'text': comment['text'],
+            'sentiment': comment['sentiment'],
+            'confidence': 0.85,
+            'created_at': comment['created_at'].isoformat(),
+            'instagram_id': comment['comment_id'],
+            'username': comment['username'],
+            'post_id': comment['post_id']
+        })
+    return JSONRenderer().render(comments_data)
+
+
+def fast_payload(comments):
+    return ORJSONRenderer().render(list(comment_rows(comments)))
+
+
+def streamed_payload(comments):
+    return b''.join(stream_json_array(comment_rows(comments, chunk_size=2000)))
+
+
+class Command(ProfiledCommand):
+    help = "Compare comment payload serialization: legacy dict loop vs values_list + orjson vs streaming"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=20000, help='Comments for the benchmark child')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per implementation (best is kept)')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        parent = User.objects.create_user(username=f"serbench_parent_{int(time.time())}")
+        try:
+            child = Child.objects.create(parent=parent, username="serbench_child")
+            texts = synthetic_corpus(options['comments'])
+            Comment.objects.bulk_create([
+                Comment(child=child, comment_id=f"serbench_{i}", post_id="serbench_post",
+                        username=f"user_{i % 300}", text=text, sentiment="neutral")
+                for i, text in enumerate(texts)
+            ], batch_size=1000)
+            comments = Comment.objects.filter(child=child).order_by('-created_at')
+
+            self.stdout.write(f"{len(texts)} comments, orjson {'enabled' if orjson else 'not installed'}")
+            results = {}
+            for name, build in (('legacy', legacy_payload), ('fast', fast_payload), ('streamed', streamed_payload)):
+                best = None
+                for _ in range(options['repeat']):
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    payload = build(comments)
+                    elapsed = time.perf_counter() - start
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    if best is None or elapsed < best[0]:
+                        best = (elapsed, peak, len(payload))
+                elapsed, peak, size = best
+                results[f"{name}_ms"] = elapsed * 1000
+                results[f"{name}_peak_mb"] = peak / (1024 * 1024)
+                results[f"{name}_bytes"] = size
+                self.stdout.write(f"{name}: {elapsed * 1000:.1f} ms, peak {peak / (1024 * 1024):.1f} MB, {size} bytes")
+
+            if results['fast_ms']:
+                results['speedup'] = results['legacy_ms'] / results['fast_ms']
+                self.stdout.write(self.style.SUCCESS(f"values_list + orjson is {results['speedup']:.1f}x faster"))
+        finally:
+            parent.delete()
+
+        if options['output']:
+            report = build_report("serialization", results, params={
+                'comments': options['comments'],
+                'orjson': bool(orjson),
+            })
+            write_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
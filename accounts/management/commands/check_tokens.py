@@ -1,4 +1,5 @@
 import requests
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from accounts.models import Child
 
@@ -20,7 +21,7 @@ class Command(BaseCommand):
                 continue
                 
             # Test the token
-            test_url = f"https://graph.facebook.com/v17.0/me?access_token={child.access_token}"
+            test_url = f"{settings.GRAPH_API_URL}/v17.0/me?access_token={child.access_token}"
             
             try:
                 response = requests.get(test_url)
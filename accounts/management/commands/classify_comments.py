@@ -1,14 +1,33 @@
-from django.core.management.base import BaseCommand
-from accounts.models import Comment
-from accounts.utils import classify_comment
+from accounts.profiling import ProfiledCommand
+from accounts.models import Child, Comment
+from accounts.utils import classify_comments
+from accounts.reputation import rebuild
 
-class Command(BaseCommand):
+class Command(ProfiledCommand):
     help = "Classify and print sentiment for all existing comments"
 
-    def handle(self, *args, **kwargs):
-        comments = Comment.objects.all()
-        for comment in comments:
-            sentiment = classify_comment(comment.text)
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length', type=int, default=None, help='Truncate comments to this many tokens')
+
+    def handle(self, *args, **options):
+        comments = list(Comment.objects.all())
+        timings = {}
+        scores = []
+        sentiments = classify_comments(
+            [c.text for c in comments], max_length=options['max_length'], timings=timings, scores=scores
+        )
+        changed_children = set()
+        for comment, sentiment, comment_scores in zip(comments, sentiments, scores):
+            if comment.sentiment != sentiment or comment.sentiment_pending or comment.toxicity_scores != comment_scores:
+                changed_children.add(comment.child_id)
             comment.sentiment = sentiment
+            comment.sentiment_pending = False
+            comment.toxicity_scores = comment_scores
             comment.save()
-            self.stdout.write(f"Comment: {comment.text} -> Sentiment: {sentiment}")
\ No newline at end of file
+            self.stdout.write(f"Comment: {comment.text} -> Sentiment: {sentiment}")
+        rebuild()
+        # Cached dashboard responses for these children are stale now
+        Child.bump_versions(changed_children)
+
+        for stage, seconds in timings.items():
+            self.stdout.write(f"{stage}: {seconds:.3f}s")
\ No newline at end of file
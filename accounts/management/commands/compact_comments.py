@@ -0,0 +1,33 @@
+from accounts.profiling import ProfiledCommand
+from accounts.retention import compact_comments, vacuum
+
+
+class Command(ProfiledCommand):
+    help = "Roll comments past their retention period into daily stats and delete the raw rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Comments compacted per transaction')
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to sleep between batches')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count expired comments')
+        parser.add_argument('--vacuum', action='store_true', help='Release freed space after compacting')
+        parser.add_argument('--full-vacuum', action='store_true', help='Full VACUUM (blocks writers while it runs)')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = compact_comments(dry_run=True)
+            self.stdout.write(f"{count} comments are past their retention period")
+            return
+
+        compacted = compact_comments(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+            progress=lambda n: self.stdout.write(f"Compacted {n} comments"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Compacted {compacted} comments into daily stats"))
+
+        # A full vacuum also converts the file to incremental auto-vacuum, so it runs either way
+        if options['full_vacuum'] or (compacted and options['vacuum']):
+            vacuum(full=options['full_vacuum'])
+            self.stdout.write("Vacuum complete")
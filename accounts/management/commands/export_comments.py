@@ -0,0 +1,51 @@
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from accounts.export import (
+    EXPORT_FORMATS, ExportUnavailable, export_queryset, iter_ndjson_gz, iter_arrow_stream, write_parquet
+)
+from accounts.profiling import ProfiledCommand
+
+
+class Command(ProfiledCommand):
+    help = "Export comment history as gzip NDJSON, Arrow or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help="Output file ('-' for stdout, not for parquet)")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson', help='Export format')
+        parser.add_argument('--parent', type=str, default=None, help='Only export this parent username (default: all)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read and written per chunk')
+
+    def handle(self, *args, **options):
+        parent = None
+        if options['parent']:
+            try:
+                parent = User.objects.get(username=options['parent'])
+            except User.DoesNotExist:
+                raise CommandError(f"Parent {options['parent']} not found")
+
+        comments = export_queryset(parent)
+        fmt = options['format']
+        output = options['output']
+        chunk_size = options['chunk_size']
+
+        try:
+            if fmt == 'parquet':
+                if output == '-':
+                    raise CommandError("Parquet needs a file path, not stdout")
+                rows = write_parquet(comments, output, chunk_size=chunk_size)
+                self.stderr.write(self.style.SUCCESS(f"Wrote {rows} comments to {output}"))
+                return
+
+            chunks = iter_ndjson_gz(comments, chunk_size) if fmt == 'ndjson' else iter_arrow_stream(comments, chunk_size)
+            if output == '-':
+                for data in chunks:
+                    sys.stdout.buffer.write(data)
+                sys.stdout.buffer.flush()
+            else:
+                with open(output, 'wb') as f:
+                    for data in chunks:
+                        f.write(data)
+                self.stderr.write(self.style.SUCCESS(f"Exported comments to {output}"))
+        except ExportUnavailable as e:
+            raise CommandError(str(e))
@@ -1,122 +1,208 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from django.core.management.base import BaseCommand
-from accounts.models import Child, Comment
-from accounts.utils import classify_comment
+from accounts import sentiment_lane
+from accounts.coalescing import LOCK_TIMEOUT_RESULT, account_lock
+from accounts.graph_batch import batch_get
+from accounts.profiling import ProfiledCommand
+from accounts.models import Child
+from accounts.services import account_children, ingest_account_comments, record_sync
 from django.conf import settings
 
+GRAPH_VERSION = "v17.0"
 
-class Command(BaseCommand):
-    help = "Fetch and save Instagram comments for all children, then perform sentiment analysis"
-
-    def handle(self, *args, **kwargs):
-        children = Child.objects.all()
 
-        for child in children:
-            insta_id = child.instagram_user_id
-            token = child.access_token
+class Command(ProfiledCommand):
+    help = "Fetch and save Instagram comments for all children, then perform sentiment analysis"
 
-            if not insta_id or not token:
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Children fetched from Graph at once')
+        parser.add_argument('--child', type=int, action='append', dest='child_ids',
+                            help='Only fetch for this child id (repeatable, default all children)')
+        parser.add_argument('--serial', action='store_true',
+                            help='One GET per request, child after child, instead of batch requests')
+        parser.add_argument('--compare', action='store_true',
+                            help='Also time the serial fetch loop (nothing is saved from it) and report both')
+
+    def handle(self, *args, **options):
+        children = []
+        accounts = set()
+        queryset = Child.objects.all()
+        if options['child_ids']:
+            queryset = queryset.filter(id__in=options['child_ids'])
+        for child in queryset:
+            if not child.instagram_user_id or not child.access_token:
                 self.stdout.write(f"Missing Instagram ID or token for child {child.id}")
                 continue
+            # One fetch per account stores comments for every child watching it
+            if child.instagram_user_id not in accounts:
+                accounts.add(child.instagram_user_id)
+                children.append(child)
+
+        if options['compare'] and not options['serial']:
+            serial_s, serial_results = self.fetch_all(children, self.fetch_serial, 1)
+        if options['serial']:
+            fetch_s, results = self.fetch_all(children, self.fetch_serial, 1)
+        else:
+            fetch_s, results = self.fetch_all(children, self.fetch_batched, options['concurrency'])
+
+        for child, result in zip(children, results):
+            for line in result['log']:
+                self.stdout.write(line)
+            if "error" not in result:
+                try:
+                    self.ingest(child, result)
+                except Exception as e:
+                    # Like fetch_all_children_comments, one child's failure doesn't end the run
+                    result['error'] = f"Unexpected error: {e}"
+            record_sync(child, result)
+            if "error" in result:
+                self.stdout.write(f"Fetching comments for child {child.id} failed: {result['error']}")
+                continue
+            self.stdout.write(
+                f"Finished fetching and analyzing comments for child {child.id}: "
+                f"{sum(result['new_by_child'].values())} new, {result['alerts_sent']} alerts sent"
+            )
 
-            self.stdout.write(f"Fetching media for child {child.id} (Instagram ID: {insta_id})")
-            
-            # Try to refresh token if it's expired
-            token = self.refresh_instagram_token(token, child)
-
-            # Fetch media for this child
-            media_url = (
-                f"https://graph.facebook.com/v17.0/{insta_id}/media"
-                f"?fields=id,caption,timestamp&access_token={token}"
+        # No web process will label what this run left pending
+        if sentiment_lane.lane_mode() == 'thread':
+            sentiment_lane.label_pending()
+
+        round_trips = sum(result['round_trips'] for result in results)
+        requests_needed = sum(result['requests'] for result in results)
+        self.stdout.write(
+            f"Graph fetch took {fetch_s:.2f}s: {round_trips} round trips for {requests_needed} requests "
+            f"({requests_needed - round_trips} saved)"
+        )
+        if options['compare'] and not options['serial']:
+            serial_trips = sum(result['round_trips'] for result in serial_results)
+            self.stdout.write(
+                f"Serial loop took {serial_s:.2f}s for {serial_trips} round trips "
+                f"({serial_s / fetch_s if fetch_s else 0.0:.1f}x slower)"
             )
-            media_response = requests.get(media_url)
-            if media_response.status_code != 200:
-                self.stdout.write(f"Failed to fetch media for child {child.id}: {media_response.text}")
-                continue
 
-            media_list = media_response.json().get("data", [])
-            for media in media_list:
-                media_id = media["id"]
-
-                # Fetch comments for each media post
-                comments_url = (
-                    f"https://graph.facebook.com/v17.0/{media_id}/comments"
-                    f"?fields=id,username,text,timestamp&access_token={token}"
-                )
-                comments_response = requests.get(comments_url)
-
-                if comments_response.status_code != 200:
-                    self.stdout.write(
-                        f"Failed to fetch comments for media {media_id}: {comments_response.text}"
-                    )
-                    continue
-
-                comments = comments_response.json().get("data", [])
-                self.stdout.write(f"Media ID {media_id} has {len(comments)} comments")
-
-                for comment_data in comments:
-                    comment_id = comment_data.get("id")
-                    if not comment_id:
-                        self.stdout.write("Skipping comment without ID")
-                        continue
-
-                    # Skip if already exists
-                    if Comment.objects.filter(comment_id=comment_id).exists():
-                        continue
-
-                    username = comment_data.get("username", "")
-                    text = comment_data.get("text", "")
-
-                    # Perform sentiment analysis
-                    sentiment = classify_comment(text)
-
-                    # Save to DB (✅ include child here)
-                    Comment.objects.create(
-                        child=child,
-                        comment_id=comment_id,
-                        post_id=media_id,
-                        username=username,
-                        text=text,
-                        sentiment=sentiment,
-                    )
-
-                    self.stdout.write(
-                        f"Saved Comment ID: {comment_id} | Sentiment: {sentiment} | Text: {text}"
-                    )
-
-            self.stdout.write(f"Finished fetching and analyzing comments for child {child.id}")
-
-    def refresh_instagram_token(self, access_token, child):
-        """
-        Refresh Instagram access token if it's expired
-        """
+    def fetch_all(self, children, fetch, concurrency):
+        """(seconds, [result]) for fetching every child's media and comments, in child order."""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            results = list(executor.map(lambda child: self.fetch_safely(fetch, child), children))
+        return time.perf_counter() - start, results
+
+    def fetch_safely(self, fetch, child):
+        result = {'log': [], 'media': [], 'round_trips': 0, 'requests': 0}
         try:
-            # First, test if the current token works
-            test_url = f"https://graph.facebook.com/v17.0/me?access_token={access_token}"
-            test_response = requests.get(test_url)
-            
-            if test_response.status_code == 200:
-                self.stdout.write(f"Token is valid for child {child.id}")
-                return access_token
-            
-            # Token is invalid, try to refresh
-            self.stdout.write(f"Token expired for child {child.id}, attempting to refresh...")
-            
-            # Get app credentials from settings
-            client_id = getattr(settings, 'INSTAGRAM_CLIENT_ID', None)
-            client_secret = getattr(settings, 'INSTAGRAM_CLIENT_SECRET', None)
-            
-            if not client_id or not client_secret:
-                self.stdout.write(f"Missing Instagram app credentials in settings")
-                return access_token
-            
-            # Note: Instagram Basic Display API doesn't support automatic token refresh
-            # User needs to re-authenticate through OAuth flow
-            self.stdout.write(f"Instagram token refresh requires user re-authentication")
-            self.stdout.write(f"Child {child.id} needs to re-authenticate via Instagram OAuth")
-            
-            return access_token
-            
+            fetch(child, result)
+        except requests.exceptions.RequestException as e:
+            result['log'].append(f"Graph request failed for child {child.id}: {e}")
+            result['error'] = f"Request failed: {e}"
         except Exception as e:
-            self.stdout.write(f"Error refreshing token for child {child.id}: {e}")
-            return access_token
+            # A malformed response fails this child only, not the whole run
+            result['log'].append(f"Fetching comments for child {child.id} failed: {e}")
+            result['error'] = f"Unexpected error: {e}"
+        result['ingested_at'] = time.monotonic()
+        return result
+
+    def fetch_batched(self, child, result):
+        """
+        The token probe and media list in one batch request, then every
+        media item's comments in batches of up to 50: 1 + ceil(N / 50)
+        round trips instead of N + 2.
+        """
+        log = result['log']
+        log.append(f"Fetching media for child {child.id} (Instagram ID: {child.instagram_user_id})")
+        stats = {}
+        with requests.Session() as session:
+            probe, media_response = batch_get([
+                f"{GRAPH_VERSION}/me",
+                f"{GRAPH_VERSION}/{child.instagram_user_id}/media?fields=id,caption,timestamp",
+            ], child.access_token, session=session, stats=stats)
+            self.refresh_instagram_token(child, probe, log)
+            result['requests'] += 2
+            if media_response.status_code != 200:
+                log.append(f"Failed to fetch media for child {child.id}: {media_response.text}")
+                result['error'] = f"API Error {media_response.status_code}: {media_response.text}"
+                result['round_trips'] = stats.get('round_trips', 0)
+                return
+
+            media_ids = [media["id"] for media in media_response.json().get("data", [])]
+            responses = batch_get(
+                [f"{GRAPH_VERSION}/{media_id}/comments?fields=id,username,text,timestamp" for media_id in media_ids],
+                child.access_token, session=session, stats=stats,
+            )
+        result['requests'] += len(media_ids)
+        result['round_trips'] = stats.get('round_trips', 0)
+        for media_id, comments_response in zip(media_ids, responses):
+            self.add_comments(result, media_id, comments_response)
+
+    def fetch_serial(self, child, result):
+        """The original loop: the token probe, the media list, then one GET per media item."""
+        log = result['log']
+        token = child.access_token
+        log.append(f"Fetching media for child {child.id} (Instagram ID: {child.instagram_user_id})")
+        probe = requests.get(f"{settings.GRAPH_API_URL}/{GRAPH_VERSION}/me?access_token={token}")
+        self.refresh_instagram_token(child, probe, log)
+        media_response = requests.get(
+            f"{settings.GRAPH_API_URL}/{GRAPH_VERSION}/{child.instagram_user_id}/media"
+            f"?fields=id,caption,timestamp&access_token={token}"
+        )
+        result['round_trips'] = result['requests'] = 2
+        if media_response.status_code != 200:
+            log.append(f"Failed to fetch media for child {child.id}: {media_response.text}")
+            result['error'] = f"API Error {media_response.status_code}: {media_response.text}"
+            return
+
+        for media in media_response.json().get("data", []):
+            comments_response = requests.get(
+                f"{settings.GRAPH_API_URL}/{GRAPH_VERSION}/{media['id']}/comments"
+                f"?fields=id,username,text,timestamp&access_token={token}"
+            )
+            result['round_trips'] += 1
+            result['requests'] += 1
+            self.add_comments(result, media["id"], comments_response)
+
+    def add_comments(self, result, media_id, comments_response):
+        if comments_response.status_code != 200:
+            result['log'].append(f"Failed to fetch comments for media {media_id}: {comments_response.text}")
+            return
+        comments = comments_response.json().get("data", [])
+        result['log'].append(f"Media ID {media_id} has {len(comments)} comments")
+        result['media'].append((media_id, comments))
+
+    def ingest(self, child, result):
+        """Screen, store and alert on the fetched comments for every child watching the account."""
+        media_comments = [
+            (media_id, {"text": "", "username": "", **comment})
+            for media_id, comments in result['media']
+            for comment in comments
+            if comment.get("id")
+        ]
+        with account_lock(f"ig:{child.instagram_user_id}") as acquired:
+            if not acquired:
+                result.update(LOCK_TIMEOUT_RESULT)
+                return
+            result.update(ingest_account_comments(account_children(child), media_comments, result['ingested_at']))
+
+    def refresh_instagram_token(self, child, probe, log):
+        """
+        Check the token probe (/me) and explain what to do if the token expired
+        """
+        if probe.status_code == 200:
+            log.append(f"Token is valid for child {child.id}")
+            return
+
+        # Token is invalid, try to refresh
+        log.append(f"Token expired for child {child.id}, attempting to refresh...")
+
+        # Get app credentials from settings
+        client_id = getattr(settings, 'INSTAGRAM_CLIENT_ID', None)
+        client_secret = getattr(settings, 'INSTAGRAM_CLIENT_SECRET', None)
+
+        if not client_id or not client_secret:
+            log.append("Missing Instagram app credentials in settings")
+            return
+
+        # Note: Instagram Basic Display API doesn't support automatic token refresh
+        # User needs to re-authenticate through OAuth flow
+        log.append("Instagram token refresh requires user re-authentication")
+        log.append(f"Child {child.id} needs to re-authenticate via Instagram OAuth")
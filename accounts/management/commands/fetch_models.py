@@ -0,0 +1,56 @@
+from django.core.management.base import CommandError
+from accounts.profiling import ProfiledCommand
+from accounts import model_store
+
+
+class Command(ProfiledCommand):
+    help = "Download the classifier models into the local model store, or verify the stored files"
+    # The checks import the URLconf and views; this command fills the store
+    # they would load from, so it must not depend on it
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', choices=sorted(model_store.MODELS),
+            help='Model to fetch or verify (repeatable, default all)',
+        )
+        parser.add_argument('--revision', help='Revision to fetch instead of the pinned one (with one --model)')
+        parser.add_argument('--update', action='store_true',
+                            help='Fetch the current tip of an unpinned MODEL_REVISIONS branch, not the stored commit')
+        parser.add_argument('--verify', action='store_true', help='Only check stored files against the manifest')
+
+    def handle(self, *args, **options):
+        names = options['model'] or sorted(model_store.MODELS)
+        if options['revision'] and len(names) != 1:
+            raise CommandError("--revision needs exactly one --model")
+
+        if options['verify']:
+            problems = []
+            for name in names:
+                found = model_store.verify(name)
+                problems.extend(found)
+                if not found:
+                    self.stdout.write(self.style.SUCCESS(f"{name}: OK"))
+            if problems:
+                raise CommandError("Model store check failed:\n" + "\n".join(problems))
+            return
+
+        self.stdout.write(f"Model store: {model_store.store_dir()}")
+        resolved = {}
+        for name in names:
+            entry = model_store.fetch(name, revision=options['revision'], update=options['update'])
+            resolved[name] = entry['revision']
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {entry['repo']}@{entry['revision']} ({len(entry['files'])} files)"
+            ))
+        unpinned = {
+            name: commit for name, commit in resolved.items()
+            if not model_store.is_commit(model_store.configured_revision(name))
+        }
+        if unpinned:
+            self.stdout.write(self.style.WARNING(
+                "MODEL_REVISIONS is not pinned to commits for " + ", ".join(sorted(unpinned))
+                + "; set them in settings to load these exact weights everywhere:"
+            ))
+            for name, commit in sorted(unpinned.items()):
+                self.stdout.write(f"    '{name}': '{commit}',")
@@ -0,0 +1,29 @@
+import time
+from accounts.profiling import ProfiledCommand
+from accounts.sentiment_lane import label_pending, pending_comments
+
+
+class Command(ProfiledCommand):
+    help = "Label the sentiment of comments that ingestion left pending (the low-priority sentiment lane)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Comments labeled per batch')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new pending comments')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            waiting = pending_comments().count()
+            if waiting:
+                labeled = label_pending(
+                    batch_size=options['batch_size'],
+                    max_batches=options['max_batches'],
+                    progress=lambda n: self.stdout.write(f"Labeled {n}/{waiting} comments"),
+                )
+                self.stdout.write(self.style.SUCCESS(f"Labeled {labeled} pending comments"))
+            elif not options['loop']:
+                self.stdout.write("No comments are waiting for sentiment")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,160 @@
+import time
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from accounts.profiling import ProfiledCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.benchmarks import build_report, write_report, peak_rss_mb
+from accounts.graph_simulator import GraphSimulator
+from accounts.models import Child, Comment
+
+INFERENCE_STAGES = ('rules', 'tokenize', 'toxicity', 'sentiment')
+
+
+class Command(ProfiledCommand):
+    help = "Load test comment ingestion against a local Graph API simulator"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=5, help='Simulated Instagram accounts')
+        parser.add_argument('--media', type=int, default=10, help='Media items per account')
+        parser.add_argument('--comments', type=int, default=20, help='Comments per media item')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency per Graph request')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency per Graph request')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of Graph requests that fail')
+        parser.add_argument('--rate-limit', type=int, default=None, help='Graph requests allowed per window')
+        parser.add_argument('--rate-window', type=float, default=1.0, help='Rate limit window in seconds')
+        parser.add_argument(
+            '--path',
+            choices=['service', 'view', 'command', 'all'],
+            default='all',
+            help='Which ingestion path to drive'
+        )
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+        parser.add_argument('--keep', action='store_true', help='Keep the load test parent, children and comments')
+
+    def handle(self, *args, **options):
+        simulator = GraphSimulator(
+            accounts=options['accounts'],
+            media_per_account=options['media'],
+            comments_per_media=options['comments'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            rate_limit=options['rate_limit'],
+            rate_window=options['rate_window'],
+        )
+        paths = ['service', 'view', 'command'] if options['path'] == 'all' else [options['path']]
+
+        results = {}
+        with simulator, override_settings(
+            GRAPH_API_URL=simulator.url,
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            FETCH_MIN_INTERVAL=0,  # every run must really fetch
+        ):
+            self.stdout.write(
+                f"Graph simulator at {simulator.url}: {simulator.accounts} accounts, "
+                f"{simulator.total_comments} comments"
+            )
+            parent = User.objects.create_user(
+                username=f"loadtest_parent_{int(time.time())}",
+                email="loadtest@example.com",
+            )
+            try:
+                children = [
+                    Child.objects.create(
+                        parent=parent,
+                        username=f"loadtest_child_{i}",
+                        instagram_user_id=account_id,
+                        access_token="loadtest",
+                    )
+                    for i, account_id in enumerate(simulator.account_ids)
+                ]
+                for path in paths:
+                    # Each path ingests from an empty table so runs are comparable
+                    Comment.objects.filter(child__in=children).delete()
+                    mail.outbox = []
+                    requests_before = simulator.stats['requests']
+                    run = getattr(self, f"run_{path}")
+                    metrics = run(parent, children)
+                    metrics['graph_requests'] = simulator.stats['requests'] - requests_before
+                    metrics['alerts'] = len(mail.outbox)
+                    for metric, value in metrics.items():
+                        results[f"{path}_{metric}"] = value
+                    self.report(path, metrics)
+            finally:
+                if not options['keep']:
+                    parent.delete()
+
+        results['graph_errors'] = simulator.stats['errors']
+        results['graph_rate_limited'] = simulator.stats['rate_limited']
+        results['graph_batched_requests'] = simulator.stats['batched_requests']
+        results['peak_rss_mb'] = peak_rss_mb()
+
+        if options['output']:
+            report = build_report("ingestion_load", results, params={
+                key: options[key] for key in (
+                    'accounts', 'media', 'comments', 'latency', 'jitter',
+                    'error_rate', 'rate_limit', 'rate_window', 'path',
+                )
+            })
+            write_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def run_service(self, parent, children):
+        from accounts.services import fetch_comments_for_child
+        timings = {}
+        start = time.perf_counter()
+        for child in children:
+            fetch_comments_for_child(child, timings=timings)
+        elapsed = time.perf_counter() - start
+        metrics = self.throughput(children, elapsed)
+        metrics['graph_api_s'] = timings.get('graph_api', 0.0)
+        metrics['dedup_s'] = timings.get('dedup', 0.0)
+        metrics['db_write_s'] = timings.get('db_write', 0.0)
+        metrics['inference_s'] = sum(timings.get(stage, 0.0) for stage in INFERENCE_STAGES)
+        metrics['alert_send_s'] = timings.get('alerts', 0.0)
+        return metrics
+
+    def run_view(self, parent, children):
+        from accounts.views import fetch_all_children_comments
+        request = APIRequestFactory().post('/api/accounts/children/fetch-all-comments/')
+        force_authenticate(request, user=parent)
+        start = time.perf_counter()
+        response = fetch_all_children_comments(request)
+        elapsed = time.perf_counter() - start
+        metrics = self.throughput(children, elapsed)
+        metrics['status_code'] = response.status_code
+        return metrics
+
+    def run_command(self, parent, children):
+        # Only the load test's children: a sync of anyone else's would record
+        # the simulator's 404 on them and invalidate their cached responses
+        start = time.perf_counter()
+        call_command('fetch_comments', *[f"--child={child.id}" for child in children], stdout=_NullWriter())
+        elapsed = time.perf_counter() - start
+        return self.throughput(children, elapsed)
+
+    def throughput(self, children, elapsed):
+        ingested = Comment.objects.filter(child__in=children).count()
+        return {
+            'elapsed_s': elapsed,
+            'comments_ingested': ingested,
+            'comments_per_sec': ingested / elapsed if elapsed else 0.0,
+        }
+
+    def report(self, path, metrics):
+        self.stdout.write(f"\n[{path}]")
+        for metric, value in metrics.items():
+            if isinstance(value, float):
+                self.stdout.write(f"  {metric}: {value:.4f}")
+            else:
+                self.stdout.write(f"  {metric}: {value}")
+
+
+class _NullWriter:
+    def write(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        pass
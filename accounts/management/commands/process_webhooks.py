@@ -0,0 +1,29 @@
+import time
+from accounts.profiling import ProfiledCommand
+from accounts.webhooks import pending_events, process_pending
+
+
+class Command(ProfiledCommand):
+    help = "Ingest received Instagram webhook events (when WEBHOOK_WORKER = 'command')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Events ingested per batch')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new events')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            waiting = pending_events().count()
+            if waiting:
+                handled = process_pending(
+                    batch_size=options['batch_size'],
+                    max_batches=options['max_batches'],
+                    progress=lambda n: self.stdout.write(f"Ingested {n}/{waiting} events"),
+                )
+                self.stdout.write(self.style.SUCCESS(f"Ingested {handled} webhook events"))
+            elif not options['loop']:
+                self.stdout.write("No webhook events are waiting")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
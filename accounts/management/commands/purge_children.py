@@ -0,0 +1,29 @@
+import time
+from accounts.profiling import ProfiledCommand
+from accounts.purge import pending_children, purge_pending
+
+
+class Command(ProfiledCommand):
+    help = "Purge the comments and stats of deleted children in small batches (when PURGE_WORKER = 'command')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=None, help='Seconds to sleep between batches')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for deleted children')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        def progress(child, deleted):
+            total = child.purge_total or 0
+            self.stdout.write(f"Child {child.pk}: purged {deleted}/{total} rows")
+
+        while True:
+            waiting = pending_children().count()
+            if waiting:
+                deleted = purge_pending(batch_size=options['batch_size'], pause=options['pause'], progress=progress)
+                self.stdout.write(self.style.SUCCESS(f"Purged {deleted} rows of {waiting} deleted children"))
+            elif not options['loop']:
+                self.stdout.write("No deleted children are waiting to be purged")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from accounts.profiling import ProfiledCommand
+from accounts.reputation import rebuild
+
+
+class Command(ProfiledCommand):
+    help = "Recompute commenter reputation stats from stored comments (e.g. after reclassifying)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--child', type=int, action='append', help='Only this child (repeatable)')
+
+    def handle(self, *args, **options):
+        written = rebuild(options['child'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {written} commenters"))
@@ -0,0 +1,172 @@
+import gzip
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import CommandError
+from django.test import Client
+from django.urls import reverse
+from accounts.benchmarks import synthetic_corpus, build_report, write_report, latency_summary
+from accounts.models import Child
+from accounts.profiling import ProfiledCommand
+from accounts.webhooks import SIGNATURE_HEADER, app_secret, pending_events, sign
+
+
+def read_deliveries(path):
+    """Deliveries from a JSON file (one payload or a list) or NDJSON, optionally gzipped."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        content = f.read()
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+
+def synthetic_deliveries(count, accounts, changes, seed=1033):
+    """`count` deliveries of `changes` new comments each, spread over `accounts`."""
+    rng = random.Random(seed)
+    texts = synthetic_corpus(500, seed=seed)
+    run = int(time.time())
+    deliveries = []
+    for n in range(count):
+        account = accounts[n % len(accounts)]
+        deliveries.append({
+            "object": "instagram",
+            "entry": [{
+                "id": account,
+                "time": run,
+                "changes": [
+                    {
+                        "field": "comments",
+                        "value": {
+                            "from": {"id": f"replay_user_{i}", "username": f"commenter_{rng.randint(0, 999)}"},
+                            "media": {"id": f"{account}_replay_media", "media_product_type": "FEED"},
+                            "id": f"replay_{run}_{n}_{i}",
+                            "text": rng.choice(texts),
+                        },
+                    }
+                    for i in range(changes)
+                ],
+            }],
+        })
+    return deliveries
+
+
+class Command(ProfiledCommand):
+    help = "Replay recorded (or synthetic) Instagram webhook deliveries against the receiver for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Recorded deliveries (JSON or NDJSON, e.g. from WEBHOOK_RECORD_DIR)')
+        parser.add_argument('--synthetic', type=int, default=0, help='Generate this many deliveries instead')
+        parser.add_argument('--account', action='append', default=None,
+                            help='Instagram user id for synthetic deliveries (default: every watched account)')
+        parser.add_argument('--changes', type=int, default=1, help='Comments per synthetic delivery')
+        parser.add_argument('--url', type=str, default=None,
+                            help='Receiver URL of a running server (default: call the view in-process)')
+        parser.add_argument('--secret', type=str, default=None, help='Signing secret (default: the app secret)')
+        parser.add_argument('--concurrency', type=int, default=1, help='Deliveries sent at once')
+        parser.add_argument('--rate', type=float, default=0.0, help='Deliveries per second (0 sends as fast as possible)')
+        parser.add_argument('--wait', type=float, default=0.0,
+                            help='Seconds to wait for the worker to drain the queue (same database only)')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        deliveries = []
+        for path in options['files']:
+            deliveries.extend(read_deliveries(path))
+        if options['synthetic']:
+            accounts = options['account'] or sorted(set(
+                Child.objects.exclude(instagram_user_id__isnull=True).exclude(instagram_user_id='')
+                .values_list('instagram_user_id', flat=True)
+            ))
+            if not accounts:
+                raise CommandError("No watched accounts; pass --account")
+            deliveries.extend(synthetic_deliveries(options['synthetic'], accounts, options['changes']))
+        if not deliveries:
+            raise CommandError("Nothing to replay: pass recorded files or --synthetic")
+
+        secret = options['secret'] or app_secret()
+        if not secret:
+            raise CommandError("No signing secret configured")
+        bodies = [json.dumps(delivery).encode() for delivery in deliveries]
+        local = threading.local()
+
+        def post(body):
+            headers = {SIGNATURE_HEADER: sign(body, secret)}
+            start = time.perf_counter()
+            if options['url']:
+                if not hasattr(local, 'session'):
+                    local.session = requests.Session()
+                status = local.session.post(
+                    options['url'], data=body, timeout=30,
+                    headers={**headers, 'Content-Type': 'application/json'},
+                ).status_code
+            else:
+                if not hasattr(local, 'client'):
+                    local.client = Client(HTTP_HOST='localhost')
+                status = local.client.post(
+                    reverse('instagram-webhook'), data=body, content_type='application/json',
+                    headers=headers,
+                ).status_code
+            return status, time.perf_counter() - start
+
+        interval = 1.0 / options['rate'] if options['rate'] else 0.0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            futures = []
+            for n, body in enumerate(bodies):
+                if interval:
+                    # Hold the schedule rather than sleeping a fixed gap after each send
+                    time.sleep(max(0.0, start + n * interval - time.perf_counter()))
+                futures.append(executor.submit(post, body))
+            outcomes = [future.result() for future in futures]
+        send_s = time.perf_counter() - start
+
+        statuses = {}
+        for status, _ in outcomes:
+            statuses[status] = statuses.get(status, 0) + 1
+        events = sum(
+            len(entry.get('changes') or []) for delivery in deliveries for entry in delivery.get('entry') or []
+        )
+        latency = latency_summary([seconds for _, seconds in outcomes])
+        results = {
+            'deliveries': len(bodies),
+            'events': events,
+            'send_s': send_s,
+            'deliveries_per_s': len(bodies) / send_s if send_s else 0.0,
+            **{f"ack_{k}": v for k, v in latency.items()},
+            **{f"status_{k}": v for k, v in statuses.items()},
+        }
+        self.stdout.write(
+            f"Sent {len(bodies)} deliveries ({events} changes) in {send_s:.2f}s: "
+            f"{results['deliveries_per_s']:.1f}/s, ack p50 {latency['p50_ms']:.1f} ms, "
+            f"p95 {latency['p95_ms']:.1f} ms, statuses {statuses}"
+        )
+
+        if options['wait']:
+            deadline = time.perf_counter() + options['wait']
+            waiting = pending_events().count()
+            while waiting and time.perf_counter() < deadline:
+                time.sleep(0.1)
+                waiting = pending_events().count()
+            drain_s = time.perf_counter() - start
+            results.update({'drain_s': drain_s, 'events_waiting': waiting})
+            if waiting:
+                self.stdout.write(self.style.WARNING(f"{waiting} events still waiting after {options['wait']}s"))
+            else:
+                results['events_per_s'] = events / drain_s if drain_s else 0.0
+                self.stdout.write(self.style.SUCCESS(
+                    f"Queue drained {drain_s:.2f}s after the first delivery ({results['events_per_s']:.1f} events/s)"
+                ))
+
+        if options['output']:
+            report = build_report("webhooks", results, params={
+                'concurrency': options['concurrency'], 'rate': options['rate'],
+                'target': options['url'] or 'in-process',
+            })
+            write_report(report, options['output'])
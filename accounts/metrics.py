@@ -0,0 +1,155 @@
+"""
+Prometheus metrics and structured logging for ingestion, classification,
+alerting and API requests.
+
+prometheus_client is optional: without it the recording helpers are no-ops
+and /metrics answers 503, but structured stage logs are still written.
+"""
+import json
+import logging
+import os
+import uuid
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Histogram
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+# Correlation ID of the request or job currently being handled
+correlation_id = ContextVar('correlation_id', default=None)
+
+# Buckets tuned for stages that range from sub-millisecond DB lookups to
+# multi-second Graph API calls.
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+if prometheus_client:
+    STAGE_SECONDS = Histogram(
+        'sentimentguard_stage_seconds',
+        'Time spent in each pipeline stage',
+        ['pipeline', 'stage'],
+        buckets=STAGE_BUCKETS,
+    )
+    COMMENTS_TOTAL = Counter(
+        'sentimentguard_comments_total',
+        'Comments processed by the ingestion pipeline',
+        ['outcome'],
+    )
+    ALERTS_TOTAL = Counter(
+        'sentimentguard_alerts_total',
+        'Toxic comment alert emails',
+        ['result'],
+    )
+    TIME_TO_ALERT_SECONDS = Histogram(
+        'sentimentguard_time_to_alert_seconds',
+        'Time from a toxic comment arriving from Graph to its alert being handed to the mailer',
+        buckets=STAGE_BUCKETS,
+    )
+    REQUEST_SECONDS = Histogram(
+        'sentimentguard_request_seconds',
+        'API request latency per endpoint',
+        ['view', 'method', 'status'],
+        buckets=STAGE_BUCKETS,
+    )
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex
+
+
+def observe_timings(pipeline, timings):
+    """
+    Record a timings dict (stage -> seconds) as histogram observations and
+    as one structured log line.
+    """
+    if not timings:
+        return
+    if prometheus_client:
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.labels(pipeline=pipeline, stage=stage).observe(seconds)
+    logger.info(
+        "%s stage timings", pipeline,
+        extra={'event': 'stage_timings', 'pipeline': pipeline, 'timings': timings},
+    )
+
+
+def count_comments(outcome, amount=1):
+    if prometheus_client and amount:
+        COMMENTS_TOTAL.labels(outcome=outcome).inc(amount)
+
+
+def count_alert(result):
+    if prometheus_client:
+        ALERTS_TOTAL.labels(result=result).inc()
+
+
+def observe_time_to_alert(seconds):
+    """Record one alert's latency and warn when it misses ALERT_LATENCY_SLO."""
+    if prometheus_client:
+        TIME_TO_ALERT_SECONDS.observe(seconds)
+    slo = getattr(settings, 'ALERT_LATENCY_SLO', None)
+    if slo is not None and seconds > slo:
+        logger.warning(
+            "Toxic comment alert took %.2fs (SLO %ss)", seconds, slo,
+            extra={'event': 'alert_slo_miss', 'seconds': seconds, 'slo': slo},
+        )
+
+
+def observe_request(view, method, status, seconds):
+    if prometheus_client:
+        REQUEST_SECONDS.labels(view=view, method=method, status=str(status)).observe(seconds)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Open to METRICS_ALLOWED_IPS (and everyone
+    when DEBUG is on).
+    """
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+    if not settings.DEBUG and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponse(status=403)
+    if not prometheus_client:
+        return HttpResponse("prometheus_client is not installed", status=503, content_type='text/plain')
+
+    registry = prometheus_client.REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Several worker processes: merge their samples
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(prometheus_client.generate_latest(registry), content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Attach the current correlation ID to every log record."""
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per log line, including any structured `extra` fields."""
+
+    EXTRA_FIELDS = ('event', 'pipeline', 'timings', 'view', 'method', 'status', 'duration_ms')
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'correlation_id': getattr(record, 'correlation_id', None),
+        }
+        for field in self.EXTRA_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
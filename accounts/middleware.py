@@ -0,0 +1,136 @@
+import logging
+import time
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from .metrics import correlation_id, new_correlation_id, observe_request
+
+logger = logging.getLogger('accounts.requests')
+
+
+class MetricsMiddleware:
+    """
+    Tags each request with a correlation ID (taken from X-Request-ID when the
+    client sends one), records its latency per endpoint and logs it.
+    Works in both WSGI and ASGI stacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_id = request.headers.get('X-Request-ID') or new_correlation_id()
+        token = correlation_id.set(request_id)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            return self.finish(request, response, request_id, start)
+        finally:
+            correlation_id.reset(token)
+
+    async def __acall__(self, request):
+        request_id = request.headers.get('X-Request-ID') or new_correlation_id()
+        token = correlation_id.set(request_id)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            return self.finish(request, response, request_id, start)
+        finally:
+            correlation_id.reset(token)
+
+    def finish(self, request, response, request_id, start):
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unmatched'
+        observe_request(view, request.method, response.status_code, elapsed)
+        logger.info(
+            "%s %s %s", request.method, request.path, response.status_code,
+            extra={
+                'event': 'request',
+                'view': view,
+                'method': request.method,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+            },
+        )
+        response['X-Request-ID'] = request_id
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request and records its SQL queries when PROFILING_ENABLED is
+    on, or when a staff user sends the PROFILING_HEADER header. Results are
+    saved under PROFILING_DIR and summarized in response headers.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+        return self.profile(request, self.get_response)
+
+    async def __acall__(self, request):
+        # Only hop to a thread (for the staff check) when profiling was asked for
+        if not self.requested(request) or not await sync_to_async(self.should_profile)(request):
+            return await self.get_response(request)
+        # Profiled requests run on one thread so the profiler and the query
+        # recorder see all of their work, async ORM calls included
+        return await sync_to_async(self.profile)(request, async_to_sync(self.get_response))
+
+    def profile(self, request, get_response):
+        from .profiling import Profile
+        with Profile(f"{request.method}-{request.path}") as profile:
+            response = get_response(request)
+        summary = profile.save(extra={
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+        })
+        response['X-Query-Count'] = str(summary['query_count'])
+        response['X-Profile-Path'] = summary['trace']
+        if summary['repeated_queries']:
+            logger.warning(
+                "Possible N+1 queries in %s %s: %s", request.method, request.path,
+                [q['sql'][:160] for q in summary['repeated_queries']],
+            )
+        return response
+
+    def requested(self, request):
+        from django.conf import settings
+        header = getattr(settings, 'PROFILING_HEADER', 'X-Profile')
+        return getattr(settings, 'PROFILING_ENABLED', False) or bool(request.headers.get(header))
+
+    def should_profile(self, request):
+        from django.conf import settings
+        if getattr(settings, 'PROFILING_ENABLED', False):
+            return True
+        header = getattr(settings, 'PROFILING_HEADER', 'X-Profile')
+        if not request.headers.get(header):
+            return False
+        return self.is_staff(request)
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        # API clients authenticate with JWT inside the view, so check the token here
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except Exception:
+            return False
+        return bool(result and result[0].is_staff)
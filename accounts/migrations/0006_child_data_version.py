@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_commentdailystat_retentionpolicy_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='child',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_child_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='sentiment_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('sentiment_pending', True)), fields=['id'], name='comment_sentiment_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_comment_sentiment_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='toxicity_scores',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q
+
+
+def seed_commenter_stats(apps, schema_editor):
+    """Build stats for the comments stored before this table existed."""
+    Comment = apps.get_model('accounts', 'Comment')
+    CommenterStat = apps.get_model('accounts', 'CommenterStat')
+    rows = (
+        Comment.objects.values('child_id', 'username')
+        .annotate(
+            comment_count=Count('id'),
+            toxic_count=Count('id', filter=Q(sentiment='toxic')),
+            first_seen=Min('created_at'),
+            last_seen=Max('created_at'),
+        )
+        .order_by()
+    )
+    CommenterStat.objects.bulk_create((CommenterStat(**row) for row in rows), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_comment_toxicity_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommenterStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=200)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+                ('toxic_count', models.PositiveIntegerField(default=0)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('child', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commenter_stats', to='accounts.child')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['child', '-toxic_count'], name='commenter_child_toxic_idx')],
+                'unique_together': {('child', 'username')},
+            },
+        ),
+        migrations.RunPython(seed_commenter_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+import re
+
+from django.conf import settings
+from django.db import migrations
+
+FTS_TABLE = 'accounts_comment_fts'
+GIN_INDEX = 'comment_search_gin_idx'
+
+# An FTS5 external-content index over accounts_comment, kept in sync by triggers
+SQLITE_SETUP = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, username, child_id,
+        content='accounts_comment', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON accounts_comment BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text, username, child_id)
+        VALUES (new.id, new.text, new.username, new.child_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON accounts_comment BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, username, child_id)
+        VALUES ('delete', old.id, old.text, old.username, old.child_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF text, username, child_id ON accounts_comment BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, username, child_id)
+        VALUES ('delete', old.id, old.text, old.username, old.child_id);
+        INSERT INTO {FTS_TABLE}(rowid, text, username, child_id)
+        VALUES (new.id, new.text, new.username, new.child_id);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_TEARDOWN = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def postgres_setup():
+    # Must match accounts.search._pg_vector() for queries to use the index
+    config = getattr(settings, 'SEARCH_CONFIG', 'simple')
+    if not re.fullmatch(r"\w+", config):
+        raise ValueError(f"Invalid SEARCH_CONFIG {config!r}")
+    return [
+        f"CREATE INDEX IF NOT EXISTS {GIN_INDEX} ON accounts_comment "
+        f"USING GIN (to_tsvector('{config}', text || ' ' || username))"
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_SETUP
+    elif vendor == 'postgresql':
+        statements = postgres_setup()
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_TEARDOWN
+    elif vendor == 'postgresql':
+        statements = [f"DROP INDEX IF EXISTS {GIN_INDEX}"]
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_commenterstat'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
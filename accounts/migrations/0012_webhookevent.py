@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_comment_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('instagram_user_id', models.CharField(max_length=100)),
+                ('media_id', models.CharField(blank=True, max_length=200)),
+                ('comment_id', models.CharField(max_length=200)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='webhook_queue_idx')],
+            },
+        ),
+    ]
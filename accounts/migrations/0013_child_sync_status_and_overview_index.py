@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='child',
+            name='last_sync_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='child',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['child', 'sentiment'], name='comment_child_sentiment_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_child_soft_delete'),
+    ]
+
+    operations = [
+        # The default is applied in Python, so the column itself is unchanged.
+        # Altering it on SQLite would rebuild accounts_comment and drop the
+        # full-text search triggers migration 0010 put on it.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='comment',
+                    name='created_at',
+                    field=models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+    ]
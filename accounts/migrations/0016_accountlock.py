@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_comment_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('token', models.CharField(max_length=32)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
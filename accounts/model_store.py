@@ -0,0 +1,191 @@
+"""
+Local store for the classifier models.
+
+`manage.py fetch_models` downloads each model at its pinned revision, saves
+it as safetensors under MODEL_STORE_DIR and records the resolved commit and
+a sha256 for every file in manifest.json. At runtime the models are loaded
+from that directory with local_files_only, so process start makes no
+network calls and always gets the same weights (safetensors are memory
+mapped, which also makes cold start faster).
+
+Without a store the models are pulled from the Hugging Face hub at their
+pinned revision, unless MODEL_STORE_REQUIRED is set.
+"""
+import hashlib
+import json
+import logging
+import re
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# Store name -> Hugging Face repo
+MODELS = {
+    'sentiment': 'cardiffnlp/twitter-roberta-base-sentiment-latest',
+    'toxicity': 'unitary/toxic-bert',
+}
+
+MANIFEST = 'manifest.json'
+
+COMMIT_HASH = re.compile(r"[0-9a-f]{40}")
+
+
+class ModelStoreError(Exception):
+    pass
+
+
+def store_dir():
+    return Path(getattr(settings, 'MODEL_STORE_DIR', Path(settings.BASE_DIR) / 'model_store'))
+
+
+def is_commit(revision):
+    return bool(revision) and COMMIT_HASH.fullmatch(revision) is not None
+
+
+def configured_revision(name):
+    return getattr(settings, 'MODEL_REVISIONS', {}).get(name, 'main')
+
+
+def pinned_revision(name):
+    """
+    The revision to fetch: MODEL_REVISIONS[name] when it is a commit hash.
+    A branch or tag moves, so once the store holds the model, the commit it
+    resolved to is reused; fetch_models --update moves to the new tip.
+    """
+    revision = configured_revision(name)
+    if is_commit(revision):
+        return revision
+    entry = read_manifest().get(name) or {}
+    if entry.get('requested_revision') == revision and is_commit(entry.get('revision')):
+        return entry['revision']
+    return revision
+
+
+def read_manifest():
+    path = store_dir() / MANIFEST
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def write_manifest(manifest):
+    path = store_dir() / MANIFEST
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp.replace(path)
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_files(directory):
+    directory = Path(directory)
+    return {
+        str(path.relative_to(directory)): file_sha256(path)
+        for path in sorted(directory.rglob('*'))
+        if path.is_file()
+    }
+
+
+def fetch(name, revision=None, update=False):
+    """
+    Download one model at `revision` (default: its pinned revision, or with
+    `update` the current tip of the configured branch), save it as
+    safetensors in the store and record it in the manifest. Returns the
+    manifest entry.
+    """
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    repo = MODELS[name]
+    requested = revision or configured_revision(name)
+    revision = revision or (requested if update else pinned_revision(name))
+    if not is_commit(revision):
+        logger.warning("Fetching '%s' at %r, which is not a commit hash; pin it in MODEL_REVISIONS", name, revision)
+    target = store_dir() / name
+    staging = store_dir() / f"{name}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(repo, revision=revision, use_fast=True)
+    model = AutoModelForSequenceClassification.from_pretrained(repo, revision=revision)
+    tokenizer.save_pretrained(staging)
+    model.save_pretrained(staging, safe_serialization=True)
+
+    # Swap the new files in whole, so no stale file from an older revision survives
+    shutil.rmtree(target, ignore_errors=True)
+    staging.rename(target)
+
+    entry = {
+        'repo': repo,
+        # What was asked for; pinned_revision() reuses the commit only for the same request
+        'requested_revision': requested,
+        # The commit the hub resolved the revision to
+        'revision': getattr(model.config, '_commit_hash', None) or revision,
+        'files': hash_files(target),
+    }
+    manifest = read_manifest()
+    manifest[name] = entry
+    write_manifest(manifest)
+    return entry
+
+
+def verify(name):
+    """
+    Check a stored model against the manifest. Returns a list of problems
+    (missing, changed or unexpected files); empty when the store is intact.
+    """
+    entry = read_manifest().get(name)
+    if entry is None:
+        return [f"{name} is not in {store_dir() / MANIFEST}"]
+    directory = store_dir() / name
+    actual = hash_files(directory) if directory.exists() else {}
+    problems = []
+    for filename, digest in entry['files'].items():
+        if filename not in actual:
+            problems.append(f"{name}/{filename} is missing")
+        elif actual[filename] != digest:
+            problems.append(f"{name}/{filename} does not match its recorded sha256")
+    for filename in actual.keys() - entry['files'].keys():
+        problems.append(f"{name}/{filename} is not in the manifest")
+    return problems
+
+
+def load(name):
+    """
+    (tokenizer, model) for a store name, in eval mode. Loads from the local
+    store when the model is there, else from the hub at the pinned revision.
+    """
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    entry = read_manifest().get(name)
+    if entry is not None:
+        if getattr(settings, 'MODEL_STORE_VERIFY_ON_LOAD', False):
+            problems = verify(name)
+            if problems:
+                raise ModelStoreError("; ".join(problems))
+        source = str(store_dir() / name)
+        tokenizer_options = {'local_files_only': True}
+        model_options = {'local_files_only': True, 'use_safetensors': True}
+    elif getattr(settings, 'MODEL_STORE_REQUIRED', False):
+        raise ImproperlyConfigured(
+            f"Model '{name}' is not in the model store at {store_dir()}; run `python manage.py fetch_models`"
+        )
+    else:
+        logger.warning("Model '%s' is not in the local store; loading it from the hub", name)
+        source = MODELS[name]
+        tokenizer_options = model_options = {'revision': pinned_revision(name)}
+
+    # use_fast=True picks the Rust tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(source, use_fast=True, **tokenizer_options)
+    model = AutoModelForSequenceClassification.from_pretrained(source, **model_options)
+    model.eval()
+    return tokenizer, model
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class InstagramChild(models.Model):
@@ -15,10 +16,19 @@ class InstagramChild(models.Model):
         return f"{self.username} (Instagram Child)"
 
 
+class ChildManager(models.Manager):
+    """Children that haven't been deleted (see accounts/purge.py)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Child(models.Model):
     """
     Stores actual children linked to parents.
     Initially instagram_user_id and access_token can be blank until verified.
+    Deleting a child only marks it deleted; its comments are purged in the
+    background and the row is kept as a record of the purge.
     """
     parent = models.ForeignKey(User, on_delete=models.CASCADE, related_name='children')
     username = models.CharField(max_length=100)
@@ -26,13 +36,49 @@ class Child(models.Model):
     access_token = models.TextField(blank=True, null=True)
     consent_given = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever this child or its comments change; part of the
+    # dashboard response cache key and ETag.
+    data_version = models.PositiveIntegerField(default=0)
+    # Outcome of the last Graph fetch of this child's account
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_sync_error = models.TextField(blank=True, default='')
+    # Soft deletion and the background purge's progress
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    purge_total = models.PositiveIntegerField(null=True, blank=True)  # Rows to purge, counted by the purge
+    purged_rows = models.PositiveIntegerField(default=0)
+    purged_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ChildManager()
+    all_objects = models.Manager()
 
     class Meta:
-        unique_together = ['username', 'parent']
+        constraints = [
+            # A deleted child's username can be added again straight away
+            models.UniqueConstraint(
+                fields=['username', 'parent'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='child_unique_active_username',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.username} (Child of {self.parent.username})"
 
+    def save(self, *args, **kwargs):
+        if not self.pk:
+            return super().save(*args, **kwargs)
+        # Increment in SQL so a concurrent bump_versions() isn't lost
+        self.data_version = models.F('data_version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'data_version'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['data_version'])
+
+    @classmethod
+    def bump_versions(cls, child_ids):
+        """Invalidate cached responses for these children."""
+        cls.objects.filter(pk__in=child_ids).update(data_version=models.F('data_version') + 1)
+
 
 class Comment(models.Model):
     """
@@ -55,8 +101,138 @@ class Comment(models.Model):
         ],
         default='neutral'
     )
+    # Passed toxicity screening but still waiting for the low-priority
+    # sentiment lane; sentiment is a provisional 'neutral' until then.
+    sentiment_pending = models.BooleanField(default=False)
+    # toxic-bert's six probabilities ({'toxic': 0.91, 'threat': 0.02, ...});
+    # null when the rule-based pre-check labeled the comment.
+    toxicity_scores = models.JSONField(null=True, blank=True)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # When the comment was ingested; backfilled history keeps the time
+    # Graph says it was posted, so retention and daily stats date it right
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Dashboard reads and retention compaction both range over
+            # one child's comments by time
+            models.Index(fields=['child', 'created_at'], name='comment_child_created_idx'),
+            # Per-child toxic counts for the children overview
+            models.Index(fields=['child', 'sentiment'], name='comment_child_sentiment_idx'),
+            # Admin changelist filters, newest first
+            models.Index(fields=['sentiment', '-id'], name='comment_sentiment_idx'),
+            models.Index(fields=['created_at'], name='comment_created_idx'),
+            # The sentiment lane's queue; stays tiny, so only pending rows are indexed
+            models.Index(
+                fields=['id'],
+                condition=models.Q(sentiment_pending=True),
+                name='comment_sentiment_pending_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.username}: {self.text[:30]}"
+
+
+class CommenterStat(models.Model):
+    """
+    Rolling statistics for one commenter on one child's account, updated
+    incrementally as comments are ingested. Unique per (child, username),
+    so the ingestion path looks commenters up by index.
+    """
+    child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name="commenter_stats")
+    username = models.CharField(max_length=200)
+    comment_count = models.PositiveIntegerField(default=0)
+    toxic_count = models.PositiveIntegerField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['child', 'username']
+        indexes = [
+            # The parent's "worst commenters" list
+            models.Index(fields=['child', '-toxic_count'], name='commenter_child_toxic_idx'),
+        ]
+
+    @property
+    def toxic_rate(self):
+        return self.toxic_count / self.comment_count if self.comment_count else 0.0
+
+    def __str__(self):
+        return f"{self.username} on {self.child.username}: {self.toxic_count}/{self.comment_count} toxic"
+
+
+class CommentDailyStat(models.Model):
+    """
+    Per-day sentiment counts for comments whose raw text has been
+    compacted away by the retention policy.
+    """
+    child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name="daily_stats")
+    date = models.DateField()
+    sentiment = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['child', 'date', 'sentiment']
+
+    def __str__(self):
+        return f"{self.child.username} {self.date} {self.sentiment}: {self.count}"
+
+
+class RetentionPolicy(models.Model):
+    """
+    How long raw comment text is kept before being rolled into
+    CommentDailyStat. A policy with no parent applies to everyone
+    without their own policy (overriding COMMENT_RETENTION_DAYS).
+    """
+    parent = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name='retention_policy', null=True, blank=True
+    )
+    raw_retention_days = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name_plural = 'retention policies'
+
+    def __str__(self):
+        scope = self.parent.username if self.parent else 'global'
+        return f"{scope}: keep {self.raw_retention_days} days"
+
+
+class WebhookEvent(models.Model):
+    """
+    One Instagram `comments` change notification. The webhook receiver only
+    stores these; the webhook worker classifies, stores and alerts on them
+    off the request path (see accounts/webhooks.py).
+    """
+    instagram_user_id = models.CharField(max_length=100)
+    media_id = models.CharField(max_length=200, blank=True)
+    comment_id = models.CharField(max_length=200)
+    payload = models.JSONField()  # The change's `value` as Instagram sent it
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's queue: unprocessed events, oldest first
+            models.Index(fields=['processed_at', 'id'], name='webhook_queue_idx'),
+        ]
+
+    def __str__(self):
+        state = 'processed' if self.processed_at else 'pending'
+        return f"{self.instagram_user_id}/{self.comment_id} ({state})"
+
+
+class AccountLock(models.Model):
+    """
+    A held per-account fetch lock, on databases without advisory locks (see
+    accounts/coalescing.py). The unique key makes taking it one INSERT that
+    only one caller can win.
+    """
+    key = models.CharField(max_length=200, unique=True)
+    token = models.CharField(max_length=32)
+    expires_at = models.DateTimeField()  # A lock left by a dead worker is taken over after this
+
+    def __str__(self):
+        return f"{self.key} until {self.expires_at}"
@@ -0,0 +1,154 @@
+"""
+Opt-in profiling for management commands and API requests.
+
+A profile captures a cProfile (or pyinstrument, if installed) trace plus every
+SQL query run, and is saved under settings.PROFILING_DIR as a `.prof`/`.html`
+file and a `.json` summary. Queries repeated many times with the same SQL
+shape are listed as likely N+1 patterns.
+"""
+import cProfile
+import json
+import re
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover - optional dependency
+    pyinstrument = None
+
+# Same SQL run this many times in one profile is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def profiling_dir():
+    path = Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'profiles'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _sql_shape(sql):
+    """Replace literals so queries that differ only by parameters group together."""
+    return _LITERALS.sub('?', sql)
+
+
+class QueryRecorder:
+    """Connection execute wrapper that records each query and its duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def summary(self):
+        shapes = Counter(_sql_shape(sql) for sql, _ in self.queries)
+        return {
+            'query_count': len(self.queries),
+            'query_time_s': sum(duration for _, duration in self.queries),
+            'repeated_queries': [
+                {'sql': sql, 'count': count}
+                for sql, count in shapes.most_common()
+                if count >= N_PLUS_ONE_THRESHOLD
+            ],
+        }
+
+
+class Profile:
+    """
+    Context manager that profiles the enclosed block and counts its queries.
+    Call save() afterwards to write the results.
+    """
+
+    def __init__(self, name, fmt='cprofile'):
+        if fmt == 'pyinstrument' and pyinstrument is None:
+            raise RuntimeError("pyinstrument is not installed")
+        self.name = re.sub(r'[^\w.-]+', '_', name).strip('_') or 'profile'
+        self.fmt = fmt
+        self.queries = QueryRecorder()
+        self.elapsed = 0.0
+        self._profiler = None
+        self._wrapper = None
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self.queries)
+        self._wrapper.__enter__()
+        self._profiler = pyinstrument.Profiler() if self.fmt == 'pyinstrument' else cProfile.Profile()
+        self._start = time.perf_counter()
+        if self.fmt == 'pyinstrument':
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.fmt == 'pyinstrument':
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+        self.elapsed = time.perf_counter() - self._start
+        self._wrapper.__exit__(*exc)
+
+    def save(self, extra=None):
+        """Write the trace and a JSON summary; return the summary."""
+        stem = profiling_dir() / f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}"
+        if self.fmt == 'pyinstrument':
+            trace_path = stem.with_suffix('.html')
+            trace_path.write_text(self._profiler.output_html())
+        else:
+            trace_path = stem.with_suffix('.prof')
+            self._profiler.dump_stats(str(trace_path))
+
+        summary = {
+            'name': self.name,
+            'elapsed_s': self.elapsed,
+            'trace': str(trace_path),
+            **self.queries.summary(),
+            **(extra or {}),
+        }
+        stem.with_suffix('.json').write_text(json.dumps(summary, indent=2))
+        return summary
+
+
+class ProfiledCommand(BaseCommand):
+    """
+    BaseCommand that adds --profile and --profile-format to any command.
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument('--profile', action='store_true', help='Profile this run and save the results')
+        parser.add_argument(
+            '--profile-format',
+            choices=['cprofile', 'pyinstrument'],
+            default='cprofile',
+            help='Profiler to use with --profile'
+        )
+        return parser
+
+    def execute(self, *args, **options):
+        if not options.get('profile'):
+            return super().execute(*args, **options)
+
+        name = f"command-{self.__module__.rsplit('.', 1)[-1]}"
+        with Profile(name, options.get('profile_format', 'cprofile')) as profile:
+            output = super().execute(*args, **options)
+        summary = profile.save()
+        self.stderr.write(
+            f"Profile saved to {summary['trace']} "
+            f"({summary['query_count']} queries, {summary['elapsed_s']:.2f}s)"
+        )
+        for repeated in summary['repeated_queries']:
+            self.stderr.write(f"  possible N+1 ({repeated['count']}x): {repeated['sql'][:160]}")
+        return output
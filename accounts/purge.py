@@ -0,0 +1,168 @@
+"""
+Background purge of deleted children.
+
+Deleting a child used to remove its whole comment history inside the
+request. Django's collector loads every row and deletes them in one
+transaction, which blocks the worker and, on SQLite, every other writer.
+Now delete_child only marks the child deleted: Child.objects hides it at
+once and its access token is dropped so nothing fetches for it again. The
+purge then removes its comments, commenter stats and daily stats in
+bounded raw DELETE batches, one short transaction each, recording progress
+on the child row. The row itself is kept, with purged_at set, as the
+record that the purge finished.
+
+PURGE_WORKER picks who runs the purge:
+  'thread'  - a background thread in the web process, woken by delete_child
+              and at startup
+  'command' - `manage.py purge_children`, run by cron or a worker process
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Child, Comment, CommenterStat, CommentDailyStat
+
+logger = logging.getLogger(__name__)
+
+# Purged in this order; comments first, as they are nearly all of it
+PURGED_MODELS = (Comment, CommenterStat, CommentDailyStat)
+
+
+def worker_mode():
+    return getattr(settings, 'PURGE_WORKER', 'thread')
+
+
+def soft_delete(child):
+    """Hide a child at once and queue its data for the purge."""
+    Child.all_objects.filter(pk=child.pk).update(
+        deleted_at=timezone.now(),
+        access_token=None,
+        data_version=F('data_version') + 1,
+    )
+    notify()
+
+
+def lock_active(child):
+    """
+    Lock the child's row until the current transaction ends; False if it was
+    deleted. Ingestion holds it while storing a child's rows, so a concurrent
+    soft_delete() waits for them and the purge finds them.
+    """
+    return bool(Child.objects.select_for_update().filter(pk=child.pk).values_list('pk', flat=True))
+
+
+def pending_children():
+    return Child.all_objects.filter(deleted_at__isnull=False, purged_at__isnull=True)
+
+
+def purge_child(child, batch_size=None, pause=None, progress=None):
+    """
+    Delete a deleted child's rows in batches of `batch_size`, sleeping
+    `pause` seconds between batches. Returns the number of rows deleted.
+    """
+    batch_size = batch_size or getattr(settings, 'PURGE_BATCH_SIZE', 1000)
+    pause = getattr(settings, 'PURGE_PAUSE', 0.05) if pause is None else pause
+
+    if child.purge_total is None:
+        # Counted here rather than in the request; each count is an index range
+        child.purge_total = sum(model.objects.filter(child_id=child.pk).count() for model in PURGED_MODELS)
+        Child.all_objects.filter(pk=child.pk).update(purge_total=child.purge_total)
+
+    deleted = 0
+    # Until a pass finds nothing: rows stored by a command that raced the
+    # deletion would otherwise outlive the purge
+    while True:
+        before = deleted
+        for model in PURGED_MODELS:
+            rows = model.objects.filter(child_id=child.pk).order_by('pk').values_list('pk', flat=True)
+            while True:
+                ids = list(rows[:batch_size])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    # Nothing references these rows, so skip the collector
+                    # and issue a plain DELETE ... WHERE id IN (...)
+                    model.objects.filter(pk__in=ids)._raw_delete(model.objects.db)
+                    Child.all_objects.filter(pk=child.pk).update(purged_rows=F('purged_rows') + len(ids))
+                deleted += len(ids)
+                if progress:
+                    progress(child, deleted)
+                if pause:
+                    time.sleep(pause)
+        if deleted == before:
+            break
+
+    Child.all_objects.filter(pk=child.pk).update(purged_at=timezone.now())
+    logger.info(
+        "Purged %s rows of deleted child %s", deleted, child.pk,
+        extra={'event': 'child_purged', 'child_id': child.pk, 'rows': deleted},
+    )
+    return deleted
+
+
+def purge_pending(batch_size=None, pause=None, progress=None):
+    """Purge every deleted child, oldest deletion first. Returns the rows deleted."""
+    deleted = 0
+    for child in pending_children().order_by('deleted_at'):
+        deleted += purge_child(child, batch_size=batch_size, pause=pause, progress=progress)
+    return deleted
+
+
+def purge_status(child):
+    """Progress of a deleted child's purge, for the API."""
+    if child.purged_at is not None:
+        state = 'purged'
+    elif child.purge_total is None:
+        state = 'queued'
+    else:
+        state = 'purging'
+    return {
+        'child_id': child.pk,
+        'username': child.username,
+        'status': state,
+        'deleted_at': child.deleted_at,
+        'purged_at': child.purged_at,
+        'rows_total': child.purge_total,
+        'rows_purged': child.purged_rows,
+    }
+
+
+class PurgeWorker:
+    """Background thread that purges deleted children; wake() after each deletion."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='child-purge', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            self._event.clear()
+            try:
+                purge_pending()
+            except Exception:
+                logger.exception("Child purge failed")
+            finally:
+                connections.close_all()
+
+
+worker = PurgeWorker()
+
+
+def notify():
+    """Tell the worker a child was deleted (only 'thread' mode purges in-process)."""
+    if worker_mode() == 'thread':
+        worker.wake()
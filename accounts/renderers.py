@@ -0,0 +1,45 @@
+import datetime
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class _Encoder(JSONEncoder):
+    """DRF's encoder, but datetimes keep isoformat()'s +00:00 like orjson."""
+
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+def _default(obj):
+    # Types orjson doesn't know natively (Decimal, lazy strings, querysets...)
+    return _Encoder().default(obj)
+
+
+def dumps(data):
+    """Serialize to compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, cls=_Encoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson (or the stdlib encoder without it). The
+    browsable API's indented output still goes through DRF's renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
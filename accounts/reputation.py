@@ -0,0 +1,120 @@
+"""
+Commenter reputation.
+
+CommenterStat keeps per-commenter counts for each child's account. They are
+updated with every batch of stored comments, so repeat offenders are known
+without scanning comment history: ingestion looks up the new comments'
+authors with one indexed query and screens (and alerts on) comments from
+known-toxic commenters first.
+
+Reclassifying comments changes toxic counts; rebuild() recomputes the
+stats from the stored comments.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Q
+
+from . import purge
+from .models import Comment, CommenterStat
+
+
+def is_known_toxic(stat):
+    """At least REPUTATION_MIN_TOXIC toxic comments, at REPUTATION_TOXIC_RATE or more."""
+    return (
+        stat.toxic_count >= getattr(settings, 'REPUTATION_MIN_TOXIC', 2)
+        and stat.toxic_rate >= getattr(settings, 'REPUTATION_TOXIC_RATE', 0.5)
+    )
+
+
+def known_toxic(children, usernames):
+    """The usernames that are known-toxic commenters on any of these children."""
+    usernames = set(usernames)
+    if not usernames:
+        return set()
+    stats = CommenterStat.objects.filter(child__in=children, username__in=usernames)
+    return {stat.username for stat in stats if is_known_toxic(stat)}
+
+
+def record(child, comments):
+    """Add newly stored comments to their commenters' stats, in one transaction."""
+    seen = {}
+    for comment in comments:
+        count, toxic, first, last = seen.get(comment.username, (0, 0, comment.created_at, comment.created_at))
+        seen[comment.username] = (
+            count + 1,
+            toxic + (comment.sentiment == 'toxic'),
+            min(first, comment.created_at),
+            max(last, comment.created_at),
+        )
+    if not seen:
+        return
+    try:
+        _add_to_stats(child, seen)
+    except IntegrityError:
+        # A concurrent ingest created some of these commenters' rows first;
+        # they are found (and locked) on the second try
+        _add_to_stats(child, seen)
+
+
+def _add_to_stats(child, seen):
+    with transaction.atomic():
+        if not purge.lock_active(child):
+            return
+        existing = {
+            stat.username: stat
+            for stat in CommenterStat.objects.select_for_update().filter(child=child, username__in=seen)
+        }
+        new = []
+        for username, (count, toxic, first, last) in seen.items():
+            stat = existing.get(username)
+            if stat is None:
+                new.append(CommenterStat(
+                    child=child, username=username, comment_count=count, toxic_count=toxic,
+                    first_seen=first, last_seen=last,
+                ))
+                continue
+            stat.comment_count += count
+            stat.toxic_count += toxic
+            stat.last_seen = max(stat.last_seen, last)
+        CommenterStat.objects.bulk_update(existing.values(), ['comment_count', 'toxic_count', 'last_seen'])
+        CommenterStat.objects.bulk_create(new)
+
+
+def rebuild(child_ids=None):
+    """
+    Recompute stats from stored comments, for some children or all of them.
+    History already compacted by the retention policy is not counted.
+    Returns the number of commenters written.
+    """
+    comments = Comment.objects.all()
+    stats = CommenterStat.objects.all()
+    if child_ids is not None:
+        comments = comments.filter(child_id__in=child_ids)
+        stats = stats.filter(child_id__in=child_ids)
+
+    rows = (
+        comments.values('child_id', 'username')
+        .annotate(
+            comment_count=Count('id'),
+            toxic_count=Count('id', filter=Q(sentiment='toxic')),
+            first_seen=Min('created_at'),
+            last_seen=Max('created_at'),
+        )
+        .order_by()
+    )
+    with transaction.atomic():
+        stats.delete()
+        created = CommenterStat.objects.bulk_create((CommenterStat(**row) for row in rows), batch_size=1000)
+    return len(created)
+
+
+def commenter_dict(stat):
+    return {
+        'username': stat.username,
+        'comment_count': stat.comment_count,
+        'toxic_count': stat.toxic_count,
+        'toxic_rate': round(stat.toxic_rate, 4),
+        'known_toxic': is_known_toxic(stat),
+        'first_seen': stat.first_seen,
+        'last_seen': stat.last_seen,
+    }
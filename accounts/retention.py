@@ -0,0 +1,154 @@
+"""
+Retention compaction: roll old comments into CommentDailyStat and delete
+their raw rows in small batches so ingestion is never locked out for long.
+"""
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Child, Comment, CommentDailyStat, RetentionPolicy
+
+# PRAGMA auto_vacuum's value for INCREMENTAL
+SQLITE_INCREMENTAL_VACUUM = 2
+
+
+def retention_cutoffs(now=None):
+    """
+    Return (global_cutoff, {parent_id: cutoff}). A cutoff of None means
+    comments are kept forever.
+    """
+    now = now or timezone.now()
+    global_days = getattr(settings, 'COMMENT_RETENTION_DAYS', None)
+    parent_cutoffs = {}
+    for policy in RetentionPolicy.objects.all():
+        cutoff = now - timedelta(days=policy.raw_retention_days)
+        if policy.parent_id is None:
+            global_days = policy.raw_retention_days
+        else:
+            parent_cutoffs[policy.parent_id] = cutoff
+    global_cutoff = now - timedelta(days=global_days) if global_days is not None else None
+    return global_cutoff, parent_cutoffs
+
+
+def child_cutoff(child, cutoffs=None):
+    """The retention cutoff for one child's comments (None keeps them forever)."""
+    global_cutoff, parent_cutoffs = cutoffs or retention_cutoffs()
+    return parent_cutoffs.get(child.parent_id, global_cutoff)
+
+
+def posted_at(comment):
+    """When Graph says a comment was posted, or None if it doesn't say."""
+    if not comment.get('timestamp'):
+        return None
+    try:
+        posted = parse_datetime(comment['timestamp'])
+    except ValueError:
+        return None
+    if posted is not None and timezone.is_naive(posted):
+        posted = timezone.make_aware(posted, dt_timezone.utc)
+    return posted
+
+
+def expired_on_arrival(comment, cutoff):
+    """
+    Whether a Graph comment was posted before `cutoff`. Compaction has
+    deleted any such comment we stored, and dedup can no longer see it, so
+    ingestion skips these rather than store them (and alert) a second time.
+    Comments without a timestamp (webhook deliveries) are never expired.
+    """
+    if cutoff is None:
+        return False
+    posted = posted_at(comment)
+    return posted is not None and posted < cutoff
+
+
+def expired_comments(now=None):
+    """Queryset of comments older than their parent's (or the global) retention."""
+    global_cutoff, parent_cutoffs = retention_cutoffs(now)
+    expired = Comment.objects.none()
+    for parent_id, cutoff in parent_cutoffs.items():
+        expired |= Comment.objects.filter(child__parent_id=parent_id, created_at__lt=cutoff)
+    if global_cutoff is not None:
+        expired |= Comment.objects.filter(created_at__lt=global_cutoff).exclude(
+            child__parent_id__in=list(parent_cutoffs)
+        )
+    return expired
+
+
+def roll_up(comment_ids):
+    """Add the given comments to CommentDailyStat. Call inside a transaction."""
+    rows = (
+        Comment.objects.filter(id__in=comment_ids)
+        .annotate(date=TruncDate('created_at'))
+        .values('child_id', 'date', 'sentiment')
+        .annotate(n=Count('id'))
+    )
+    for row in rows:
+        stat, created = CommentDailyStat.objects.get_or_create(
+            child_id=row['child_id'],
+            date=row['date'],
+            sentiment=row['sentiment'],
+            defaults={'count': row['n']},
+        )
+        if not created:
+            CommentDailyStat.objects.filter(pk=stat.pk).update(count=F('count') + row['n'])
+
+
+def compact_comments(batch_size=1000, pause=0.1, max_batches=None, dry_run=False, now=None, progress=None):
+    """
+    Roll up and delete expired comments, one batch per transaction, sleeping
+    `pause` seconds between batches. Returns the number of comments compacted.
+    """
+    expired = expired_comments(now).order_by('id').values_list('id', flat=True)
+    if dry_run:
+        return expired.count()
+
+    compacted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(expired[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            roll_up(ids)
+            batch = Comment.objects.filter(id__in=ids)
+            child_ids = set(batch.values_list('child_id', flat=True))
+            batch.delete()
+            Child.bump_versions(child_ids)
+        compacted += len(ids)
+        batches += 1
+        if progress:
+            progress(compacted)
+        if pause:
+            time.sleep(pause)
+    return compacted
+
+
+def vacuum(full=False):
+    """
+    Return freed space to the OS after compaction. On SQLite a full VACUUM
+    rewrites the whole file and blocks writers. It also switches the file
+    to incremental auto-vacuum (new databases start in it, see settings),
+    after which the default run releases free pages without a rewrite; in
+    any other mode it only checkpoints the WAL.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"VACUUM {'FULL ' if full else ''}ANALYZE {Comment._meta.db_table}")
+        elif connection.vendor == 'sqlite':
+            if full:
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('VACUUM')
+            else:
+                cursor.execute('PRAGMA auto_vacuum')
+                if cursor.fetchone()[0] == SQLITE_INCREMENTAL_VACUUM:
+                    # incremental_vacuum frees one page per step; executescript
+                    # steps it to completion, cursor.execute() only once
+                    connection.connection.executescript('PRAGMA incremental_vacuum')
+                cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
@@ -0,0 +1,139 @@
+"""
+Full-text search over comment text and usernames.
+
+SQLite keeps an FTS5 index, accounts_comment_fts, as an external-content
+table over accounts_comment. PostgreSQL gets a GIN index on the comment
+tsvector. Both are created by migration 0010. The FTS5 table is kept in
+sync by triggers, so ingestion, backfill, retention and deletes all update
+it in the same statement as the comment. Results are ranked (bm25 /
+ts_rank) and paginated with LIMIT/OFFSET. Other databases fall back to
+icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+FTS_TABLE = 'accounts_comment_fts'
+GIN_INDEX = 'comment_search_gin_idx'
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def search_config():
+    """PostgreSQL text search configuration; 'simple' doesn't stem, which suits slang."""
+    config = getattr(settings, 'SEARCH_CONFIG', 'simple')
+    if not re.fullmatch(r"\w+", config):
+        raise ValueError(f"Invalid SEARCH_CONFIG {config!r}")
+    return config
+
+
+def _pg_vector(table=''):
+    """
+    The indexed tsvector expression (migration 0010 creates the index on
+    the same one). The config is inlined (not a query parameter) so the
+    planner can match queries to the GIN index.
+    """
+    prefix = f"{table}." if table else ''
+    return f"to_tsvector('{search_config()}', {prefix}text || ' ' || {prefix}username)"
+
+
+def _pg_query():
+    return f"websearch_to_tsquery('{search_config()}', %s)"
+
+
+_fts_ready = False
+
+
+def backend():
+    """'fts5', 'postgres' or None when this database has no full-text index."""
+    global _fts_ready
+    if connection.vendor == 'postgresql':
+        return 'postgres'
+    if connection.vendor != 'sqlite':
+        return None
+    if not _fts_ready:
+        # Checked until the migration has created the table
+        _fts_ready = FTS_TABLE in connection.introspection.table_names()
+    return 'fts5' if _fts_ready else None
+
+
+def fts5_query(query):
+    """
+    User input as an FTS5 expression: every word must match and the last
+    one may be a prefix ("stupi" finds "stupid"). Operators and quotes in
+    the input are treated as plain text.
+    """
+    words = _TOKEN.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    # child_id is only for filtering, never for matching the user's words
+    return f"{{text username}} : ({' '.join(terms)})"
+
+
+def search_ids(query, child_id=None, limit=20, offset=0):
+    """
+    [(comment pk, rank)] for the best matches, best first. Lower ranks are
+    better on SQLite (bm25), higher on PostgreSQL (ts_rank).
+    """
+    kind = backend()
+    if kind == 'fts5':
+        expression = fts5_query(query)
+        if expression is None:
+            return []
+        if child_id is not None:
+            # child_id is indexed too, so the child filter intersects posting lists
+            expression = f'child_id:"{int(child_id)}" AND ({expression})'
+        sql = (
+            f"SELECT rowid, bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s OFFSET %s"
+        )
+        params = [expression, limit, offset]
+    elif kind == 'postgres':
+        where = f"{_pg_vector()} @@ {_pg_query()}"
+        params = [query]
+        if child_id is not None:
+            where += " AND child_id = %s"
+            params.append(child_id)
+        sql = (
+            f"SELECT id, ts_rank({_pg_vector()}, {_pg_query()}) AS rank "
+            f"FROM accounts_comment WHERE {where} ORDER BY rank DESC, id DESC LIMIT %s OFFSET %s"
+        )
+        params = [query] + params + [limit, offset]
+    else:
+        from .models import Comment
+        comments = _icontains(Comment.objects.all(), query)
+        if child_id is not None:
+            comments = comments.filter(child_id=child_id)
+        ids = comments.order_by('-created_at').values_list('id', flat=True)[offset:offset + limit]
+        return [(pk, 0.0) for pk in ids]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def filter_queryset(queryset, query):
+    """Narrow a Comment queryset to full-text matches (unranked), e.g. for the admin."""
+    kind = backend()
+    if kind == 'fts5':
+        expression = fts5_query(query)
+        if expression is None:
+            return queryset
+        return queryset.extra(
+            where=[f"accounts_comment.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)"],
+            params=[expression],
+        )
+    if kind == 'postgres':
+        return queryset.extra(
+            where=[f"{_pg_vector('accounts_comment')} @@ {_pg_query()}"],
+            params=[query],
+        )
+    return _icontains(queryset, query)
+
+
+def _icontains(queryset, query):
+    return queryset.filter(Q(text__icontains=query) | Q(username__icontains=query))
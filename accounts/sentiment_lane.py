@@ -0,0 +1,113 @@
+"""
+Low-priority sentiment lane.
+
+Ingestion only runs the toxicity screen before storing comments, so toxic
+ones are alerted on straight away. Comments that pass the screen are stored
+with sentiment_pending=True (a provisional 'neutral') and labeled here
+later, in large batches, off the request path.
+
+SENTIMENT_LANE picks who drains the queue:
+  'thread'  - a background thread in the web process, woken after ingestion
+  'command' - `manage.py label_sentiment`, run by cron or a worker process
+  'inline'  - no deferral; ingestion labels sentiment itself
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .metrics import count_comments, observe_timings
+from .models import Child, Comment
+
+logger = logging.getLogger(__name__)
+
+
+def lane_mode():
+    return getattr(settings, 'SENTIMENT_LANE', 'thread')
+
+
+def deferred():
+    """Whether ingestion should leave sentiment to this lane."""
+    return lane_mode() != 'inline'
+
+
+def pending_comments():
+    return Comment.objects.filter(sentiment_pending=True)
+
+
+def label_pending(batch_size=None, max_batches=None, progress=None):
+    """
+    Label pending comments, oldest first, one batch per transaction.
+    Returns the number of comments labeled.
+    """
+    from .utils import label_sentiment
+
+    batch_size = batch_size or getattr(settings, 'SENTIMENT_LANE_BATCH_SIZE', 256)
+    labeled = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = list(pending_comments().order_by('id').values_list('id', 'text', 'child_id')[:batch_size])
+        if not rows:
+            break
+        timings = {}
+        sentiments = label_sentiment([text for _, text, _ in rows], timings=timings)
+
+        by_label = {}
+        for (pk, _, _), sentiment in zip(rows, sentiments):
+            by_label.setdefault(sentiment, []).append(pk)
+        with transaction.atomic():
+            for sentiment, ids in by_label.items():
+                # A reclassification may have labeled the row meanwhile
+                pending_comments().filter(id__in=ids).update(sentiment=sentiment, sentiment_pending=False)
+                count_comments(sentiment, len(ids))
+            Child.bump_versions({child_id for _, _, child_id in rows})
+        observe_timings('sentiment_lane', timings)
+
+        labeled += len(rows)
+        batches += 1
+        if progress:
+            progress(labeled)
+    return labeled
+
+
+class SentimentLane:
+    """
+    Background thread that drains the pending queue. wake() is cheap and
+    safe to call after every ingestion; the thread waits SENTIMENT_LANE_DELAY
+    seconds first so bursts are labeled in full batches.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sentiment-lane', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            time.sleep(getattr(settings, 'SENTIMENT_LANE_DELAY', 1.0))
+            self._event.clear()
+            try:
+                label_pending()
+            except Exception:
+                logger.exception("Sentiment lane failed")
+            finally:
+                connections.close_all()
+
+
+lane = SentimentLane()
+
+
+def notify():
+    """Tell the lane new comments are waiting (only 'thread' mode drains in-process)."""
+    if lane_mode() == 'thread':
+        lane.wake()
@@ -0,0 +1,111 @@
+"""
+Fast comment serialization for the dashboard endpoints: rows are read with
+values_list() (no model instances) and turned into the API's dicts directly.
+Large result sets are streamed as a JSON array in chunks.
+"""
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+from .renderers import dumps
+
+COMMENT_COLUMNS = (
+    'id', 'comment_id', 'text', 'sentiment', 'created_at', 'username', 'post_id', 'sentiment_pending',
+    'toxicity_scores',
+)
+
+# Placeholder until a real confidence score is stored
+CONFIDENCE = 0.85
+
+
+def comment_rows(queryset, id_field='comment_id', chunk_size=None):
+    """
+    Yield API dicts for the comments in `queryset`. `id_field` picks what the
+    payload's `id` is (the Instagram comment_id or the database pk).
+    created_at stays a datetime; the JSON encoder formats it.
+    """
+    rows = queryset.values_list(*COMMENT_COLUMNS)
+    if chunk_size:
+        rows = rows.iterator(chunk_size=chunk_size)
+    use_pk = id_field == 'id'
+    for values in rows:
+        yield _comment_dict(values, use_pk)
+
+
+async def acomment_rows(queryset, id_field='comment_id', chunk_size=2000):
+    """
+    Async comment_rows() for the ASGI views. Chunks are pulled on Django's
+    sync thread, as aiterator() does (which can't run values_list() here).
+    """
+    rows = comment_rows(queryset, id_field=id_field, chunk_size=chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while True:
+        chunk = await next_chunk()
+        if not chunk:
+            break
+        for row in chunk:
+            yield row
+
+
+def _comment_dict(values, use_pk):
+    pk, comment_id, text, sentiment, created_at, username, post_id, sentiment_pending, toxicity_scores = values
+    return {
+        'id': pk if use_pk else comment_id,
+        'text': text,
+        'sentiment': sentiment,
+        'sentiment_pending': sentiment_pending,
+        'toxicity_scores': toxicity_scores,
+        'confidence': CONFIDENCE,
+        'created_at': created_at,
+        'instagram_id': comment_id,
+        'username': username,
+        'post_id': post_id,
+    }
+
+
+def stream_json_array(rows, batch=500):
+    """Encode an iterable of dicts as a JSON array, `batch` items per chunk."""
+    yield b'['
+    first = True
+    pending = []
+    for row in rows:
+        pending.append(dumps(row))
+        if len(pending) >= batch:
+            yield (b',' if not first else b'') + b','.join(pending)
+            first = False
+            pending = []
+    if pending:
+        yield (b',' if not first else b'') + b','.join(pending)
+    yield b']'
+
+
+async def astream_json_array(rows, batch=500):
+    """stream_json_array() over an async iterable."""
+    yield b'['
+    first = True
+    pending = []
+    async for row in rows:
+        pending.append(dumps(row))
+        if len(pending) >= batch:
+            yield (b',' if not first else b'') + b','.join(pending)
+            first = False
+            pending = []
+    if pending:
+        yield (b',' if not first else b'') + b','.join(pending)
+    yield b']'
+
+
+def streaming_comments_response(queryset, id_field='comment_id', chunk_size=2000, headers=None, use_async=False):
+    """
+    Stream the comments as a JSON array. With use_async the rows are read
+    with the async ORM, so an ASGI server streams them without a thread.
+    """
+    if use_async:
+        content = astream_json_array(acomment_rows(queryset, id_field=id_field, chunk_size=chunk_size))
+    else:
+        content = stream_json_array(comment_rows(queryset, id_field=id_field, chunk_size=chunk_size))
+    response = StreamingHttpResponse(content, content_type='application/json')
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
@@ -3,12 +3,28 @@ from django.contrib.auth.models import User
 from .models import Child, Comment # Make sure to import the Comment model
 
 # This serializer is for displaying and creating Child accounts.
+# The access token never leaves the server.
 class ChildSerializer(serializers.ModelSerializer):
+    # Overview columns, annotated by the list view's query (zero/None for a new child)
+    comment_count = serializers.IntegerField(read_only=True, default=0)
+    toxic_count = serializers.IntegerField(read_only=True, default=0)
+    last_comment_at = serializers.DateTimeField(read_only=True, default=None)
+    last_sync_status = serializers.SerializerMethodField()
+
     class Meta:
         model = Child
-        fields = ['id', 'instagram_user_id', 'username', 'access_token', 'consent_given']
+        fields = [
+            'id', 'instagram_user_id', 'username', 'consent_given',
+            'comment_count', 'toxic_count', 'last_comment_at',
+            'last_synced_at', 'last_sync_status', 'last_sync_error',
+        ]
         # These fields are read-only because they are set by the Instagram API, not the parent.
-        read_only_fields = ['id', 'instagram_user_id', 'access_token']
+        read_only_fields = ['id', 'instagram_user_id', 'last_synced_at', 'last_sync_error']
+
+    def get_last_sync_status(self, child):
+        if child.last_synced_at is None:
+            return 'never'
+        return 'error' if child.last_sync_error else 'ok'
 
 # This serializer is for handling new parent signups.
 class ParentSignupSerializer(serializers.ModelSerializer):
@@ -1,70 +1,459 @@
+import asyncio
+import time
+import weakref
+
 import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
 from .models import Child, Comment
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from .utils import classify_comment
+from .utils import classify_comments, score_toxicity, is_threat, timed, merge_timings
+from .metrics import (
+    observe_timings, observe_time_to_alert, count_alert, count_comments, correlation_id, new_correlation_id,
+)
+from .coalescing import FETCHED, REUSED, coalesced, acoalesced, renew_lock
+from . import purge, raids, reputation, retention, sentiment_lane
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
 
-def fetch_comments_for_child(child: Child):
+_graph_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+def fetch_comments_for_child(child: Child, timings=None, poll=False):
     """
     Fetches Instagram comments for a single child using stored insta_id and token.
     Avoids duplicates in DB and classifies comments before saving.
+    If `timings` is a dict, seconds spent per stage are added to it.
+
+    Fetches are single-flight per Instagram account: a caller arriving while
+    the account is being fetched waits and shares that result (marked
+    "coalesced"), and every child watching the account is updated. A
+    recent result reused without fetching is coalesced too, with no new
+    comments or alerts. `poll` marks the dashboard's background fetch-all,
+    which may reuse results for longer (see coalescing.fetch_interval()).
     """
+    # Jobs outside a request still get a correlation ID for their logs
+    token = correlation_id.set(correlation_id.get() or new_correlation_id())
+    stage_timings = {}
+    try:
+        with timed(stage_timings, 'total'):
+            result = _fetch_comments_for_child(child, stage_timings, poll)
+        observe_timings('ingest', stage_timings)
+    finally:
+        correlation_id.reset(token)
+    merge_timings(timings, stage_timings)
+    return result
+
+
+def _fetch_comments_for_child(child, timings, poll=False):
     if not child.instagram_user_id or not child.access_token:
         return {"error": "Missing Instagram ID or access token"}
+    result, source = coalesced(
+        child.instagram_user_id, lambda: record_sync(child, _fetch_account_comments(child, timings)), poll
+    )
+    return _child_result(result, child, source)
 
-    url = f"https://graph.facebook.com/v23.0/{child.instagram_user_id}/media"
+
+def _fetch_account_comments(child, timings):
+    url = f"{settings.GRAPH_API_URL}/v23.0/{child.instagram_user_id}/media"
     params = {
         "fields": "id,caption,comments{id,text,username,timestamp}",
         "access_token": child.access_token
     }
     
     try:
-        resp = requests.get(url, params=params, timeout=30)
+        with timed(timings, 'graph_api'):
+            resp = requests.get(url, params=params, timeout=30)
         if resp.status_code != 200:
             return {"error": f"API Error {resp.status_code}: {resp.text}"}
+        ingested_at = time.monotonic()
 
         data = resp.json()
 
         if "data" not in data:
             return {"error": "No media found"}
 
-        new_comments_count = 0
-        total_comments_processed = 0
-
-        for media in data["data"]:
-            if "comments" in media:
-                for comment in media["comments"]["data"]:
-                    total_comments_processed += 1
-                    # Check if comment exists for this specific child only
-                    if not Comment.objects.filter(comment_id=comment["id"], child=child).exists():
-                        # New comment for this child, classify sentiment
-                        sentiment = classify_comment(comment["text"])
-                        
-                        # Create the comment
-                        new_comment = Comment.objects.create(
-                            child=child,
-                            comment_id=comment["id"],
-                            post_id=media["id"],
-                            text=comment["text"],
-                            username=comment["username"],
-                            sentiment=sentiment
-                        )
-                        new_comments_count += 1
-                        
-                        # Send email alert if toxic comment detected
-                        if sentiment == "toxic":
-                            from .email_service import send_toxic_comment_alert
-                            send_toxic_comment_alert(new_comment, child, child.parent)
-
-        return {
-            "success": True, 
-            "new_comments": new_comments_count,
-            "total_comments_processed": total_comments_processed,
-            "message": f"Processed {total_comments_processed} comments, added {new_comments_count} new ones"
-        }
-        
+        return ingest_account_comments(account_children(child), _media_comments(data), ingested_at, timings)
+
     except requests.exceptions.Timeout:
         return {"error": "Request timeout - Instagram API might be slow"}
     except requests.exceptions.RequestException as e:
         return {"error": f"Request failed: {str(e)}"}
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}"}
+
+
+
+def ingest_account_comments(children, media_comments, ingested_at, timings=None):
+    """
+    Store an account's (media_id, comment) pairs for every child watching
+    it: drop known comments, screen the rest once and alert. Shared by the
+    Graph fetch and the webhook worker; callers hold the account lock, which
+    is renewed after each stage. `ingested_at` is the time.monotonic() the
+    comments arrived.
+    """
+    instagram_user_id = children[0].instagram_user_id
+    lock_key = f"ig:{instagram_user_id}"
+
+    # Check which comments are new, for each child watching this account
+    with timed(timings, 'dedup'):
+        pending_by_child = _pending_by_child(children, media_comments)
+
+    new_by_child = dict.fromkeys((c.id for c in children), 0)
+    alerts_sent = 0
+    # Screen every new comment once; known-toxic commenters' go first
+    for phase in _screening_phases(children, pending_by_child, timings):
+        ids, texts = _texts_to_classify(phase)
+        labels, scores, clusters = _screen_account(instagram_user_id, texts, timings)
+        screened = dict(zip(ids, zip(labels, scores)))
+        # A large first fetch can screen and alert for longer than FETCH_LOCK_TIMEOUT
+        renew_lock(lock_key)
+
+        saved, alerts = _store_for_children(
+            children, phase, screened, ingested_at, timings, clusters=dict(zip(ids, clusters))
+        )
+        _add_counts(new_by_child, saved)
+        alerts_sent += alerts
+        renew_lock(lock_key)
+    return _account_result(media_comments, pending_by_child, new_by_child, alerts_sent)
+
+
+async def afetch_comments_for_child(child: Child, timings=None, poll=False):
+    """
+    Async version of fetch_comments_for_child for the ASGI views. The Graph
+    call is awaited (httpx when installed, otherwise requests on a worker
+    thread) and the comments go through ingest_account_comments() on
+    Django's sync thread, so the event loop never blocks. Shares the same
+    per-account single-flight lock.
+    """
+    token = correlation_id.set(correlation_id.get() or new_correlation_id())
+    stage_timings = {}
+    try:
+        with timed(stage_timings, 'total'):
+            result = await _afetch_comments_for_child(child, stage_timings, poll)
+        observe_timings('ingest', stage_timings)
+    finally:
+        correlation_id.reset(token)
+    merge_timings(timings, stage_timings)
+    return result
+
+
+async def _afetch_comments_for_child(child, timings, poll=False):
+    if not child.instagram_user_id or not child.access_token:
+        return {"error": "Missing Instagram ID or access token"}
+    async def fetch():
+        return await sync_to_async(record_sync)(child, await _afetch_account_comments(child, timings))
+
+    result, source = await acoalesced(child.instagram_user_id, fetch, poll)
+    return _child_result(result, child, source)
+
+
+async def _afetch_account_comments(child, timings):
+    url = f"{settings.GRAPH_API_URL}/v23.0/{child.instagram_user_id}/media"
+    params = {
+        "fields": "id,caption,comments{id,text,username,timestamp}",
+        "access_token": child.access_token
+    }
+
+    try:
+        with timed(timings, 'graph_api'):
+            resp = await _graph_get(url, params)
+        if resp.status_code != 200:
+            return {"error": f"API Error {resp.status_code}: {resp.text}"}
+        ingested_at = time.monotonic()
+
+        data = resp.json()
+
+        if "data" not in data:
+            return {"error": "No media found"}
+
+        # Screening and the writes are the sync pipeline, on Django's sync thread
+        children = await sync_to_async(account_children)(child)
+        return await sync_to_async(ingest_account_comments)(children, _media_comments(data), ingested_at, timings)
+
+    except _TIMEOUT_ERRORS:
+        return {"error": "Request timeout - Instagram API might be slow"}
+    except _REQUEST_ERRORS as e:
+        return {"error": f"Request failed: {str(e)}"}
+    except Exception as e:
+        return {"error": f"Unexpected error: {str(e)}"}
+
+
+_TIMEOUT_ERRORS = (requests.exceptions.Timeout,) + ((httpx.TimeoutException,) if httpx else ())
+_REQUEST_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
+
+async def _graph_get(url, params):
+    if httpx is None:
+        return await sync_to_async(requests.get, thread_sensitive=False)(url, params=params, timeout=30)
+    return await graph_client().get(url, params=params)
+
+
+def graph_client():
+    """
+    The event loop's shared httpx.AsyncClient. Building a client per call
+    costs an SSL context load on the loop and gives up connection reuse.
+    """
+    loop = asyncio.get_running_loop()
+    client = _graph_clients.get(loop)
+    if client is None:
+        client = _graph_clients[loop] = httpx.AsyncClient(timeout=30)
+    return client
+
+
+def _media_comments(data):
+    """(media_id, comment) pairs from a media response with nested comments."""
+    return [
+        (media["id"], comment)
+        for media in data["data"]
+        if "comments" in media
+        for comment in media["comments"]["data"]
+    ]
+
+
+def record_sync(child, result):
+    """
+    Store a fetch's outcome on every child watching the account; returns
+    `result`. Cached responses are only invalidated for children that got
+    new comments or whose sync status changed, not on every poll.
+    """
+    error = result.get("error", "")
+    stored = [child_id for child_id, count in result.get("new_by_child", {}).items() if count]
+    changed = Q(pk__in=stored) | Q(last_synced_at__isnull=True) | ~Q(last_sync_error=error)
+    Child.objects.filter(instagram_user_id=child.instagram_user_id).update(
+        last_synced_at=timezone.now(),
+        last_sync_error=error,
+        data_version=Case(
+            When(changed, then=F('data_version') + 1), default=F('data_version'), output_field=PositiveIntegerField(),
+        ),
+    )
+    return result
+
+
+def account_children(child):
+    """The child plus any other parents' children watching the same account."""
+    others = (
+        Child.objects.filter(instagram_user_id=child.instagram_user_id)
+        .exclude(id=child.id)
+        .select_related('parent')
+    )
+    return [child] + list(others)
+
+
+def _pending_by_child(children, media_comments):
+    cutoffs = retention.retention_cutoffs()
+    return {c.id: _new_comments(c, media_comments, retention.child_cutoff(c, cutoffs)) for c in children}
+
+
+def _screening_phases(children, pending_by_child, timings=None):
+    """
+    Split each child's new comments into screening phases: comments by
+    known-toxic commenters first, so their alerts go out before the rest
+    are screened, then everything else. Empty phases are skipped.
+    """
+    with timed(timings, 'reputation'):
+        usernames = {comment.get("username") for pending in pending_by_child.values() for _, comment in pending}
+        flagged = reputation.known_toxic(children, usernames)
+    if not flagged:
+        return [pending_by_child] if any(pending_by_child.values()) else []
+    phases = [
+        {child_id: [row for row in pending if (row[1].get("username") in flagged) == first]
+         for child_id, pending in pending_by_child.items()}
+        for first in (True, False)
+    ]
+    return [phase for phase in phases if any(phase.values())]
+
+
+def _add_counts(totals, counts):
+    for key, count in counts.items():
+        totals[key] += count
+
+
+def _texts_to_classify(pending_by_child):
+    """(comment ids, texts) with each new comment once, however many children need it."""
+    texts = {}
+    for pending in pending_by_child.values():
+        for _, comment in pending:
+            texts.setdefault(comment["id"], comment["text"])
+    return list(texts), list(texts.values())
+
+
+def _screen(texts, timings):
+    """
+    (labels, toxicity scores) for new comments. Only the toxicity screen runs
+    here unless the sentiment lane is inline; a None label means "not toxic,
+    sentiment pending".
+    """
+    scores = []
+    if not sentiment_lane.deferred():
+        return classify_comments(texts, timings=timings, scores=scores), scores
+    return score_toxicity(texts, timings=timings, scores=scores), scores
+
+
+def _screen_account(instagram_user_id, texts, timings):
+    """
+    (labels, toxicity scores, raid clusters) for an account's new comments.
+    Near-duplicates are clustered first and only one representative per
+    unscreened cluster is scored; its label is shared by every copy.
+    """
+    if not raids.enabled():
+        labels, scores = _screen(texts, timings)
+        return labels, scores, [None] * len(texts)
+
+    with timed(timings, 'cluster'):
+        clusters = raids.cluster_texts(instagram_user_id, texts)
+        todo = raids.unscreened(clusters)
+    labels, scores = _screen([cluster.text for cluster in todo], timings)
+    for cluster, label, cluster_scores in zip(todo, labels, scores):
+        cluster.label, cluster.scores, cluster.screened = label, cluster_scores, True
+    count_comments('clustered', len(texts) - len(todo))
+    return [c.label for c in clusters], [c.scores for c in clusters], clusters
+
+
+# Storage passes, most urgent first: threats, other toxic comments, the rest
+_THREAT, _TOXIC, _OTHER = range(3)
+
+
+def _alert_priority(label, scores):
+    if label != "toxic":
+        return _OTHER
+    return _THREAT if is_threat(scores) else _TOXIC
+
+
+def _store_for_children(children, pending_by_child, screened, ingested_at, timings=None, clusters=None):
+    """
+    Store each child's new comments. `screened` maps comment id to (label,
+    toxicity scores) and `clusters` to its raid cluster, if any. Threats are
+    written and alerted on for every child first, then other toxic
+    comments, then the rest.
+    Returns ({child_id: saved}, alerts sent).
+    """
+    new_by_child = dict.fromkeys((c.id for c in children), 0)
+    alerts_sent = 0
+    for priority in (_THREAT, _TOXIC, _OTHER):
+        for c in children:
+            rows = [
+                (post_id, comment, *screened[comment["id"]])
+                for post_id, comment in pending_by_child[c.id]
+                if _alert_priority(*screened[comment["id"]]) == priority
+            ]
+            saved, alerts = _store_comments(c, rows, ingested_at, timings, clusters=clusters)
+            new_by_child[c.id] += saved
+            alerts_sent += alerts
+    if any(label is None for label, _ in screened.values()):
+        sentiment_lane.notify()
+    return new_by_child, alerts_sent
+
+
+def _account_result(media_comments, pending_by_child, new_by_child, alerts_sent):
+    total = len(media_comments)
+    for pending in pending_by_child.values():
+        count_comments('processed', total)
+        count_comments('duplicate', total - len(pending))
+    return {
+        "success": True,
+        "new_by_child": new_by_child,
+        "total_comments_processed": total,
+        "alerts_sent": alerts_sent,
+    }
+
+
+def _child_result(result, child, source):
+    """One child's view of an account fetch result, got from `source` (see coalesced())."""
+    if "error" in result:
+        return result
+    # A reused result's comments and alerts were counted by the caller that fetched them
+    reused = source == REUSED
+    new_comments = 0 if reused else result["new_by_child"].get(child.id, 0)
+    total = result["total_comments_processed"]
+    return {
+        "success": True,
+        "new_comments": new_comments,
+        "total_comments_processed": total,
+        "alerts_sent": 0 if reused else result["alerts_sent"],
+        "coalesced": source != FETCHED,
+        "message": f"Processed {total} comments, added {new_comments} new ones"
+    }
+
+
+def _new_comments(child, media_comments, cutoff=None):
+    """
+    Drop comments this child already has, with one lookup query, and those
+    posted before its retention `cutoff` (compacted ones included).
+    """
+    ids = [comment["id"] for _, comment in media_comments]
+    existing = set(
+        Comment.objects.filter(child=child, comment_id__in=ids).values_list("comment_id", flat=True)
+    )
+    return [
+        (post_id, comment) for post_id, comment in media_comments
+        if comment["id"] not in existing and not retention.expired_on_arrival(comment, cutoff)
+    ]
+
+
+def _store_comments(child, rows, ingested_at, timings=None, clusters=None):
+    """
+    Save (post_id, comment, label, toxicity scores) rows and alert the
+    parent about toxic ones, once per raid cluster in `clusters` (comment id
+    -> Cluster). A None label is stored as pending for the sentiment lane.
+    Returns (comments saved, alerts sent).
+    """
+    if not rows:
+        return 0, 0
+    alerts_sent = 0
+
+    with timed(timings, 'db_write'), transaction.atomic():
+        # The child may have been deleted since this fetch began
+        if not purge.lock_active(child):
+            return 0, 0
+        new_comments = Comment.objects.bulk_create([
+            Comment(
+                child=child,
+                comment_id=comment["id"],
+                post_id=post_id,
+                text=comment["text"],
+                username=comment["username"],
+                sentiment=label or "neutral",
+                sentiment_pending=label is None,
+                toxicity_scores=scores,
+            )
+            for post_id, comment, label, scores in rows
+        ])
+    for _, _, label, _ in rows:
+        if label is not None:
+            count_comments(label)
+
+    # Send email alert if toxic comment detected; near-duplicates share one
+    groups = {}
+    for new_comment in new_comments:
+        if new_comment.sentiment == "toxic":
+            cluster = (clusters or {}).get(new_comment.comment_id)
+            groups.setdefault(cluster or new_comment.comment_id, []).append(new_comment)
+
+    for key, copies in groups.items():
+        cluster = key if isinstance(key, raids.Cluster) else None
+        if cluster is not None and child.id in cluster.alerted:
+            # This raid was already alerted on in an earlier fetch
+            for _ in copies:
+                count_alert('clustered')
+            continue
+        from .email_service import send_toxic_comment_alert
+        observe_time_to_alert(time.monotonic() - ingested_at)
+        with timed(timings, 'alerts'):
+            if send_toxic_comment_alert(copies[0], child, child.parent, copies=len(copies)):
+                alerts_sent += 1
+                if cluster is not None:
+                    cluster.alerted.add(child.id)
+        for _ in copies[1:]:
+            count_alert('clustered')
+
+    # After the alerts: the comments are stored, so nothing here may hold them up
+    with timed(timings, 'db_write'):
+        reputation.record(child, new_comments)
+    Child.bump_versions([child.id])
+    return len(new_comments), alerts_sent
@@ -1,3 +1,1054 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import runpy
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+import torch
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts import (
+    apps, backfill, checks, coalescing, email_service, export, metrics, model_store, profiling, purge, raids,
+    renderers, reputation, retention, sentiment_lane, serialization, services, utils, webhooks,
+)
+from accounts.authentication import ACTIVE_CLAIM, CachedJWTAuthentication, refresh_token_for, user_cache
+from accounts.models import AccountLock, Child, Comment, CommenterStat, CommentDailyStat, WebhookEvent
+
+TOXIC_SCORES = {'toxic': 0.97, 'threat': 0.01}
+
+
+def fake_screen(texts, timings):
+    """services._screen without the models: 'idiot' is toxic, everything else positive."""
+    labels = ['toxic' if 'idiot' in text.lower() else 'positive' for text in texts]
+    return labels, [TOXIC_SCORES if label == 'toxic' else None for label in labels]
+
+
+def graph_comment(comment_id, text, username='someone', posted=None):
+    comment = {'id': comment_id, 'text': text, 'username': username}
+    if posted is not None:
+        comment['timestamp'] = posted.strftime('%Y-%m-%dT%H:%M:%S+0000')
+    return comment
+
+
+class AccountTestCase(TestCase):
+    """A parent with one child watching Instagram account 'ig1'."""
+
+    def setUp(self):
+        cache.clear()
+        # Raid clusters remember which children were alerted, across tests
+        raids._indexes.clear()
+        self.parent = User.objects.create_user(username='parent', email='parent@example.com', password='pw')
+        self.child = Child.objects.create(
+            parent=self.parent, username='kid', instagram_user_id='ig1', access_token='token',
+        )
+
+    def ingest(self, media_comments):
+        with mock.patch.object(services, '_screen', side_effect=fake_screen):
+            return services.ingest_account_comments([self.child], media_comments, time.monotonic())
+
+
+@override_settings(RAID_CLUSTERING=True, RAID_MIN_LENGTH=20, RAID_SIMILARITY=0.6)
+class RaidClusteringTests(AccountTestCase):
+
+    def test_near_duplicates_share_a_cluster(self):
+        clusters = raids.cluster_texts('ig-raid', [
+            "you are such an idiot, delete your account!!!",
+            "You are such an idiot... delete your account 🤡",
+            "you are suuuuch an idiot delete your account",
+            "what a lovely picture of the beach at sunset",
+        ])
+        self.assertIs(clusters[0], clusters[1])
+        self.assertIs(clusters[0], clusters[2])
+        self.assertIsNot(clusters[0], clusters[3])
+        self.assertEqual(len(raids.unscreened(clusters)), 2)
+
+    def test_short_comments_match_only_exactly(self):
+        clusters = raids.cluster_texts('ig-raid', ["so cute!!", "So cute", "so cool"])
+        self.assertIs(clusters[0], clusters[1])
+        self.assertIsNot(clusters[0], clusters[2])
+
+    def test_later_copies_join_the_screened_cluster(self):
+        first, = raids.cluster_texts('ig-raid', ["you are such an idiot, delete your account"])
+        first.screened = True
+        later, = raids.cluster_texts('ig-raid', ["YOU ARE SUCH AN IDIOT delete your account!!"])
+        self.assertIs(first, later)
+        self.assertEqual(raids.unscreened([later]), [])
+
+    def test_one_alert_per_raid(self):
+        raid = [
+            ('m1', graph_comment(f'c{i}', f"you are such an idiot, delete your account {'!' * i}", f'troll{i}'))
+            for i in range(5)
+        ]
+        with mock.patch.object(services, '_screen', side_effect=fake_screen) as screen:
+            result = services.ingest_account_comments([self.child], raid, time.monotonic())
+        # One representative scored for the whole raid
+        self.assertEqual(screen.call_args[0][0], [raid[0][1]['text']])
+        self.assertEqual(result['new_by_child'][self.child.id], 5)
+        self.assertEqual(result['alerts_sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Comment.objects.filter(child=self.child, sentiment='toxic').count(), 5)
+
+        # Copies arriving in a later fetch are stored but not alerted on again
+        self.ingest([('m1', graph_comment('c9', "you are such an idiot!! delete your account", 'troll9'))])
+        self.assertEqual(len(mail.outbox), 1)
+
+
+def sample(name, **labels):
+    return metrics.prometheus_client.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@skipUnless(metrics.prometheus_client, 'prometheus_client is not installed')
+@override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'], METRICS_ALLOWED_IPS=['127.0.0.1'])
+class MetricsTests(TestCase):
+
+    def test_requests_are_tagged_and_timed(self):
+        labels = {'view': 'metrics', 'method': 'GET', 'status': '200'}
+        before = sample('sentimentguard_request_seconds_count', **labels)
+        with self.assertLogs('accounts.requests') as logs:
+            response = self.client.get('/metrics', headers={'X-Request-ID': 'req-1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Request-ID'], 'req-1')
+        self.assertIn(b'sentimentguard_stage_seconds', response.content)
+        self.assertEqual(sample('sentimentguard_request_seconds_count', **labels), before + 1)
+
+        record = logs.records[0]
+        record.correlation_id = 'req-1'
+        line = json.loads(metrics.JsonFormatter().format(record))
+        self.assertEqual((line['event'], line['view'], line['status']), ('request', 'metrics', 200))
+        self.assertEqual(line['correlation_id'], 'req-1')
+
+    def test_metrics_are_closed_to_other_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.9').status_code, 403)
+
+    def test_stage_timings(self):
+        before = sample('sentimentguard_stage_seconds_count', pipeline='ingest', stage='dedup')
+        with self.assertLogs('accounts.metrics') as logs:
+            metrics.observe_timings('ingest', {'dedup': 0.02})
+        self.assertEqual(sample('sentimentguard_stage_seconds_count', pipeline='ingest', stage='dedup'), before + 1)
+        self.assertEqual(logs.records[0].timings, {'dedup': 0.02})
+
+    @override_settings(ALERT_LATENCY_SLO=1.0)
+    def test_slow_alerts_are_logged(self):
+        with self.assertLogs('accounts.metrics', 'WARNING') as logs:
+            metrics.observe_time_to_alert(2.5)
+        self.assertEqual(logs.records[0].event, 'alert_slo_miss')
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ProfilingTests(AccountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(PROFILING_DIR=self.directory))
+
+    def test_staff_requests_profile_on_request(self):
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertNotIn('X-Query-Count', self.client.get('/admin/'))
+
+        response = self.client.get('/admin/', headers={'X-Profile': '1'})
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertTrue(Path(response['X-Profile-Path']).exists())
+        summary, = self.directory.glob('*.json')
+        self.assertEqual(json.loads(summary.read_text())['status'], 200)
+
+        # Anyone else's header is ignored
+        self.client.force_login(self.parent)
+        self.assertNotIn('X-Query-Count', self.client.get('/admin/', headers={'X-Profile': '1'}))
+
+    def test_repeated_queries_are_flagged(self):
+        with profiling.Profile('n-plus-one') as profile:
+            for child_id in range(profiling.N_PLUS_ONE_THRESHOLD):
+                list(Comment.objects.filter(child_id=child_id))
+        summary = profile.save()
+        self.assertEqual(summary['query_count'], profiling.N_PLUS_ONE_THRESHOLD)
+        self.assertEqual(summary['repeated_queries'][0]['count'], profiling.N_PLUS_ONE_THRESHOLD)
+
+    def test_commands_take_profile(self):
+        stderr = io.StringIO()
+        call_command('label_sentiment', '--profile', stdout=io.StringIO(), stderr=stderr)
+        self.assertIn('Profile saved to', stderr.getvalue())
+        self.assertEqual(len(list(self.directory.glob('*-command-label_sentiment.prof'))), 1)
+
+
+class DatabaseSettingsTests(TestCase):
+
+    def settings_for(self, **environ):
+        with mock.patch.dict('os.environ', environ):
+            return runpy.run_path(str(Path(settings.BASE_DIR) / 'sentiment_project' / 'settings.py'))['DATABASES']
+
+    def test_sqlite_runs_in_wal_mode(self):
+        name = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'wal.sqlite3'
+        database = self.settings_for(DB_NAME=str(name), DB_BUSY_TIMEOUT='7')['default']
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+        wrapper = SQLiteDatabaseWrapper({**connection.settings_dict, **database}, alias='wal-check')
+        try:
+            with wrapper.cursor() as cursor:
+                pragmas = {
+                    pragma: cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+                    for pragma in ('journal_mode', 'synchronous', 'busy_timeout')
+                }
+        finally:
+            wrapper.close()
+        # synchronous=NORMAL is 1
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 7000})
+
+    def test_postgresql_from_the_environment(self):
+        database = self.settings_for(DB_ENGINE='postgresql', DB_NAME='guard', DB_CONN_MAX_AGE='30')['default']
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((database['NAME'], database['CONN_MAX_AGE']), ('guard', 30))
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+
+        pooled = self.settings_for(DB_ENGINE='postgresql', DB_POOL='1', DB_POOL_MAX='4')['default']
+        # psycopg's pool replaces persistent connections
+        self.assertEqual(pooled['CONN_MAX_AGE'], 0)
+        self.assertEqual(pooled['OPTIONS']['pool'], {'min_size': 2, 'max_size': 4})
+
+
+@override_settings(COMMENT_RETENTION_DAYS=30)
+class RetentionTests(AccountTestCase):
+
+    def test_compacted_comments_are_not_ingested_again(self):
+        posted = timezone.now() - timedelta(days=1)
+        comments = [('m1', graph_comment('c1', 'what an idiot', posted=posted)),
+                    ('m1', graph_comment('c2', 'nice pic', posted=posted))]
+        self.assertEqual(self.ingest(comments)['new_by_child'][self.child.id], 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+        later = timezone.now() + timedelta(days=31)
+        self.assertEqual(retention.compact_comments(pause=0, now=later), 2)
+        self.assertFalse(Comment.objects.exists())
+
+        # The next poll a month later still lists both comments
+        with mock.patch.object(retention.timezone, 'now', return_value=later):
+            result = self.ingest(comments)
+        self.assertEqual(result['new_by_child'][self.child.id], 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(sum(CommentDailyStat.objects.values_list('count', flat=True)), 2)
+
+    def test_expired_on_arrival(self):
+        cutoff = timezone.now() - timedelta(days=30)
+        old = graph_comment('c1', 'hi', posted=cutoff - timedelta(days=1))
+        self.assertTrue(retention.expired_on_arrival(old, cutoff))
+        self.assertFalse(retention.expired_on_arrival(old, None))
+        self.assertFalse(retention.expired_on_arrival(graph_comment('c2', 'hi', posted=timezone.now()), cutoff))
+        # Webhook deliveries carry no timestamp
+        self.assertFalse(retention.expired_on_arrival(graph_comment('c3', 'hi'), cutoff))
+        self.assertFalse(retention.expired_on_arrival({**old, 'timestamp': '2024-13-45T00:00:00+0000'}, cutoff))
+
+
+class FakeTokenizer:
+    """Encodes each text as one token: 1 if it says 'idiot', else 0."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts, **options):
+        self.calls.append((texts, options))
+        return {'input_ids': torch.tensor([[1.0 if 'idiot' in text else 0.0] for text in texts])}
+
+
+def fake_toxicity_model(input_ids):
+    toxic = input_ids * 20 - 10
+    return SimpleNamespace(logits=torch.cat([toxic, torch.full((len(input_ids), 5), -10.0)], dim=1))
+
+
+def fake_sentiment_model(input_ids):
+    return SimpleNamespace(logits=torch.tensor([[0.0, 0.0, 1.0]] * len(input_ids)))
+
+
+class ClassifierTests(TestCase):
+
+    def setUp(self):
+        self.toxicity_tokenizer, self.sentiment_tokenizer = FakeTokenizer(), FakeTokenizer()
+        self.enterContext(mock.patch.dict(utils._models, {
+            'toxicity': (self.toxicity_tokenizer, fake_toxicity_model),
+            'sentiment': (self.sentiment_tokenizer, fake_sentiment_model),
+        }))
+        self.enterContext(mock.patch.object(utils, 'CLASSIFIER_BATCH_SIZE', 2))
+
+    def test_each_stage_tokenizes_its_own_texts_once(self):
+        texts = ['hmm ok', 'you idiot', 'fine by me', 'so great', 'idiot again']
+        scores = []
+        labels = utils.classify_comments(texts, max_length=16, scores=scores)
+        self.assertEqual(labels, ['positive', 'toxic', 'positive', 'positive', 'toxic'])
+
+        # The rules labeled 'so great'; the rest go to the toxicity model in batches of two
+        self.assertEqual([texts for texts, _ in self.toxicity_tokenizer.calls],
+                         [['hmm ok', 'you idiot'], ['fine by me', 'idiot again']])
+        # Only what isn't toxic reaches the sentiment model
+        self.assertEqual([texts for texts, _ in self.sentiment_tokenizer.calls], [['hmm ok', 'fine by me']])
+        for _, options in self.toxicity_tokenizer.calls + self.sentiment_tokenizer.calls:
+            self.assertEqual(options, {'return_tensors': 'pt', 'padding': True, 'truncation': True, 'max_length': 16})
+
+        self.assertIsNone(scores[3])
+        self.assertEqual(set(scores[1]), set(utils.TOXICITY_LABELS))
+        self.assertEqual(scores[1]['toxic'], 1.0)
+
+    def test_default_truncation(self):
+        utils.classify_comments(['hmm ok'])
+        self.assertEqual(self.toxicity_tokenizer.calls[0][1]['max_length'], utils.CLASSIFIER_MAX_LENGTH)
+
+
+class ClassifyCommandTests(AccountTestCase):
+
+    def test_reclassifying_invalidates_cached_responses(self):
+        self.ingest([('m1', graph_comment('c1', 'you idiot'))])
+        other = Child.objects.create(parent=self.parent, username='sibling')
+        Comment.objects.create(child=other, comment_id='c2', post_id='m2', username='a', text='hi')
+        versions = dict(Child.objects.values_list('id', 'data_version'))
+
+        def relabel(texts, max_length=None, timings=None, scores=None):
+            scores.extend([None] * len(texts))
+            return ['neutral'] * len(texts)
+
+        with mock.patch('accounts.management.commands.classify_comments.classify_comments', side_effect=relabel):
+            call_command('classify_comments', stdout=mock.MagicMock())
+        bumped = dict(Child.objects.values_list('id', 'data_version'))
+        self.assertGreater(bumped[self.child.id], versions[self.child.id])
+        # Nothing about the sibling's comment changed
+        self.assertEqual(bumped[other.id], versions[other.id])
+        self.assertEqual(CommenterStat.objects.get(child=self.child).toxic_count, 0)
+
+
+def fake_classify(texts, max_length=None, timings=None, scores=None):
+    labels, label_scores = fake_screen(texts, timings)
+    if scores is not None:
+        scores.extend(label_scores)
+    return labels
+
+
+class BackfillTests(AccountTestCase):
+
+    def test_history_keeps_its_posted_time(self):
+        posted = timezone.now().replace(microsecond=0) - timedelta(days=200)
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as dump:
+            for i, timestamp in enumerate([posted.strftime('%Y-%m-%dT%H:%M:%S+0000'), None]):
+                dump.write(json.dumps({'id': f'c{i}', 'post_id': 'm1', 'text': 'hi', 'timestamp': timestamp}) + '\n')
+            dump.flush()
+            with mock.patch.object(backfill, 'classify_comments', side_effect=fake_classify):
+                run = backfill.Backfill(self.child)
+                backfill.backfill_from_ndjson(run, backfill.Checkpoint(None), dump.name)
+
+        self.assertEqual(run.stats['created'], 2)
+        self.assertEqual(Comment.objects.get(comment_id='c0').created_at, posted)
+        self.assertGreater(Comment.objects.get(comment_id='c1').created_at, timezone.now() - timedelta(minutes=1))
+
+    @override_settings(COMMENT_RETENTION_DAYS=30)
+    def test_history_past_retention_is_skipped(self):
+        old = graph_comment('c1', 'hi', posted=timezone.now() - timedelta(days=31))
+        with mock.patch.object(backfill, 'classify_comments', side_effect=fake_classify):
+            run = backfill.Backfill(self.child)
+            run.add('m1', old)
+            run.flush()
+        self.assertEqual(run.stats['created'], 0)
+
+    def test_rows_without_an_id_are_skipped(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as dump:
+            for record in [{'comment_id': 'c1', 'text': 'hi'}, {'text': 'no id'}, {'id': '', 'text': 'blank'}]:
+                dump.write(json.dumps(record) + '\n')
+            dump.flush()
+            with mock.patch.object(backfill, 'classify_comments', side_effect=fake_classify):
+                run = backfill.Backfill(self.child)
+                backfill.backfill_from_ndjson(run, backfill.Checkpoint(None), dump.name)
+
+        self.assertEqual((run.stats['seen'], run.stats['created'], run.stats['skipped']), (1, 1, 2))
+        self.assertEqual(list(Comment.objects.values_list('comment_id', flat=True)), ['c1'])
+
+    def test_comments_a_fetch_stored_meanwhile_are_not_duplicated(self):
+        def fetch_during_classify(texts, scores=None):
+            self.ingest([('m1', graph_comment('c1', 'hi'))])
+            return fake_classify(texts, scores=scores)
+
+        with mock.patch.object(backfill, 'classify_comments', side_effect=fetch_during_classify):
+            run = backfill.Backfill(self.child)
+            run.add('m1', graph_comment('c1', 'hi'))
+            run.add('m1', graph_comment('c2', 'hi'))
+            run.flush()
+
+        self.assertEqual(run.stats['created'], 1)
+        self.assertEqual(Comment.objects.filter(child=self.child).count(), 2)
+
+    @override_settings(FETCH_LOCK_WAIT=0)
+    def test_writes_wait_for_the_account_lock(self):
+        run = backfill.Backfill(self.child)
+        run.add('m1', graph_comment('c1', 'hi'))
+        self.assertTrue(coalescing.try_lock('ig:ig1', 'fetch'))
+        with mock.patch.object(backfill, 'classify_comments', side_effect=fake_classify):
+            with self.assertRaisesMessage(backfill.BackfillError, 'still running'):
+                run.flush()
+        self.assertFalse(Comment.objects.exists())
+
+    @override_settings(PURGE_WORKER='command')
+    def test_deleted_child_is_not_written(self):
+        run = backfill.Backfill(self.child)
+        run.add('m1', graph_comment('c1', 'hi'))
+        purge.soft_delete(self.child)
+        with mock.patch.object(backfill, 'classify_comments', side_effect=fake_classify):
+            with self.assertRaisesMessage(backfill.BackfillError, 'deleted'):
+                run.flush()
+        self.assertFalse(Comment.objects.exists())
+
+
+@override_settings(SENTIMENT_LANE='command')
+class FetchCommentsCommandTests(AccountTestCase):
+
+    def test_cron_fetch_uses_the_ingestion_pipeline(self):
+        from accounts.management.commands import fetch_comments
+
+        other_parent = User.objects.create_user(username='other', email='other@example.com')
+        sibling = Child.objects.create(parent=other_parent, username='kid2', instagram_user_id='ig1', access_token='t')
+        broken = Child.objects.create(parent=self.parent, username='kid3', instagram_user_id='ig2', access_token='t')
+
+        def fetch(command, child, result):
+            if child.instagram_user_id == 'ig2':
+                raise ValueError("Expecting value: line 1 column 1 (char 0)")
+            result['media'].append(('m1', [graph_comment('c1', 'what an idiot', 'troll'), {'text': 'no id'}]))
+
+        with mock.patch.object(fetch_comments.Command, 'fetch_batched', fetch), \
+                mock.patch.object(services, '_screen', side_effect=fake_screen) as screen:
+            call_command('fetch_comments', stdout=mock.MagicMock())
+            # Screened once for both children watching ig1
+            screen.assert_called_once()
+            self.assertEqual(Comment.objects.filter(comment_id='c1').count(), 2)
+            self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['other@example.com', 'parent@example.com'])
+            self.assertEqual(CommenterStat.objects.get(child=sibling, username='troll').toxic_count, 1)
+            # The malformed response failed its own child only
+            self.assertIn('Expecting value', Child.objects.get(pk=broken.pk).last_sync_error)
+            self.assertEqual(Child.objects.get(pk=sibling.pk).last_sync_error, '')
+
+            call_command('fetch_comments', stdout=mock.MagicMock())
+        self.assertEqual(Comment.objects.filter(comment_id='c1').count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class AsyncFetchTests(AccountTestCase):
+
+    async def test_async_fetch_uses_the_ingestion_pipeline(self):
+        comments = [graph_comment('c1', 'what an idiot'), graph_comment('c2', 'hi')]
+        response = SimpleNamespace(
+            status_code=200, text='', json=lambda: {'data': [{'id': 'm1', 'comments': {'data': comments}}]},
+        )
+        ingest = mock.Mock(wraps=services.ingest_account_comments)
+        with mock.patch.object(services, '_graph_get', mock.AsyncMock(return_value=response)), \
+                mock.patch.object(services, 'ingest_account_comments', ingest), \
+                mock.patch.object(services, '_screen', side_effect=fake_screen):
+            result = await services.afetch_comments_for_child(self.child)
+
+        ingest.assert_called_once()
+        self.assertEqual((result['new_comments'], result['alerts_sent']), (2, 1))
+        self.assertEqual(await Comment.objects.filter(child=self.child, sentiment='toxic').acount(), 1)
+        child = await Child.objects.aget(pk=self.child.pk)
+        self.assertIsNotNone(child.last_synced_at)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class LoadTestIngestionTests(AccountTestCase):
+
+    @override_settings(SENTIMENT_LANE='command')
+    def test_command_path_leaves_real_children_alone(self):
+        version = Child.objects.get(pk=self.child.pk).data_version
+        with mock.patch.object(services, '_screen', side_effect=fake_screen):
+            call_command(
+                'load_test_ingestion', '--path', 'command', '--accounts', '2', '--media', '2', '--comments', '3',
+                stdout=mock.MagicMock(),
+            )
+        child = Child.objects.get(pk=self.child.pk)
+        self.assertEqual((child.data_version, child.last_synced_at, child.last_sync_error), (version, None, ''))
+        # The load test's own parent and children are gone again
+        self.assertEqual(list(Child.objects.all()), [child])
+
+
+@override_settings(FETCH_MIN_INTERVAL=30)
+class CoalescingTests(AccountTestCase):
+
+    def fetched(self):
+        return {
+            'success': True, 'new_by_child': {self.child.id: 2}, 'total_comments_processed': 5, 'alerts_sent': 1,
+        }
+
+    def test_reused_result_reports_nothing_new(self):
+        with mock.patch.object(services, '_fetch_account_comments', return_value=self.fetched()) as fetch:
+            first = services.fetch_comments_for_child(self.child)
+            second = services.fetch_comments_for_child(self.child)
+        fetch.assert_called_once()
+        self.assertEqual((first['new_comments'], first['alerts_sent'], first['coalesced']), (2, 1, False))
+        self.assertEqual((second['new_comments'], second['alerts_sent'], second['coalesced']), (0, 0, True))
+        self.assertEqual(second['total_comments_processed'], 5)
+
+    def test_waiters_share_the_counts(self):
+        arrived = time.time()
+        coalescing.remember_fetch('ig:ig1', self.fetched())
+        result, source = coalescing.recent_result('ig:ig1', arrived)
+        self.assertEqual(source, coalescing.SHARED)
+        shared = services._child_result(result, self.child, source)
+        self.assertEqual((shared['new_comments'], shared['alerts_sent'], shared['coalesced']), (2, 1, True))
+
+    def test_quiet_syncs_keep_cached_responses(self):
+        def version():
+            return Child.objects.get(pk=self.child.pk).data_version
+
+        start = version()
+        services.record_sync(self.child, {'success': True, 'new_by_child': {self.child.id: 0}})
+        self.assertEqual(version(), start + 1)  # first sync: the status changes from never synced
+        services.record_sync(self.child, {'success': True, 'new_by_child': {self.child.id: 0}})
+        self.assertEqual(version(), start + 1)
+        services.record_sync(self.child, {'error': 'API Error 500'})
+        self.assertEqual(version(), start + 2)
+        services.record_sync(self.child, {'error': 'API Error 500'})
+        self.assertEqual(version(), start + 2)
+        services.record_sync(self.child, {'success': True, 'new_by_child': {self.child.id: 3}})
+        self.assertEqual(version(), start + 3)
+        self.assertIsNotNone(Child.objects.get(pk=self.child.pk).last_synced_at)
+
+    @override_settings(WEBHOOK_RECONCILE_INTERVAL=900)
+    def test_only_the_poll_waits_for_the_reconcile_interval(self):
+        coalescing.remember_webhook('ig:ig1')
+        with mock.patch('accounts.coalescing.time.time', return_value=time.time() - 60):
+            coalescing.remember_fetch('ig:ig1', self.fetched())
+        arrived = time.time()
+        self.assertEqual(coalescing.recent_result('ig:ig1', arrived, poll=True)[1], coalescing.REUSED)
+        self.assertIsNone(coalescing.recent_result('ig:ig1', arrived))
+
+        with mock.patch.object(services, '_fetch_account_comments', return_value=self.fetched()) as fetch:
+            services.fetch_comments_for_child(self.child, poll=True)
+            fetch.assert_not_called()
+            self.assertFalse(services.fetch_comments_for_child(self.child)['coalesced'])
+        fetch.assert_called_once()
+
+    def test_lock_table(self):
+        self.assertTrue(coalescing.try_lock('ig:ig1', 'a'))
+        self.assertFalse(coalescing.try_lock('ig:ig1', 'b'))
+        self.assertTrue(coalescing.try_lock('ig:ig2', 'b'))
+        # Only the holder's token releases it
+        coalescing.release_lock('ig:ig1', 'b')
+        self.assertFalse(coalescing.try_lock('ig:ig1', 'b'))
+        coalescing.release_lock('ig:ig1', 'a')
+        self.assertTrue(coalescing.try_lock('ig:ig1', 'b'))
+
+    def test_expired_lock_is_taken_over(self):
+        self.assertTrue(coalescing.try_lock('ig:ig1', 'dead'))
+        AccountLock.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        with coalescing.account_lock('ig:ig1', wait=0) as acquired:
+            self.assertTrue(acquired)
+        self.assertFalse(AccountLock.objects.exists())
+
+    def test_held_lock_is_renewed(self):
+        self.assertTrue(coalescing.renew_lock('ig:ig1'))  # not held: nothing to renew
+        with coalescing.account_lock('ig:ig1', wait=0) as acquired:
+            self.assertTrue(acquired)
+            AccountLock.objects.update(expires_at=timezone.now() + timedelta(seconds=1))
+            self.assertTrue(coalescing.renew_lock('ig:ig1'))
+            self.assertGreater(AccountLock.objects.get().expires_at, timezone.now() + timedelta(seconds=60))
+
+            # Taken over after all: the new holder's row is left alone
+            AccountLock.objects.update(token='other')
+            with self.assertLogs('accounts.coalescing', 'WARNING'):
+                self.assertFalse(coalescing.renew_lock('ig:ig1'))
+        self.assertEqual(AccountLock.objects.get().token, 'other')
+
+    def test_long_ingestion_keeps_the_lock(self):
+        def slow_screen(texts, timings):
+            # Screening takes until the lock is about to expire
+            AccountLock.objects.update(expires_at=timezone.now() + timedelta(seconds=1))
+            return fake_screen(texts, timings)
+
+        with coalescing.account_lock('ig:ig1', wait=0), mock.patch.object(services, '_screen', side_effect=slow_screen):
+            services.ingest_account_comments([self.child], [('m1', graph_comment('c1', 'hi'))], time.monotonic())
+            self.assertGreater(AccountLock.objects.get().expires_at, timezone.now() + timedelta(seconds=60))
+
+
+class ModelStoreTests(TestCase):
+    commit = 'a' * 40
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MODEL_STORE_DIR=directory))
+
+    def test_commit_hashes_are_used_as_given(self):
+        with override_settings(MODEL_REVISIONS={'sentiment': self.commit}):
+            self.assertEqual(model_store.pinned_revision('sentiment'), self.commit)
+
+    def test_branch_stays_on_the_stored_commit(self):
+        with override_settings(MODEL_REVISIONS={'sentiment': 'main'}):
+            self.assertEqual(model_store.pinned_revision('sentiment'), 'main')
+            model_store.write_manifest({'sentiment': {'requested_revision': 'main', 'revision': self.commit}})
+            self.assertEqual(model_store.pinned_revision('sentiment'), self.commit)
+        # Asking for another branch doesn't reuse main's commit
+        with override_settings(MODEL_REVISIONS={'sentiment': 'v2'}):
+            self.assertEqual(model_store.pinned_revision('sentiment'), 'v2')
+
+    @override_settings(MODEL_STORE_REQUIRED=True)
+    def test_verify_runs_without_the_models(self):
+        from accounts.management.commands import fetch_models
+
+        # Its system checks would import the views, which classify
+        self.assertEqual(fetch_models.Command.requires_system_checks, [])
+        with mock.patch.object(model_store, 'load') as load:
+            with self.assertRaisesMessage(CommandError, 'sentiment is not in'):
+                call_command('fetch_models', '--verify', stdout=mock.MagicMock())
+            # Only a comment the rules can't label needs a model
+            self.assertEqual(utils.classify_comments(['what a great day']), ['positive'])
+        load.assert_not_called()
+
+
+class SerializationTests(AccountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient(HTTP_HOST='localhost')
+        self.api.force_authenticate(self.parent)
+        self.url = f'/api/accounts/children/{self.child.id}/comments/'
+        self.ingest([('m1', graph_comment(f'c{i}', f'comment {i}', posted=timezone.now())) for i in range(3)]
+                    + [('m1', graph_comment('c9', 'you idiot'))])
+
+    def test_rows_carry_the_api_fields(self):
+        comment = Comment.objects.get(comment_id='c9')
+        row, = serialization.comment_rows(Comment.objects.filter(pk=comment.pk))
+        self.assertEqual(row['id'], 'c9')
+        self.assertEqual((row['sentiment'], row['toxicity_scores']), ('toxic', TOXIC_SCORES))
+        self.assertEqual((row['instagram_id'], row['post_id']), ('c9', 'm1'))
+        self.assertEqual(row['created_at'], comment.created_at)
+
+        by_pk, = serialization.comment_rows(Comment.objects.filter(pk=comment.pk), id_field='id')
+        self.assertEqual(by_pk['id'], comment.pk)
+
+    def test_renderer_formats_datetimes_like_isoformat(self):
+        when = timezone.now()
+        rendered = renderers.ORJSONRenderer().render({'when': when, 'labels': ('a', 'b')})
+        self.assertEqual(json.loads(rendered), {'when': when.isoformat(), 'labels': ['a', 'b']})
+        self.assertEqual(renderers.ORJSONRenderer().render(None), b'')
+
+    def test_long_histories_are_streamed(self):
+        listed = self.api.get(self.url)
+        self.assertFalse(listed.streaming)
+
+        cache.clear()
+        with override_settings(COMMENT_STREAM_THRESHOLD=2):
+            streamed = self.api.get(self.url)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(streamed['ETag'], listed['ETag'])
+        self.assertEqual(json.loads(b''.join(streamed.streaming_content)), listed.json())
+
+    def test_stream_batches_are_one_json_array(self):
+        rows = [{'n': i} for i in range(5)]
+        chunks = list(serialization.stream_json_array(rows, batch=2))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(b''.join(chunks)), rows)
+        self.assertEqual(b''.join(serialization.stream_json_array([])), b'[]')
+
+
+class ExportTests(AccountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ingest([('m1', graph_comment('c1', 'you idiot')), ('m1', graph_comment('c2', 'nice pic'))])
+        Comment.objects.filter(comment_id='c2').update(sentiment_pending=True)
+        self.output = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def assert_round_trip(self, rows):
+        self.assertEqual(list(rows[0]), list(export.EXPORT_COLUMNS))
+        by_id = {row['comment_id']: row for row in rows}
+        self.assertEqual((by_id['c1']['sentiment'], by_id['c1']['sentiment_pending']), ('toxic', False))
+        self.assertEqual(dict(by_id['c1']['toxicity_scores']), TOXIC_SCORES)
+        self.assertEqual((by_id['c2']['toxicity_scores'], by_id['c2']['sentiment_pending']), (None, True))
+        self.assertEqual(by_id['c2']['child_username'], 'kid')
+
+    def test_ndjson_round_trip(self):
+        path = self.output / 'comments.ndjson.gz'
+        call_command('export_comments', str(path), parent='parent', stderr=io.StringIO())
+        with gzip.open(path, 'rt') as f:
+            self.assert_round_trip([json.loads(line) for line in f])
+
+    @skipUnless(export.pyarrow, 'pyarrow is not installed')
+    def test_parquet_and_arrow_round_trip(self):
+        path = self.output / 'comments.parquet'
+        call_command('export_comments', str(path), format='parquet', stderr=io.StringIO())
+        self.assert_round_trip(export.pyarrow.parquet.read_table(path).to_pylist())
+
+        stream = b''.join(export.iter_arrow_stream(export.export_queryset(self.parent), chunk_size=1))
+        self.assert_round_trip(export.pyarrow.ipc.open_stream(stream).read_all().to_pylist())
+
+
+class ReputationTests(AccountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient(HTTP_HOST='localhost')
+        self.api.force_authenticate(self.parent)
+
+    def test_stats_follow_ingestion(self):
+        self.ingest([('m1', graph_comment('c1', 'idiot', 'troll')), ('m1', graph_comment('c2', 'idiot!', 'troll')),
+                     ('m1', graph_comment('c3', 'nice', 'fan'))])
+        stats = {stat.username: stat for stat in CommenterStat.objects.filter(child=self.child)}
+        self.assertEqual((stats['troll'].comment_count, stats['troll'].toxic_count), (2, 2))
+        self.assertEqual(reputation.known_toxic([self.child], ['troll', 'fan']), {'troll'})
+
+    def test_concurrent_stat_insert_is_retried_after_alerting(self):
+        add = reputation._add_to_stats
+        calls = []
+
+        def race(child, seen):
+            calls.append(len(mail.outbox))
+            if len(calls) == 1:
+                raise IntegrityError("UNIQUE constraint failed")
+            add(child, seen)
+
+        with mock.patch.object(reputation, '_add_to_stats', side_effect=race):
+            self.ingest([('m1', graph_comment('c1', 'you idiot', 'troll'))])
+        # The alert went out before the stats were touched
+        self.assertEqual(calls, [1, 1])
+        self.assertEqual(CommenterStat.objects.get(child=self.child, username='troll').toxic_count, 1)
+
+    def test_commenters_limit(self):
+        self.ingest([('m1', graph_comment(f'c{i}', 'idiot', f'troll{i}')) for i in range(3)])
+        url = f'/api/accounts/children/{self.child.id}/commenters/'
+        self.assertEqual(len(self.api.get(url, {'limit': 2}).json()), 2)
+        response = self.api.get(url, {'limit': -1})
+        self.assertEqual((response.status_code, response.json()), (200, []))
+        self.assertEqual(self.api.get(url, {'limit': 'x'}).status_code, 400)
+
+
+@override_settings(THREAT_ALERT_RECIPIENTS=['safety@example.com', 'parent@example.com', 'ops@example.com'])
+class ThreatAlertTests(AccountTestCase):
+
+    def alert(self, scores):
+        comment = Comment.objects.create(
+            child=self.child, comment_id='c1', post_id='m1', username='troll', text='watch out',
+            sentiment='toxic', toxicity_scores=scores,
+        )
+        return email_service.send_toxic_comment_alert(comment, self.child, self.parent)
+
+    def test_threat_recipients_get_their_own_message(self):
+        self.assertTrue(self.alert({'toxic': 0.95, 'threat': 0.8}))
+        self.assertEqual(
+            sorted(message.recipients() for message in mail.outbox),
+            [['ops@example.com'], ['parent@example.com'], ['safety@example.com']],
+        )
+        for message in mail.outbox:
+            self.assertEqual((message.cc, message.bcc), ([], []))
+            self.assertTrue(message.subject.startswith('🚨 Threat Alert'))
+            self.assertIn('threat (80%)', message.alternatives[0][0])
+
+    def test_other_toxic_comments_only_alert_the_parent(self):
+        self.assertTrue(self.alert(TOXIC_SCORES))
+        message, = mail.outbox
+        self.assertEqual(message.recipients(), ['parent@example.com'])
+        self.assertTrue(message.subject.startswith('🚨 Toxic Comment Alert'))
+
+
+class SearchTests(AccountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient(HTTP_HOST='localhost')
+        self.api.force_authenticate(self.parent)
+        self.url = f'/api/accounts/children/{self.child.id}/comments/search/'
+        self.ingest([('m1', graph_comment(f'c{i}', f'ugly shoes number {i}')) for i in range(3)]
+                    + [('m1', graph_comment('c9', 'lovely day'))])
+
+    def test_search_pages_through_matches(self):
+        first = self.api.get(self.url, {'q': 'ugl', 'page_size': 2}).json()
+        self.assertEqual((len(first['results']), first['has_next']), (2, True))
+        second = self.api.get(self.url, {'q': 'ugl', 'page_size': 2, 'page': 2}).json()
+        self.assertEqual((len(second['results']), second['has_next']), (1, False))
+
+    @override_settings(SEARCH_MAX_OFFSET=100)
+    def test_deep_pages_are_refused(self):
+        self.assertEqual(self.api.get(self.url, {'q': 'ugly', 'page': 6, 'page_size': 20}).status_code, 200)
+        self.assertEqual(self.api.get(self.url, {'q': 'ugly', 'page': 7, 'page_size': 20}).status_code, 400)
+        response = self.api.get(self.url, {'q': 'ugly', 'page': '999999999999999999999'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sync_triggers_exist_after_migrate(self):
+        self.assertEqual(checks.check_search_triggers(databases=['default']), [])
+
+        # What a table rebuild on SQLite does (rolled back with the test)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {checks.FTS_TABLE}_au")
+        warning, = checks.check_search_triggers(databases=['default'])
+        self.assertEqual(warning.id, 'accounts.W001')
+        self.assertIn('accounts_comment_fts_au', warning.msg)
+
+
+@override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'])
+class AdminQueryCountTests(AccountTestCase):
+    """Each admin page runs a fixed number of queries, however big the tables (see bench_admin)."""
+
+    def setUp(self):
+        super().setUp()
+        admin_user = User.objects.create_superuser(username='admin', password=None)
+        self.client.force_login(admin_user)
+        Comment.objects.bulk_create([
+            Comment(child=self.child, comment_id=f'c{i}', post_id='m1', username=f'user{i % 40}',
+                    text=f'ugly comment {i}', sentiment=('toxic', 'neutral', 'positive')[i % 3])
+            for i in range(300)
+        ])
+        reputation.rebuild()
+        WebhookEvent.objects.bulk_create([
+            WebhookEvent(instagram_user_id='ig1', comment_id=f'c{i}', payload={}) for i in range(60)
+        ])
+
+    def test_changelists(self):
+        comments = reverse('admin:accounts_comment_changelist')
+        week_ago = urlencode({'created_at__gte': (timezone.now() - timedelta(days=7)).isoformat()})
+        for url, queries in [
+            (comments, 4),
+            (comments + '?p=5', 4),
+            (comments + '?sentiment__exact=toxic', 4),
+            (comments + f'?{week_ago}', 4),
+            (comments + '?q=ugly', 5),  # plus the full-text match
+            (reverse('admin:accounts_child_changelist'), 4),
+            (reverse('admin:accounts_commenterstat_changelist'), 4),
+            (reverse('admin:accounts_webhookevent_changelist'), 4),
+            (reverse('admin:accounts_comment_change', args=[Comment.objects.first().pk]), 6),
+            (reverse('admin:accounts_child_change', args=[self.child.pk]), 6),
+        ]:
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='parent', password='pw')
+        self.request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f"Bearer {refresh_token_for(self.user).access_token}"
+        )
+        self.authentication = CachedJWTAuthentication()
+
+    def tearDown(self):
+        user_cache.clear()
+
+    def test_cached_user_costs_no_queries(self):
+        self.authentication.authenticate(self.request)
+        with self.assertNumQueries(0):
+            user, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_saving_a_user_revokes_at_once(self):
+        self.authentication.authenticate(self.request)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(self.request)
+
+    def test_deactivation_elsewhere_is_honored_after_the_ttl(self):
+        with override_settings(AUTH_USER_CACHE_TTL=0):
+            self.authentication.authenticate(self.request)
+        # Another process deactivates the user; this one has no signal to evict on
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(self.request)
+
+    def test_inactive_claim_is_rejected_without_a_lookup(self):
+        token = refresh_token_for(self.user).access_token
+        token[ACTIVE_CLAIM] = False
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {token}")
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate(request)
+
+    def test_cached_users_are_copies(self):
+        self.authentication.authenticate(self.request)
+        user, _ = self.authentication.authenticate(self.request)
+        user.first_name = 'changed'
+        again, _ = self.authentication.authenticate(self.request)
+        self.assertEqual(again.first_name, '')
+
+
+@override_settings(PURGE_WORKER='command')
+class PurgeTests(AccountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ingest([('m1', graph_comment(f'c{i}', f'nice pic {i}', f'fan{i % 3}')) for i in range(7)])
+        CommentDailyStat.objects.create(child=self.child, date='2024-01-01', sentiment='positive', count=4)
+
+    def test_soft_delete_hides_the_child(self):
+        purge.soft_delete(self.child)
+        self.assertFalse(Child.objects.filter(pk=self.child.pk).exists())
+        deleted = Child.all_objects.get(pk=self.child.pk)
+        self.assertIsNotNone(deleted.deleted_at)
+        self.assertIsNone(deleted.access_token)
+        self.assertEqual(purge.purge_status(deleted)['status'], 'queued')
+
+    def test_purge_removes_rows_in_batches(self):
+        purge.soft_delete(self.child)
+        progress = []
+        deleted = purge.purge_pending(batch_size=3, pause=0, progress=lambda child, n: progress.append(n))
+        self.assertEqual(deleted, 7 + 3 + 1)
+        self.assertEqual(progress, [3, 6, 7, 10, 11])
+        for model in (Comment, CommenterStat, CommentDailyStat):
+            self.assertFalse(model.objects.filter(child_id=self.child.pk).exists())
+
+        status = purge.purge_status(Child.all_objects.get(pk=self.child.pk))
+        self.assertEqual(status['status'], 'purged')
+        self.assertEqual((status['rows_total'], status['rows_purged']), (11, 11))
+        self.assertFalse(purge.pending_children().exists())
+
+    def test_ingest_racing_the_deletion_stores_nothing(self):
+        purge.soft_delete(self.child)
+        # self.child was loaded before the deletion, as by a fetch in flight
+        result = self.ingest([('m1', graph_comment('c8', 'you idiot', 'troll'))])
+        self.assertEqual(result['new_by_child'][self.child.id], 0)
+        self.assertFalse(Comment.objects.filter(comment_id='c8').exists())
+        self.assertFalse(CommenterStat.objects.filter(username='troll').exists())
+
+    def test_purge_finds_rows_stored_during_it(self):
+        purge.soft_delete(self.child)
+
+        def store_late(child, deleted):
+            if deleted == 3:
+                Comment.objects.create(child_id=child.pk, comment_id='late', post_id='m1', username='a', text='hi')
+
+        self.assertEqual(purge.purge_pending(batch_size=3, pause=0, progress=store_late), 12)
+        self.assertFalse(Comment.objects.filter(child_id=self.child.pk).exists())
+        self.assertIsNotNone(Child.all_objects.get(pk=self.child.pk).purged_at)
+
+    def test_unfinished_purges_resume_at_startup(self):
+        with override_settings(PURGE_WORKER='thread'), mock.patch.object(purge.worker, 'wake') as wake, \
+                mock.patch.object(webhooks.worker, 'wake'), mock.patch.object(sentiment_lane.lane, 'wake'):
+            apps.start_workers()
+        wake.assert_called_once()
+
+    def test_username_can_be_reused(self):
+        purge.soft_delete(self.child)
+        Child.objects.create(parent=self.parent, username='kid')
+        self.assertEqual(Child.all_objects.filter(parent=self.parent, username='kid').count(), 2)
+
+
+@override_settings(
+    WEBHOOK_WORKER='command', INSTAGRAM_WEBHOOK_SECRET='s3cret', INSTAGRAM_WEBHOOK_VERIFY_TOKEN='verify-me',
+    ALLOWED_HOSTS=['testserver'],
+)
+class WebhookTests(AccountTestCase):
+    url = '/api/accounts/webhooks/instagram/'
+
+    def delivery(self, *comments):
+        return json.dumps({'object': 'instagram', 'entry': [{'id': 'ig1', 'time': 0, 'changes': [
+            {'field': 'comments', 'value': {
+                'id': comment_id, 'text': text, 'from': {'id': '1', 'username': 'someone'}, 'media': {'id': 'm1'},
+            }}
+            for comment_id, text in comments
+        ]}]}).encode()
+
+    def post(self, body, signature=None):
+        return self.client.post(
+            self.url, body, content_type='application/json',
+            headers={webhooks.SIGNATURE_HEADER: signature if signature is not None else webhooks.sign(body)},
+        )
+
+    def test_handshake(self):
+        query = {'hub.mode': 'subscribe', 'hub.challenge': '1158201444'}
+        response = self.client.get(self.url, {**query, 'hub.verify_token': 'verify-me'})
+        self.assertEqual((response.status_code, response.content), (200, b'1158201444'))
+        self.assertEqual(self.client.get(self.url, {**query, 'hub.verify_token': 'wrong'}).status_code, 403)
+
+    def test_signature_is_checked(self):
+        body = self.delivery(('c1', 'hello'))
+        self.assertEqual(self.post(body, signature='').status_code, 403)
+        self.assertEqual(self.post(body, signature=webhooks.sign(body, 'other-secret')).status_code, 403)
+        self.assertEqual(self.post(body + b' ', signature=webhooks.sign(body)).status_code, 403)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+        self.assertEqual(self.post(body).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_redelivered_comments_are_ingested_once(self):
+        body = self.delivery(('c1', 'hello'), ('c2', 'what an idiot'))
+        self.post(body)
+        self.post(body)
+        with mock.patch.object(services, '_screen', side_effect=fake_screen):
+            self.assertEqual(webhooks.process_pending(), 4)
+        self.assertEqual(Comment.objects.filter(child=self.child).count(), 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(webhooks.pending_events().exists())
+
+    def test_workers_start_with_the_web_process(self):
+        from importlib import import_module
+
+        with override_settings(WEBHOOK_WORKER='thread', SENTIMENT_LANE='thread'), \
+                mock.patch.object(purge.worker, 'wake'), mock.patch.object(webhooks.worker, 'wake') as wake, \
+                mock.patch.object(sentiment_lane.lane, 'wake') as wake_lane:
+            # Run each entry point's module code once, with the workers patched
+            for name in ('sentiment_project.wsgi', 'sentiment_project.asgi'):
+                sys.modules.pop(name, None)
+                import_module(name)
+        self.assertEqual(wake.call_count, 2)
+        self.assertEqual(wake_lane.call_count, 2)
+
+
+@override_settings(SENTIMENT_LANE='command', SENTIMENT_LANE_BATCH_SIZE=2)
+class SentimentLaneTests(AccountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ingest([('m1', graph_comment(f'c{i}', text)) for i, text in enumerate(['so happy', 'so sad', 'ok'])])
+        Comment.objects.update(sentiment_pending=True)
+
+    def label(self, texts, max_length=None, timings=None):
+        return ['positive' if 'happy' in text else 'negative' if 'sad' in text else 'neutral' for text in texts]
+
+    def test_pending_comments_are_labeled_in_batches(self):
+        version = Child.objects.get(pk=self.child.pk).data_version
+        progress = []
+        with mock.patch.object(utils, 'label_sentiment', side_effect=self.label) as label:
+            self.assertEqual(sentiment_lane.label_pending(progress=progress.append), 3)
+        self.assertEqual(label.call_count, 2)
+        self.assertEqual(progress, [2, 3])
+        self.assertFalse(sentiment_lane.pending_comments().exists())
+        self.assertEqual(
+            dict(Comment.objects.values_list('comment_id', 'sentiment')),
+            {'c0': 'positive', 'c1': 'negative', 'c2': 'neutral'},
+        )
+        self.assertEqual(Child.objects.get(pk=self.child.pk).data_version, version + 2)
+
+    def test_only_thread_mode_wakes_the_lane(self):
+        with mock.patch.object(sentiment_lane.lane, 'wake') as wake:
+            sentiment_lane.notify()
+            wake.assert_not_called()
+            with override_settings(SENTIMENT_LANE='thread', PURGE_WORKER='command', WEBHOOK_WORKER='command'):
+                sentiment_lane.notify()
+                apps.start_workers()
+        self.assertEqual(wake.call_count, 2)
+
+
+class BenchClassifyTests(TestCase):
+
+    def test_model_load_is_timed(self):
+        def slow_load(name):
+            time.sleep(0.05)
+
+        def classify(texts, max_length=None, timings=None, scores=None):
+            return ['neutral'] * len(texts)
+
+        output = self.enterContext(tempfile.NamedTemporaryFile(suffix='.json'))
+        with mock.patch.object(utils, 'load_model', side_effect=slow_load) as load, \
+                mock.patch.object(utils, 'classify_comments', side_effect=classify), \
+                mock.patch.object(utils, 'classify_comment', return_value='neutral'):
+            call_command('bench_classify', '--size', '10', '--output', output.name, stdout=mock.MagicMock())
+        self.assertEqual([c.args[0] for c in load.call_args_list], ['toxicity', 'sentiment'])
+        with open(output.name) as f:
+            self.assertGreaterEqual(json.load(f)['results']['model_load_s'], 0.1)
@@ -6,13 +6,19 @@ from .views import (
     update_comments_classification,
     get_toxic_comments,
     delete_child,
+    get_child_purge_status,
     verify_child_login,
     InstagramOAuthLoginView,
     CustomLoginView,
     get_child_comments,
+    search_child_comments,
+    get_child_commenters,
+    get_child_commenter,
     fetch_child_comments,
-    fetch_all_children_comments
+    fetch_all_children_comments,
+    export_comments,
 )
+from . import async_views, webhooks
 
 urlpatterns = [
     path('signup/', ParentSignupView.as_view(), name='parent-signup'),
@@ -22,9 +28,20 @@ urlpatterns = [
     path('toxic-comments/', get_toxic_comments, name='toxic-comments'),
     path('children/', ChildListCreateView.as_view(), name='child-list-create'),
     path('children/<int:child_id>/delete/', delete_child, name='delete-child'),
+    path('children/<int:child_id>/purge-status/', get_child_purge_status, name='child-purge-status'),
     path('children/verify-login/', verify_child_login, name='verify-child-login'),
     path('comments/update-classification/', update_comments_classification, name='update-comments-classification'),
     path('children/<int:child_id>/comments/', get_child_comments, name='get-child-comments'),
+    path('children/<int:child_id>/comments/search/', search_child_comments, name='search-child-comments'),
+    path('children/<int:child_id>/commenters/', get_child_commenters, name='get-child-commenters'),
+    path('children/<int:child_id>/commenters/<str:username>/', get_child_commenter, name='get-child-commenter'),
     path('children/<int:child_id>/fetch-comments/', fetch_child_comments, name='fetch-child-comments'),
     path('children/fetch-all-comments/', fetch_all_children_comments, name='fetch-all-children-comments'),
+    path('comments/export/', export_comments, name='export-comments'),
+    path('webhooks/instagram/', webhooks.instagram_webhook, name='instagram-webhook'),
+
+    # Async versions for ASGI deployments
+    path('async/children/<int:child_id>/comments/', async_views.get_child_comments, name='async-get-child-comments'),
+    path('async/children/<int:child_id>/fetch-comments/', async_views.fetch_child_comments, name='async-fetch-child-comments'),
+    path('async/children/fetch-all-comments/', async_views.fetch_all_children_comments, name='async-fetch-all-children-comments'),
 ]
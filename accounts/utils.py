@@ -19,22 +19,87 @@
 #     else:
 #         return "neutral"
 
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
 import torch
 
-# Load sentiment model
-sentiment_tokenizer = AutoTokenizer.from_pretrained("cardiffnlp/twitter-roberta-base-sentiment-latest")
-sentiment_model = AutoModelForSequenceClassification.from_pretrained("cardiffnlp/twitter-roberta-base-sentiment-latest")
+from . import model_store
+from .metrics import observe_timings
+
+# Comments are short; 512 tokens of padding is wasted work for almost all of them.
+CLASSIFIER_MAX_LENGTH = getattr(settings, 'CLASSIFIER_MAX_LENGTH', 128)
+CLASSIFIER_BATCH_SIZE = getattr(settings, 'CLASSIFIER_BATCH_SIZE', 32)
 
-# Load toxicity model
-toxicity_tokenizer = AutoTokenizer.from_pretrained("unitary/toxic-bert")
-toxicity_model = AutoModelForSequenceClassification.from_pretrained("unitary/toxic-bert")
+# Sentiment and toxicity models, loaded from the local model store (see
+# model_store.py) on first use rather than at import, so commands that never
+# classify (fetch_models among them) don't need the store filled
+_models = {}
+_models_lock = threading.Lock()
 
 # Map sentiment IDs to labels
 sentiment_labels = ["negative", "neutral", "positive"]
 
-def classify_comment(text):
-    # 0️⃣ Pre-check for obvious cases (fallback for AI model limitations)
+# toxic-bert's output columns, in order; one sigmoid each
+TOXICITY_LABELS = ["toxic", "severe_toxic", "obscene", "threat", "insult", "identity_hate"]
+THREAT_ALERT_THRESHOLD = getattr(settings, 'THREAT_ALERT_THRESHOLD', 0.5)
+
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Add the wall-clock time spent inside the block to timings[stage].
+    Does nothing when timings is None.
+    """
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def load_model(name):
+    """(tokenizer, model) for 'sentiment' or 'toxicity', loaded once per process."""
+    with _models_lock:
+        if name not in _models:
+            _models[name] = model_store.load(name)
+        return _models[name]
+
+
+def merge_timings(target, source):
+    """Add the stage times in `source` to `target` (if target is not None)."""
+    if target is None:
+        return
+    for stage, seconds in source.items():
+        target[stage] = target.get(stage, 0.0) + seconds
+
+
+def tokenize(tokenizer, texts, max_length=None, timings=None):
+    """
+    Encode a batch for one model, padded to its longest text and truncated
+    to `max_length` tokens (CLASSIFIER_MAX_LENGTH by default). Each model
+    has its own vocabulary, so every stage tokenizes for itself.
+    """
+    with timed(timings, 'tokenize'):
+        return tokenizer(
+            list(texts),
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=max_length or CLASSIFIER_MAX_LENGTH,
+        )
+
+
+def rule_based_label(text):
+    """
+    Pre-check for obvious cases (fallback for AI model limitations).
+    Returns a label, or None if the models should decide.
+    """
     text_lower = text.lower().strip()
     
     # Handle negations properly
@@ -55,30 +120,102 @@ def classify_comment(text):
             return "positive"  # "not bad" = positive
         elif positive_words_found and not negative_words_found:
             return "negative"  # "not good" = negative
-        elif negative_words_found and positive_words_found:
-            # Mixed case, let AI decide
-            pass
-        else:
-            # Just negation without clear sentiment words, let AI decide
-            pass
+        # Mixed case, or just negation without clear sentiment words: let AI decide
     else:
         # No negation, use simple logic
         if negative_words_found and not positive_words_found:
             return "negative"
         elif positive_words_found and not negative_words_found:
             return "positive"
-    
-    # 1️⃣ Check toxicity first
-    tox_inputs = toxicity_tokenizer(text, return_tensors="pt", truncation=True)
-    tox_outputs = toxicity_model(**tox_inputs)
-    tox_score = torch.sigmoid(tox_outputs.logits)[0][0].item()
+    return None
+
+
+def is_threat(scores):
+    """Whether a comment's toxicity scores call for a threat alert."""
+    return bool(scores) and scores.get("threat", 0.0) >= THREAT_ALERT_THRESHOLD
+
+
+def classify_comments(texts, max_length=None, timings=None, scores=None):
+    """
+    Classify a list of comments in batches.
+    Returns one label per text, in order. If `timings` is a dict, the seconds
+    spent in each stage (rules, tokenize, toxicity, sentiment) are added to it.
+    If `scores` is a list, it is filled with each text's toxicity scores
+    (see score_toxicity()).
+    """
+    if timings is None:
+        # Top-level call: record this batch's stages as classifier metrics
+        timings = {}
+        labels = classify_comments(texts, max_length=max_length, timings=timings, scores=scores)
+        observe_timings('classify', timings)
+        return labels
+
+    texts = list(texts)
+    labels = score_toxicity(texts, max_length=max_length, timings=timings, scores=scores)
+    pending = [i for i, label in enumerate(labels) if label is None]
+    sentiments = label_sentiment([texts[i] for i in pending], max_length=max_length, timings=timings)
+    for i, sentiment in zip(pending, sentiments):
+        labels[i] = sentiment
+    return labels
+
+
+def score_toxicity(texts, max_length=None, timings=None, scores=None):
+    """
+    The high-priority half of classify_comments(): rule-based labels and the
+    toxicity model. Returns one label per text, or None where only the
+    sentiment model can decide (the comment is not toxic).
+
+    If `scores` is a list, it is filled with one {label: probability} dict
+    per text covering all six TOXICITY_LABELS (None where the rules decided
+    and the model never ran). They come from the same forward pass.
+    """
+    texts = list(texts)
+    labels = [None] * len(texts)
+    if scores is not None:
+        scores[:] = [None] * len(texts)
+
+    with timed(timings, 'rules'):
+        pending = []
+        for i, text in enumerate(texts):
+            labels[i] = rule_based_label(text)
+            if labels[i] is None:
+                pending.append(i)
+
+    if pending:
+        toxicity_tokenizer, toxicity_model = load_model('toxicity')
+    for start in range(0, len(pending), CLASSIFIER_BATCH_SIZE):
+        chunk = pending[start:start + CLASSIFIER_BATCH_SIZE]
+        tox_inputs = tokenize(toxicity_tokenizer, [texts[i] for i in chunk], max_length, timings)
+        with timed(timings, 'toxicity'), torch.inference_mode():
+            tox_probs = torch.sigmoid(toxicity_model(**tox_inputs).logits).tolist()
+
+        for row, i in enumerate(chunk):
+            if tox_probs[row][0] > 0.5:  # Threshold for toxic
+                labels[i] = "toxic"
+            if scores is not None:
+                scores[i] = {
+                    name: round(prob, 4) for name, prob in zip(TOXICITY_LABELS, tox_probs[row])
+                }
+
+    return labels
+
 
-    if tox_score > 0.5:  # Threshold for toxic
-        return "toxic"
+def label_sentiment(texts, max_length=None, timings=None):
+    """
+    The low-priority half of classify_comments(): sentiment labels for texts
+    score_toxicity() left undecided.
+    """
+    texts = list(texts)
+    labels = []
+    if texts:
+        sentiment_tokenizer, sentiment_model = load_model('sentiment')
+    for start in range(0, len(texts), CLASSIFIER_BATCH_SIZE):
+        sent_inputs = tokenize(sentiment_tokenizer, texts[start:start + CLASSIFIER_BATCH_SIZE], max_length, timings)
+        with timed(timings, 'sentiment'), torch.inference_mode():
+            sent_label_ids = torch.argmax(sentiment_model(**sent_inputs).logits, dim=1).tolist()
+        labels.extend(sentiment_labels[label_id] for label_id in sent_label_ids)
+    return labels
 
-    # 2️⃣ If not toxic, classify sentiment
-    sent_inputs = sentiment_tokenizer(text, return_tensors="pt", truncation=True)
-    sent_outputs = sentiment_model(**sent_inputs)
-    sent_label_id = torch.argmax(sent_outputs.logits, dim=1).item()
 
-    return sentiment_labels[sent_label_id]
+def classify_comment(text, max_length=None, timings=None, scores=None):
+    return classify_comments([text], max_length=max_length, timings=timings, scores=scores)[0]
@@ -1,7 +1,6 @@
 from rest_framework.views import APIView
 from django.conf import settings
 import requests
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
@@ -15,9 +14,9 @@ class InstagramOAuthLoginView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
-        print("Instagram OAuth endpoint called with code:", request.data.get('code'))
         import logging
         logger = logging.getLogger("instagram_oauth")
+        logger.info("Instagram OAuth endpoint called")
         code = request.data.get('code')
         username = request.data.get('username')  # Instagram username from frontend
         logger.info(f"Received OAuth code: {code}, username: {username}")
@@ -126,7 +125,7 @@ class InstagramOAuthLoginView(APIView):
         logger.info(f"Child {'created' if child_created else 'updated'}: {instagram_username}")
 
         # Generate new JWT tokens for the authenticated user
-        refresh = RefreshToken.for_user(user)
+        refresh = refresh_token_for(user)
         access = str(refresh.access_token)
         logger.info(f"Issued JWT tokens for user {user.username}")
 
@@ -146,14 +145,29 @@ class InstagramOAuthLoginView(APIView):
                 'email': user.email
             }
         })
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework import generics, status
 from django.contrib.auth.models import User
-from .models import Comment, Child, InstagramChild
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import Comment, CommentDailyStat, Child, CommenterStat, InstagramChild
+from . import purge, reputation, search
 from .serializers import ParentSignupSerializer, ChildSerializer
-from .utils import classify_comment
+from .authentication import CachedJWTAuthentication, refresh_token_for
+from .utils import classify_comments
+from .metrics import observe_timings
+from .cache import cached_response
+from .serialization import comment_rows, streaming_comments_response
+from .export import (
+    EXPORT_FORMATS, CONTENT_TYPES, FILE_EXTENSIONS, ExportUnavailable,
+    export_queryset, iter_ndjson_gz, iter_arrow_stream, write_parquet,
+)
+from django.http import FileResponse, StreamingHttpResponse
+from itertools import islice
+import tempfile
+import time
 
 
 class ParentSignupView(generics.CreateAPIView):
@@ -161,13 +175,50 @@ class ParentSignupView(generics.CreateAPIView):
     serializer_class = ParentSignupSerializer
 
 
+def with_overview(children):
+    """
+    Annotate children with their dashboard totals in the same query: comment
+    and toxic counts (including history compacted into CommentDailyStat)
+    and the newest comment's time. Each is an indexed per-child subquery.
+    """
+    def total(model, count, **filters):
+        rows = model.objects.filter(child=OuterRef('pk'), **filters).order_by().values('child')
+        return Coalesce(Subquery(rows.annotate(total=count).values('total')), 0)
+
+    return children.annotate(
+        comment_count=total(Comment, Count('id')) + total(CommentDailyStat, Sum('count')),
+        toxic_count=(
+            total(Comment, Count('id'), sentiment='toxic')
+            + total(CommentDailyStat, Sum('count'), sentiment='toxic')
+        ),
+        last_comment_at=Subquery(
+            Comment.objects.filter(child=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+        ),
+    )
+
+
 class ChildListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = ChildSerializer
 
+    def get_authenticators(self):
+        # The list is polled by the dashboard; creating a child still loads the user
+        if self.request.method in SAFE_METHODS:
+            return [CachedJWTAuthentication()]
+        return super().get_authenticators()
+
     def get_queryset(self):
         return Child.objects.filter(parent=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        versions = self.get_queryset().values_list('id', 'data_version')
+
+        def build(headers):
+            children = with_overview(self.filter_queryset(self.get_queryset())).order_by('id')
+            return self.get_serializer(children, many=True).data
+
+        return cached_response(request, 'children', versions, build)
+
     def perform_create(self, serializer):
         """
         Frontend sends only `username` initially.
@@ -231,27 +282,32 @@ def delete_child(request, child_id):
     """
     Delete a child and only the comments linked to that specific child.
     Other parents with the same child account will keep their comments.
+    The child disappears at once; its comments are purged in the background
+    (progress at children/<id>/purge-status/).
     """
     try:
         child = Child.objects.get(id=child_id, parent=request.user)
-        username = child.username
-        
-        # Count comments linked to this specific child only
-        comments_for_this_child = Comment.objects.filter(child=child).count()
-        
-        # Delete only comments linked to this specific child
-        Comment.objects.filter(child=child).delete()
-        
-        # Delete the child
-        child.delete()
-        
-        return Response({
-            "message": f"Child and {comments_for_this_child} comments for this parent deleted successfully. Other parents with the same child account are unaffected."
-        })
-            
     except Child.DoesNotExist:
         return Response({"error": "Child not found or unauthorized"}, status=status.HTTP_404_NOT_FOUND)
 
+    purge.soft_delete(child)
+    return Response({
+        "message": f"Child {child.username} deleted. Their comments are being removed in the background. Other parents with the same child account are unaffected.",
+        "child_id": child.id,
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_child_purge_status(request, child_id):
+    """Progress of removing a deleted child's comments."""
+    try:
+        child = Child.all_objects.get(id=child_id, parent=request.user, deleted_at__isnull=False)
+    except Child.DoesNotExist:
+        return Response({"error": "Deleted child not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(purge.purge_status(child))
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -259,32 +315,42 @@ def update_comments_classification(request):
     """
     Reclassify all comments using latest sentiment analysis.
     """
-    comments = Comment.objects.all()
+    comments = list(Comment.objects.all())
     updated_count = 0
 
-    for comment in comments:
-        sentiment = classify_comment(comment.text)
-        if comment.sentiment != sentiment:
+    changed_children = set()
+
+    scores = []
+    sentiments = classify_comments([comment.text for comment in comments], scores=scores)
+    for comment, sentiment, comment_scores in zip(comments, sentiments, scores):
+        if comment.sentiment != sentiment or comment.sentiment_pending or comment.toxicity_scores != comment_scores:
             comment.sentiment = sentiment
+            comment.sentiment_pending = False
+            comment.toxicity_scores = comment_scores
             comment.save()
+            changed_children.add(comment.child_id)
             updated_count += 1
+    reputation.rebuild(changed_children)
+    Child.bump_versions(changed_children)
 
     return Response({"message": f"Updated sentiment for {updated_count} comments"})
 
 
 @api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def get_toxic_comments(request):
     """
     Get all comments with sentiment='toxic'.
     """
-    toxic_comments = Comment.objects.filter(sentiment='toxic')
+    toxic_comments = Comment.objects.filter(sentiment='toxic', child__deleted_at__isnull=True)
     data = [{
         "comment_id": c.comment_id,
         "post_id": c.post_id,
         "username": c.username,
         "text": c.text,
         "sentiment": c.sentiment,
+        "toxicity_scores": c.toxicity_scores,
         "created_at": c.created_at
     } for c in toxic_comments]
     return Response(data)
@@ -305,7 +371,7 @@ class CustomLoginView(APIView):
         if not user:
             return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
         
-        refresh = RefreshToken.for_user(user)
+        refresh = refresh_token_for(user)
         access = str(refresh.access_token)
         
         return Response({
@@ -323,6 +389,7 @@ class CustomLoginView(APIView):
 
 # --- Comments API Views ---
 @api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def get_child_comments(request, child_id):
     """
@@ -333,27 +400,18 @@ def get_child_comments(request, child_id):
         child = Child.objects.get(id=child_id, parent=request.user)
         
         # Get comments only for this specific child
-        comments = Comment.objects.filter(
-            child=child
-        ).values(
-            'comment_id', 'text', 'sentiment', 'created_at', 'username', 'post_id'
-        ).order_by('-created_at')
-        
-        # Serialize comments data
-        comments_data = []
-        for comment in comments:
-            comments_data.append({
-                'id': comment['comment_id'],  # Use comment_id as unique identifier
-                'text': comment['text'],
-                'sentiment': comment['sentiment'],
-                'confidence': 0.85,  # Placeholder - you can add confidence field to model later
-                'created_at': comment['created_at'].isoformat(),
-                'instagram_id': comment['comment_id'],
-                'username': comment['username'],
-                'post_id': comment['post_id']
-            })
+        comments = Comment.objects.filter(child=child).order_by('-created_at')
+
+        def build(headers):
+            # Very long histories are streamed rather than built in memory
+            if comments.count() > getattr(settings, 'COMMENT_STREAM_THRESHOLD', 5000):
+                return streaming_comments_response(comments, headers=headers)
+            serialize_start = time.perf_counter()
+            comments_data = list(comment_rows(comments))
+            observe_timings('comments_api', {'query_serialize': time.perf_counter() - serialize_start})
+            return comments_data
         
-        return Response(comments_data)
+        return cached_response(request, 'child-comments', [(child.id, child.data_version)], build)
     
     except Child.DoesNotExist:
         return Response({'error': 'Child not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -361,6 +419,115 @@ def get_child_comments(request, child_id):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def search_child_comments(request, child_id):
+    """
+    Full-text search over a child's comments (text and commenter), best
+    matches first. ?q= is required; ?page= (from 1) and ?page_size= (max
+    100) paginate, down to SEARCH_MAX_OFFSET results deep.
+    """
+    try:
+        child = Child.objects.get(id=child_id, parent=request.user)
+    except Child.DoesNotExist:
+        return Response({'error': 'Child not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        page_size = min(max(int(request.query_params.get('page_size', getattr(settings, 'SEARCH_PAGE_SIZE', 20))), 1), 100)
+    except ValueError:
+        return Response({'error': 'page and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    offset = (page - 1) * page_size
+    max_offset = getattr(settings, 'SEARCH_MAX_OFFSET', 10000)
+    if offset > max_offset:
+        return Response(
+            {'error': f"Only the first {max_offset + page_size} results can be paged through; refine q instead"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def build(headers):
+        search_start = time.perf_counter()
+        # One extra row tells whether there is a next page without counting every match
+        matches = search.search_ids(query, child_id=child.id, limit=page_size + 1, offset=offset)
+        ranks = dict(matches[:page_size])
+        order = {pk: position for position, pk in enumerate(ranks)}
+        results = sorted(
+            comment_rows(Comment.objects.filter(id__in=ranks), id_field='id'),
+            key=lambda row: order[row['id']],
+        )
+        for row in results:
+            row['rank'] = ranks[row['id']]
+        observe_timings('comment_search', {'search': time.perf_counter() - search_start})
+        return {
+            'query': query,
+            'page': page,
+            'page_size': page_size,
+            'has_next': len(matches) > page_size,
+            'results': results,
+        }
+
+    return cached_response(request, 'child-comment-search', [(child.id, child.data_version)], build)
+
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_child_commenters(request, child_id):
+    """
+    Commenter reputation for a child account: comment and toxic counts,
+    toxic rate and last seen per commenter.
+    ?ordering=toxic (default), recent or comments; ?known_toxic=1 keeps only
+    repeat offenders; ?limit= caps the list (default 100).
+    """
+    try:
+        child = Child.objects.get(id=child_id, parent=request.user)
+    except Child.DoesNotExist:
+        return Response({'error': 'Child not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    orderings = {
+        'toxic': ('-toxic_count', '-last_seen'),
+        'recent': ('-last_seen',),
+        'comments': ('-comment_count', '-last_seen'),
+    }
+    ordering = orderings.get(request.query_params.get('ordering', 'toxic'))
+    if ordering is None:
+        return Response({'error': f"ordering must be one of {', '.join(orderings)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 100)), 0), 1000)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    known_only = request.query_params.get('known_toxic') in ('1', 'true')
+
+    def build(headers):
+        stats = CommenterStat.objects.filter(child=child).order_by(*ordering)
+        if known_only:
+            stats = stats.filter(toxic_count__gte=getattr(settings, 'REPUTATION_MIN_TOXIC', 2))
+        rows = (reputation.commenter_dict(stat) for stat in stats.iterator())
+        if known_only:
+            rows = (row for row in rows if row['known_toxic'])
+        return list(islice(rows, limit))
+
+    return cached_response(request, 'child-commenters', [(child.id, child.data_version)], build)
+
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_child_commenter(request, child_id, username):
+    """One commenter's reputation on a child account."""
+    try:
+        stat = CommenterStat.objects.get(
+            child_id=child_id, child__parent=request.user, child__deleted_at__isnull=True, username=username
+        )
+    except CommenterStat.DoesNotExist:
+        return Response({'error': 'Commenter not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(reputation.commenter_dict(stat))
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def fetch_child_comments(request, child_id):
@@ -381,20 +548,7 @@ def fetch_child_comments(request, child_id):
         
         # Get updated comments for this specific child only
         comments = Comment.objects.filter(child=child).order_by('-created_at')
-        
-        # Serialize comments data
-        comments_data = []
-        for comment in comments:
-            comments_data.append({
-                'id': comment.id,
-                'text': comment.text,
-                'sentiment': comment.sentiment,
-                'confidence': 0.85,  # Placeholder
-                'created_at': comment.created_at.isoformat(),
-                'instagram_id': comment.comment_id,
-                'username': comment.username,
-                'post_id': comment.post_id
-            })
+        comments_data = list(comment_rows(comments, id_field='id'))
         
         return Response({
             'message': f'Comments fetched successfully. {result.get("new_comments", 0)} new comments added.',
@@ -434,7 +588,7 @@ def fetch_all_children_comments(request):
                 # Use the services.py function to fetch comments for this specific child
                 from .services import fetch_comments_for_child
                 
-                result = fetch_comments_for_child(child)
+                result = fetch_comments_for_child(child, poll=True)
                 
                 if "error" not in result:
                     new_comments = result.get("new_comments", 0)
@@ -474,3 +628,40 @@ def fetch_all_children_comments(request):
         
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_comments(request):
+    """
+    Stream the parent's comment history as gzip NDJSON (default), Arrow or
+    Parquet, chosen with file_format. Staff can pass scope=all to export
+    every parent's comments.
+    """
+    fmt = request.query_params.get('file_format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return Response({'error': f'Unsupported format. Use one of: {", ".join(EXPORT_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.query_params.get('scope') == 'all':
+        if not request.user.is_staff:
+            return Response({'error': 'Only admins can export all comments'}, status=status.HTTP_403_FORBIDDEN)
+        comments = export_queryset()
+    else:
+        comments = export_queryset(request.user)
+
+    filename = f"comments.{FILE_EXTENSIONS[fmt]}"
+    try:
+        if fmt == 'parquet':
+            # Parquet's footer is written last, so spool to a temp file first
+            spool = tempfile.TemporaryFile()
+            write_parquet(comments, spool)
+            spool.seek(0)
+            return FileResponse(spool, as_attachment=True, filename=filename, content_type=CONTENT_TYPES[fmt])
+        chunks = iter_ndjson_gz(comments) if fmt == 'ndjson' else iter_arrow_stream(comments)
+    except ExportUnavailable as e:
+        return Response({'error': str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
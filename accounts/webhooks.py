@@ -0,0 +1,263 @@
+"""
+Instagram webhook ingestion.
+
+Instagram calls the receiver with `comments` change notifications as soon as
+a comment is posted, so alerts no longer wait for the next poll. The
+receiver answers the subscription handshake (hub.verify_token) and checks
+every delivery's X-Hub-Signature-256, an HMAC-SHA256 of the raw body with
+the app secret. It then only stores one WebhookEvent per comment and
+returns 200; Instagram retries deliveries that aren't acknowledged quickly.
+
+The worker drains the stored events in batches, grouped per account, and
+runs them through the same dedup / screen / store / alert path as a Graph
+fetch, under the same per-account lock. Redelivered comments are dropped
+by the usual dedup. Accounts whose webhooks are arriving are only polled
+every WEBHOOK_RECONCILE_INTERVAL seconds (see accounts/coalescing.py).
+
+WEBHOOK_WORKER picks who drains the queue:
+  'thread'  - a background thread in the web process, woken by the receiver,
+              at startup and every WEBHOOK_RETRY_INTERVAL seconds
+  'command' - `manage.py process_webhooks --loop`, run by a worker process
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .coalescing import account_lock, remember_webhook
+from .metrics import correlation_id, new_correlation_id, observe_timings
+from .models import Child, WebhookEvent
+from .utils import timed
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Hub-Signature-256'
+
+
+def worker_mode():
+    return getattr(settings, 'WEBHOOK_WORKER', 'thread')
+
+
+def app_secret():
+    """The secret Instagram signs deliveries with (the app secret by default)."""
+    return getattr(settings, 'INSTAGRAM_WEBHOOK_SECRET', None) or getattr(settings, 'INSTAGRAM_CLIENT_SECRET', None)
+
+
+def sign(body, secret=None):
+    """The X-Hub-Signature-256 header value for a raw body."""
+    secret = secret or app_secret()
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def signature_valid(body, header):
+    secret = app_secret()
+    if not secret or not header:
+        return False
+    return hmac.compare_digest(sign(body, secret), header)
+
+
+def parse_events(payload):
+    """Unsaved WebhookEvents for the `comments` changes in a delivery."""
+    if not isinstance(payload, dict) or payload.get('object') != 'instagram':
+        return []
+    events = []
+    for entry in payload.get('entry') or []:
+        for change in entry.get('changes') or []:
+            value = change.get('value') or {}
+            if change.get('field') != 'comments' or not value.get('id') or 'text' not in value:
+                continue
+            events.append(WebhookEvent(
+                instagram_user_id=str(entry.get('id', '')),
+                media_id=str((value.get('media') or {}).get('id', '')),
+                comment_id=str(value['id']),
+                payload=value,
+            ))
+    return events
+
+
+_record_lock = threading.Lock()
+
+
+def record_delivery(payload):
+    """Append a delivery to WEBHOOK_RECORD_DIR, one NDJSON file per day, for replay_webhooks."""
+    directory = getattr(settings, 'WEBHOOK_RECORD_DIR', None)
+    if not directory:
+        return
+    path = Path(directory) / f"instagram-{time.strftime('%Y%m%d')}.ndjson"
+    line = json.dumps(payload, separators=(',', ':')) + '\n'
+    with _record_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(line)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def instagram_webhook(request):
+    """Subscription handshake (GET) and change notifications (POST)."""
+    if request.method == 'GET':
+        expected = getattr(settings, 'INSTAGRAM_WEBHOOK_VERIFY_TOKEN', None)
+        token = request.GET.get('hub.verify_token', '')
+        if request.GET.get('hub.mode') == 'subscribe' and expected and hmac.compare_digest(token, expected):
+            return HttpResponse(request.GET.get('hub.challenge', ''), content_type='text/plain')
+        return HttpResponse('Verification failed', status=403, content_type='text/plain')
+
+    body = request.body
+    if not signature_valid(body, request.headers.get(SIGNATURE_HEADER, '')):
+        logger.warning("Rejected webhook delivery with a bad signature", extra={'event': 'webhook_bad_signature'})
+        return HttpResponse('Invalid signature', status=403, content_type='text/plain')
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return HttpResponse('Invalid JSON', status=400, content_type='text/plain')
+
+    record_delivery(payload)
+    events = parse_events(payload)
+    if events:
+        WebhookEvent.objects.bulk_create(events)
+        notify()
+    return HttpResponse('EVENT_RECEIVED', content_type='text/plain')
+
+
+def pending_events():
+    return WebhookEvent.objects.filter(
+        processed_at__isnull=True, attempts__lt=getattr(settings, 'WEBHOOK_MAX_ATTEMPTS', 5)
+    )
+
+
+def process_pending(batch_size=None, max_batches=None, progress=None):
+    """
+    Ingest waiting events, oldest first. Events that fail are retried on a
+    later call, up to WEBHOOK_MAX_ATTEMPTS times. Returns the number of
+    events handled.
+    """
+    batch_size = batch_size or getattr(settings, 'WEBHOOK_BATCH_SIZE', 500)
+    handled = 0
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        events = list(pending_events().filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not events:
+            break
+        last_id = events[-1].id
+        by_account = {}
+        for event in events:
+            by_account.setdefault(event.instagram_user_id, []).append(event)
+        for instagram_user_id, account_events in by_account.items():
+            _process_account(instagram_user_id, account_events)
+
+        handled += len(events)
+        batches += 1
+        if progress:
+            progress(handled)
+    purge_processed()
+    return handled
+
+
+def _process_account(instagram_user_id, events):
+    from .services import ingest_account_comments
+
+    token = correlation_id.set(correlation_id.get() or new_correlation_id())
+    timings = {'queue_wait': time.time() - events[0].received_at.timestamp()}
+    ids = [event.id for event in events]
+    try:
+        children = list(
+            Child.objects.filter(instagram_user_id=instagram_user_id).select_related('parent').order_by('id')
+        )
+        # Events for accounts nobody watches are just acknowledged
+        if children:
+            key = f"ig:{instagram_user_id}"
+            with timed(timings, 'total'), account_lock(key) as acquired:
+                if not acquired:
+                    raise RuntimeError("Another fetch for this account is still running")
+                # Alert latency counts from when the oldest event was received
+                ingested_at = time.monotonic() - max(0.0, timings['queue_wait'])
+                ingest_account_comments(children, _media_comments(events), ingested_at, timings)
+            remember_webhook(key)
+        WebhookEvent.objects.filter(id__in=ids).update(
+            processed_at=timezone.now(), attempts=F('attempts') + 1, error=''
+        )
+    except Exception as e:
+        logger.exception("Webhook events for %s failed", instagram_user_id)
+        WebhookEvent.objects.filter(id__in=ids).update(attempts=F('attempts') + 1, error=str(e))
+    finally:
+        observe_timings('webhook', timings)
+        correlation_id.reset(token)
+
+
+def _media_comments(events):
+    """(media_id, comment) pairs in the shape the Graph fetch produces, each comment once."""
+    comments = {}
+    for event in events:
+        value = event.payload
+        comments.setdefault(event.comment_id, (event.media_id, {
+            "id": event.comment_id,
+            "text": value.get("text", ""),
+            "username": (value.get("from") or {}).get("username", ""),
+        }))
+    return list(comments.values())
+
+
+def purge_processed():
+    """Delete events processed more than WEBHOOK_EVENT_RETENTION hours ago."""
+    hours = getattr(settings, 'WEBHOOK_EVENT_RETENTION', 24)
+    if hours is None:
+        return 0
+    cutoff = timezone.now() - timedelta(hours=hours)
+    deleted, _ = WebhookEvent.objects.filter(processed_at__lt=cutoff).delete()
+    return deleted
+
+
+class WebhookWorker:
+    """
+    Background thread that drains the event queue. wake() is cheap and safe
+    to call after every delivery; the thread waits WEBHOOK_BATCH_DELAY
+    seconds first so a burst of deliveries is ingested as one batch. It
+    also wakes itself every WEBHOOK_RETRY_INTERVAL seconds, so events that
+    failed are retried without waiting for the next delivery.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='webhook-worker', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait(getattr(settings, 'WEBHOOK_RETRY_INTERVAL', 60))
+            time.sleep(getattr(settings, 'WEBHOOK_BATCH_DELAY', 0.05))
+            self._event.clear()
+            try:
+                process_pending()
+            except Exception:
+                logger.exception("Webhook worker failed")
+            finally:
+                connections.close_all()
+
+
+worker = WebhookWorker()
+
+
+def notify():
+    """Tell the worker events are waiting (only 'thread' mode drains in-process)."""
+    if worker_mode() == 'thread':
+        worker.wake()
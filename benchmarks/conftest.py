@@ -0,0 +1,47 @@
+"""
+pytest-benchmark suite for the classification pipeline:
+
+    pytest benchmarks/ --benchmark-json=bench.json
+    pytest benchmarks/ --benchmark-compare   # against the last saved run
+
+Runs offline against locally cached models (the model store, or the
+Hugging Face cache) and skips when pytest-benchmark or the models are
+missing. `manage.py bench_classify` reports the same corpus as one JSON
+file with percentiles, peak RSS and the rule-path hit rate.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sentiment_project.settings')
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+
+import django  # noqa: E402
+
+django.setup()
+
+CORPUS_SIZE = int(os.environ.get('BENCH_CORPUS_SIZE', 200))
+
+
+@pytest.fixture(scope='session')
+def classifier():
+    """accounts.utils with both models loaded, or skip if they aren't cached."""
+    pytest.importorskip('pytest_benchmark')
+    from django.core.exceptions import ImproperlyConfigured
+    from accounts import utils
+    try:
+        for name in ('toxicity', 'sentiment'):
+            utils.load_model(name)
+    except (OSError, ImproperlyConfigured) as e:
+        pytest.skip(f"Classifier models are not cached locally: {e}")
+    return utils
+
+
+@pytest.fixture(scope='session')
+def corpus():
+    from accounts.benchmarks import synthetic_corpus
+    return synthetic_corpus(CORPUS_SIZE)
@@ -0,0 +1,32 @@
+import pytest
+
+
+def test_classify_comment(benchmark, classifier, corpus):
+    """Per-comment latency through the single-comment entry point."""
+    texts = iter(corpus * 1000)
+    classifier.classify_comments(corpus[:8])
+    label = benchmark(lambda: classifier.classify_comment(next(texts)))
+    assert label in ('positive', 'neutral', 'negative', 'toxic')
+
+
+@pytest.mark.parametrize('max_length', [64, 128])
+def test_classify_comments_batch(benchmark, classifier, corpus, max_length):
+    """Whole-corpus throughput through the batch entry point."""
+    labels = benchmark.pedantic(
+        classifier.classify_comments, args=(corpus,), kwargs={'max_length': max_length}, rounds=3, warmup_rounds=1,
+    )
+    benchmark.extra_info['comments_per_round'] = len(corpus)
+    benchmark.extra_info['rule_path_hit_rate'] = (
+        sum(classifier.rule_based_label(text) is not None for text in corpus) / len(corpus)
+    )
+    assert len(labels) == len(corpus)
+
+
+def test_score_toxicity(benchmark, classifier, corpus):
+    """The ingestion hot path when the sentiment lane is deferred."""
+    labels = benchmark.pedantic(classifier.score_toxicity, args=(corpus,), rounds=3, warmup_rounds=1)
+    assert len(labels) == len(corpus)
+
+
+def test_rule_based_label(benchmark, classifier, corpus):
+    benchmark(lambda: [classifier.rule_based_label(text) for text in corpus])
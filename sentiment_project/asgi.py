@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sentiment_project.settings')
 
 application = get_asgi_application()
+
+# Only a serving process runs the background workers
+from accounts.apps import start_workers  # noqa: E402
+
+start_workers()
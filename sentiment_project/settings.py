@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -35,6 +36,9 @@ INSTAGRAM_CLIENT_ID = "751459870919841"
 INSTAGRAM_CLIENT_SECRET = "89eb37413ba216ea7876f8747c7e2752"
 INSTAGRAM_REDIRECT_URI = "https://brittani-unconcentrated-jeffery.ngrok-free.dev/auth/callback"
 
+# Base URL for Graph API calls (point at the local simulator for load tests)
+GRAPH_API_URL = "https://graph.facebook.com"
+
 
 
 # Application definition
@@ -52,6 +56,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,14 +65,22 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'accounts.middleware.ProfilingMiddleware',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'accounts.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Comment lists longer than this are streamed instead of built in memory
+COMMENT_STREAM_THRESHOLD = 5000
+
 # JWT Settings
 from datetime import timedelta
 
@@ -120,12 +133,52 @@ WSGI_APPLICATION = 'sentiment_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Configured from the environment. DB_ENGINE=postgresql uses PostgreSQL with
+# persistent connections (or psycopg's pool with DB_POOL=1); the default is
+# SQLite in WAL mode so ingestion writes don't block dashboard reads.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE in ('postgresql', 'postgres'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'sentimentguard'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # psycopg 3 connection pool; persistent connections must be off with it
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Seconds a writer waits on a lock before "database is locked"
+                'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', '20')),
+                # Take the write lock up front instead of failing on upgrade
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    # Only takes effect on a new file (compact_comments --full-vacuum converts one)
+                    'PRAGMA auto_vacuum=INCREMENTAL;'
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA busy_timeout={int(os.environ.get('DB_BUSY_TIMEOUT', '20')) * 1000};"
+                ),
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -169,6 +222,145 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Metrics and structured logging
+METRICS_ALLOWED_IPS = ['127.0.0.1']  # Who may scrape /metrics when DEBUG is off
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'correlation_id': {'()': 'accounts.metrics.CorrelationIdFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'accounts.metrics.JsonFormatter'},
+    },
+    'handlers': {
+        'structured': {
+            'class': 'logging.StreamHandler',
+            'filters': ['correlation_id'],
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'accounts': {'handlers': ['structured'], 'level': 'INFO', 'propagate': False},
+        'instagram_oauth': {'handlers': ['structured'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Profiling: profile every request, or only staff requests sending the header
+PROFILING_ENABLED = False
+PROFILING_HEADER = 'X-Profile'
+PROFILING_DIR = BASE_DIR / 'profiles'
+
+# Deleted children's comments are purged in the background ('thread', or
+# 'command' for `manage.py purge_children`, see accounts/purge.py)
+PURGE_WORKER = 'thread'
+PURGE_BATCH_SIZE = 1000  # Rows deleted per transaction
+PURGE_PAUSE = 0.05       # Seconds between batches, so other writers get the database
+
+# Read-only polling endpoints authenticate with CachedJWTAuthentication
+# (see accounts/authentication.py): deactivations and password changes are
+# honored within AUTH_USER_CACHE_TTL seconds
+AUTH_USER_CACHE_TTL = 30
+AUTH_USER_CACHE_SIZE = 10000  # Users cached per process
+
+# Days of raw comment text to keep before compact_comments rolls it into
+# daily stats (None keeps everything). RetentionPolicy rows override this.
+COMMENT_RETENTION_DAYS = None
+
+# Cache for dashboard responses. Entries are keyed by each child's
+# data_version, so they never need explicit invalidation. Set CACHE_DIR to
+# share the cache between worker processes on one host.
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300  # seconds
+
+# Comment fetches are single-flight per Instagram account
+FETCH_MIN_INTERVAL = 30   # Seconds a successful fetch is reused before Graph is called again
+FETCH_LOCK_WAIT = 60      # Seconds a caller waits for an in-flight fetch
+FETCH_LOCK_TIMEOUT = 120  # Seconds a lock row lasts unless its holder renews it, so a dead worker's expires
+GRAPH_BATCH_SIZE = 50     # Sub-requests per Graph batch request (Graph allows at most 50)
+
+# Async (ASGI) endpoints
+ASYNC_FETCH_CONCURRENCY = 8  # Children fetched at once by the async fetch-all endpoint
+
+# Local model store (see accounts/model_store.py). Fill it with
+# `manage.py fetch_models`. MODEL_REVISIONS should be commit hashes so every
+# process loads the same weights; fetch_models prints the commits a branch
+# resolved to, and keeps fetching those until run with --update.
+MODEL_STORE_DIR = Path(os.environ.get('MODEL_STORE_DIR', BASE_DIR / 'model_store'))
+MODEL_REVISIONS = {
+    'sentiment': os.environ.get('MODEL_REVISION_SENTIMENT', 'main'),
+    'toxicity': os.environ.get('MODEL_REVISION_TOXICITY', 'main'),
+}
+MODEL_STORE_REQUIRED = os.environ.get('MODEL_STORE_REQUIRED') == '1'  # Refuse to fall back to the hub
+MODEL_STORE_VERIFY_ON_LOAD = False  # Check sha256 of stored files at startup
+
+# Comment classifier
+CLASSIFIER_MAX_LENGTH = 128  # Tokens kept per comment before truncation
+CLASSIFIER_BATCH_SIZE = 32   # Comments per forward pass
+
+# Ingestion only screens for toxicity; sentiment of the rest is labeled later
+# by the low-priority lane ('thread', 'command' or 'inline', see accounts/sentiment_lane.py)
+SENTIMENT_LANE = 'thread'
+SENTIMENT_LANE_BATCH_SIZE = 256  # Comments labeled per batch
+SENTIMENT_LANE_DELAY = 1.0       # Seconds the lane waits after a wake-up to gather a batch
+ALERT_LATENCY_SLO = 5.0          # Seconds from Graph response to alert hand-off before a warning is logged
+
+# Toxic comments whose toxic-bert 'threat' score reaches this are alerted on
+# first, as threats, and also sent to THREAT_ALERT_RECIPIENTS
+THREAT_ALERT_THRESHOLD = 0.5
+THREAT_ALERT_RECIPIENTS = []
+
+# Raid clustering (see accounts/raids.py): near-duplicate comments are scored
+# once per cluster and alerted on once
+RAID_CLUSTERING = True
+RAID_SIMILARITY = 0.6       # Estimated Jaccard similarity (character 4-grams) for two comments to cluster
+RAID_MIN_LENGTH = 20        # Shorter comments only cluster with exact (normalized) copies
+RAID_INDEX_SIZE = 2000      # Recent clusters remembered per account
+RAID_INDEX_ACCOUNTS = 500   # Accounts indexed in memory, least recently fetched dropped first
+
+# Commenters with at least REPUTATION_MIN_TOXIC toxic comments making up
+# REPUTATION_TOXIC_RATE of theirs are known-toxic: ingestion screens and
+# alerts on their new comments first (see accounts/reputation.py)
+REPUTATION_MIN_TOXIC = 2
+REPUTATION_TOXIC_RATE = 0.5
+
+# Comment full-text search (see accounts/search.py)
+SEARCH_CONFIG = 'simple'  # PostgreSQL text search configuration ('simple' doesn't stem slang)
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_OFFSET = 10000  # Deepest result a page may start at; deep OFFSETs scan every match before it
+
+# Admin changelists count filtered results only up to this many rows
+# (unfiltered tables use the database's own size estimate)
+PAGINATOR_COUNT_LIMIT = 10000
+
+# Instagram `comments` webhooks (see accounts/webhooks.py). Deliveries are
+# signed with INSTAGRAM_WEBHOOK_SECRET, the app secret unless set.
+INSTAGRAM_WEBHOOK_VERIFY_TOKEN = os.environ.get('INSTAGRAM_WEBHOOK_VERIFY_TOKEN')
+INSTAGRAM_WEBHOOK_SECRET = os.environ.get('INSTAGRAM_WEBHOOK_SECRET')
+WEBHOOK_WORKER = 'thread'          # Who ingests received events: 'thread' or 'command' (process_webhooks)
+WEBHOOK_BATCH_SIZE = 500           # Events ingested per batch
+WEBHOOK_BATCH_DELAY = 0.05         # Seconds the worker waits after a wake-up to gather a burst
+WEBHOOK_MAX_ATTEMPTS = 5           # Tries before a failing event is left for inspection in the admin
+WEBHOOK_RETRY_INTERVAL = 60        # Seconds between the 'thread' worker's retries of failed events
+WEBHOOK_EVENT_RETENTION = 24       # Hours processed events are kept
+WEBHOOK_RECONCILE_INTERVAL = 900   # Seconds between polls of accounts whose webhooks are arriving
+WEBHOOK_RECORD_DIR = None          # Append every delivery here as NDJSON, for replay_webhooks
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://localhost:5173",
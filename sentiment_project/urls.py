@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
 from django.shortcuts import redirect
+from accounts.metrics import metrics_view
 
 # Simple home view for root URL
 def home(request):
@@ -10,6 +11,7 @@ def home(request):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/accounts/', include('accounts.urls')),  # All accounts & comment endpoints
+    path('metrics', metrics_view, name='metrics'),    # Prometheus scrape endpoint
     path('', home),                                   # Root URL handler
     # Proxy OAuth callbacks from backend domain to frontend app, preserving query params
     path('auth/callback', lambda request: redirect(
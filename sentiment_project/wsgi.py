@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sentiment_project.settings')
 
 application = get_wsgi_application()
+
+# Only a serving process runs the background workers
+from accounts.apps import start_workers  # noqa: E402
+
+start_workers()